@@ -0,0 +1,1782 @@
+"""
+Android Course File Upload/Download REST API
+create_app(config) builds the Flask app, and the state its routes share
+(token index, quota ledger, caches, rate limiter), from a parsed
+config.toml. Importing this module reads no files, creates no
+directories and installs no handlers; app.py and app_with_config.py
+are the entry points that load config.toml and call create_app().
+
+Under `gunicorn --preload` the app is built once in the master and
+forked workers share it copy-on-write. Everything built here is
+fork-safe: SQLite connections are per process and thread, metrics are
+reset in a new process and the JSON log writer restarts after a fork.
+"""
+
+from flask import Flask, current_app, request, jsonify, g
+from werkzeug.local import LocalProxy
+from werkzeug.utils import secure_filename
+import contextlib
+import fnmatch
+import hashlib
+import ipaddress
+import os
+import secrets
+import signal
+import time
+from datetime import datetime
+import logging
+import tomllib  # Python 3.11+ or use 'tomli' for older versions
+
+from chunked_upload import ChunkedUploads
+from config_watch import ConfigError, ConfigWatcher
+from compressed_store import (
+    ENCODINGS as STORAGE_ENCODINGS, CompressedStore, open_stored, original_size, stored_encoding
+)
+from dedup_store import ObjectStore, hash_file
+from downloads import MODES as DOWNLOAD_MODES, make_etag, serve_decoded, serve_file
+from listing_cache import ListingCache, decode_cursor, encode_cursor, parse_since
+from log_pipeline import setup_json_logging
+from metrics import Metrics
+from name_index import NameIndex, create_exclusive, is_placeholder
+from quota_ledger import QuotaLedger
+from rate_limit import MemoryRateLimiter, SQLiteRateLimiter
+from row_index import (
+    EXTENSIONS as ROW_EXTENSIONS, KIND_CSV, KIND_DOCUMENT, NotReadable, PathNotFound, RowIndex,
+    parse_path, readable, resolve_path
+)
+from streaming_upload import (
+    TEMP_PREFIX, TEMP_SUFFIX, FileTooLarge, QuotaExceeded, UploadError, get_boundary,
+    is_temp_file, receive_file, receive_files
+)
+from student_dirs import StudentDirs
+from thumbnails import HAVE_PILLOW, NotAnImage, ThumbnailCache
+from token_index import TokenIndex
+from version_store import VersionStore
+from zip_stream import COMPRESSION as ARCHIVE_COMPRESSION, stream_zip
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(__name__ + '.access')
+
+# ANDROID_API_CONFIG points at an alternative file (benchmarks, staging)
+CONFIG_ENV = 'ANDROID_API_CONFIG'
+
+# What an upload does when the student already has a file of that name
+DUPLICATE_POLICIES = ('suffix', 'overwrite', 'version', 'reject')
+
+
+def config_file_path():
+    """config.toml next to this module, unless ANDROID_API_CONFIG says otherwise"""
+    return os.environ.get(
+        CONFIG_ENV,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.toml')
+    )
+
+
+def load_config(config_file=None):
+    """Load configuration from config.toml file"""
+    config_file = config_file or config_file_path()
+
+    if not os.path.exists(config_file):
+        raise FileNotFoundError(
+            "config.toml not found. Please run setup_wizard.py first or "
+            "copy config.toml.example to config.toml and customize it."
+        )
+
+    with open(config_file, 'rb') as f:
+        return tomllib.load(f)
+
+
+# Log file the root logger was set up for (logging is per process)
+_logging_configured = None
+
+
+def setup_logging(config):
+    """Send logs to <log_dir>/api.log and the console (once per process)"""
+    global _logging_configured
+    log_file = os.path.join(config['paths']['log_dir'], 'api.log')
+    if _logging_configured is not None:
+        if _logging_configured != log_file:
+            logger.warning("Logging already set up for %s; not switching to %s",
+                           _logging_configured, log_file)
+        return
+    os.makedirs(config['paths']['log_dir'], exist_ok=True)
+
+    log_config = config['logging']
+    if log_config.get('mode', 'text') == 'json':
+        # Queue + background writer, JSON lines in api.log
+        setup_json_logging(
+            log_file,
+            level=getattr(logging, log_config['level']),
+            console_format=log_config['format'],
+            batch_size=log_config.get('batch_size', 100),
+            flush_interval_ms=log_config.get('flush_interval_ms', 500),
+            max_bytes_mb=log_config.get('max_bytes_mb', 50),
+            backup_count=log_config.get('backup_count', 5)
+        )
+    else:
+        logging.basicConfig(
+            level=getattr(logging, log_config['level']),
+            format=log_config['format'],
+            handlers=[
+                logging.FileHandler(log_file),
+                logging.StreamHandler()
+            ]
+        )
+    _logging_configured = log_file
+
+
+class APIState:
+    """
+    Everything the routes share, built from the configuration once per
+    app. Invalid settings raise ConfigError.
+    """
+
+    def __init__(self, config, config_file=None):
+        self.config = config
+        self.upload_dir = config['paths']['upload_dir']
+        self.token_file = os.path.join(config['paths']['token_dir'], 'tokens.json')
+        self.state_dir = config['paths'].get(
+            'state_dir',
+            os.path.join(os.path.dirname(os.path.normpath(self.upload_dir)), 'state')
+        )
+        storage = config['storage']
+
+        # File size, quota, rate limit, allowed extensions and log level are
+        # re-read from config.toml when it changes or on SIGHUP; each request
+        # uses the snapshot in g.limits taken when it started
+        self.config_watcher = ConfigWatcher(
+            config_file, config,
+            check_interval_ms=config['server'].get('config_reload_interval_ms', 2000)
+        )
+
+        # Student directories: flat (<upload_dir>/<netid>) or fanned out under
+        # hash-prefix shards (<upload_dir>/3f/a2/<netid>)
+        try:
+            self.student_dirs = StudentDirs(
+                self.upload_dir,
+                shard_levels=storage.get('shard_levels', 0),
+                shard_width=storage.get('shard_width', 2),
+                cache_seconds=storage.get('student_dir_cache_seconds', 300)
+            )
+        except ValueError as e:
+            raise ConfigError(f"[storage] {e}")
+
+        self.duplicate_policy = storage.get('duplicate_policy', 'suffix')
+        if self.duplicate_policy not in DUPLICATE_POLICIES:
+            raise ConfigError(
+                f"[storage] duplicate_policy must be one of: {', '.join(DUPLICATE_POLICIES)}"
+            )
+
+        # How download bytes are sent: by the WSGI server (sendfile) or handed off
+        # to the front-end web server via X-Sendfile / X-Accel-Redirect
+        self.download_config = config.get('downloads', {})
+        self.download_mode = self.download_config.get('mode', 'sendfile')
+        if self.download_mode not in DOWNLOAD_MODES:
+            raise ConfigError(f"[downloads] mode must be one of: {', '.join(DOWNLOAD_MODES)}")
+
+        # Default compression for /android/archive ("store" or "deflate")
+        self.archive_compression = self.download_config.get('archive_compression', 'deflate')
+        if self.archive_compression not in ARCHIVE_COMPRESSION:
+            raise ConfigError(
+                f"[downloads] archive_compression must be one of: {', '.join(ARCHIVE_COMPRESSION)}"
+            )
+
+        # Optional at-rest compression of compressible uploads
+        compression = config.get('compression', {})
+        self.compressed_store = None
+        if compression.get('enabled', False):
+            try:
+                self.compressed_store = CompressedStore(
+                    encoding=compression.get('encoding', 'gzip'),
+                    level=compression.get('level'),
+                    extensions=compression.get('extensions', 'txt,csv,json,xml').split(','),
+                    min_size=compression.get('min_size_kb', 4) * 1024
+                )
+            except ValueError as e:
+                raise ConfigError(f"[compression] {e} (supported: {', '.join(STORAGE_ENCODINGS)})")
+
+        # Whether quotas count bytes as uploaded ("logical") or as stored on disk
+        # ("physical"); the two only differ for compressed files
+        self.quota_counts = compression.get('quota', 'logical')
+        if self.quota_counts not in ('logical', 'physical'):
+            raise ConfigError("[compression] quota must be 'logical' or 'physical'")
+
+        self.json_logging = config['logging'].get('mode', 'text') == 'json'
+
+        # Token -> NetID index shared by every request in this process
+        self.token_index = TokenIndex(
+            self.token_file,
+            check_interval_ms=config['security'].get('token_reload_interval_ms', 1000)
+        )
+
+        # Request metrics, aggregated across workers through state_dir/metrics.
+        # /android is public behind the proxy, so scrapes need a token unless
+        # only local, unproxied requests are answered
+        self.metrics_config = config.get('metrics', {})
+        self.metrics = None
+        if self.metrics_config.get('enabled', False):
+            if not self.metrics_config.get('token') and not self.metrics_config.get('local_only', False):
+                raise ConfigError("[metrics] enabled needs a token (or local_only = true)")
+            self.metrics = Metrics(os.path.join(self.state_dir, 'metrics'))
+            self.metrics.add_collector(lambda: [
+                ('android_api_token_lookups_total', {'result': 'valid'}, self.token_index.hits),
+                ('android_api_token_lookups_total', {'result': 'invalid'}, self.token_index.misses),
+                ('android_api_token_index_reloads_total', None, self.token_index.reloads),
+                ('android_api_config_reloads_total', None, self.config_watcher.reloads),
+            ])
+
+        # Running per-student usage totals, shared across workers
+        self.quota_ledger = QuotaLedger(
+            os.path.join(self.state_dir, 'quota.db'),
+            scan=self.get_directory_size,
+            reconcile_interval=storage.get('quota_reconcile_interval', 3600)
+        )
+
+        # Optional content-addressed storage: identical files are hardlinks to one
+        # blob under <upload_dir>/.objects
+        self.object_store = None
+        if storage.get('dedup', False):
+            self.object_store = ObjectStore(
+                self.upload_dir, os.path.join(self.state_dir, 'objects.db')
+            )
+
+        # Cached /android/list results, revalidated with one stat() per request
+        compressed_store = self.compressed_store
+        self.listing_cache = ListingCache(
+            skip=is_temp_file,
+            upload_times=self.object_store.upload_times if self.object_store else None,
+            # Compressed files are listed with their original size
+            size_of=(
+                lambda entry, st: original_size(entry.path)
+                if compressed_store.compressible(entry.name) else st.st_size
+            ) if compressed_store else None
+        )
+
+        # Next free name_N.ext per student and file name (no probing on disk)
+        self.name_index = NameIndex(os.path.join(self.state_dir, 'names.db'))
+
+        # Older versions of files replaced under the "version" policy, kept as
+        # compressed deltas in <student_dir>/.versions
+        versions = config.get('versions', {})
+        self.version_store = VersionStore(
+            self.name_index,
+            max_versions=versions.get('max_versions', 20),
+            delta_max_bytes=versions.get('delta_max_mb', 4) * 1024 * 1024,
+            open_file=open_stored
+        )
+
+        # Resumable upload sessions; each one holds its declared size of the
+        # student's quota until it completes, is aborted or expires
+        uploads = config.get('uploads', {})
+        self.chunked_uploads = ChunkedUploads(
+            os.path.join(self.state_dir, 'chunked'),
+            chunk_size=uploads.get('chunk_size_kb', 1024) * 1024,
+            session_ttl=uploads.get('session_ttl_hours', 24) * 3600,
+            max_sessions=uploads.get('max_sessions_per_student', 5),
+            charge=self.quota_ledger.add
+        )
+        self.max_batch_files = uploads.get('max_batch_files', 20)
+
+        # Optional previews of image uploads, cached outside the student
+        # directories so they don't count against the quota
+        thumbnails = config.get('thumbnails', {})
+        self.thumbnails = None
+        if thumbnails.get('enabled', False):
+            if not HAVE_PILLOW:
+                raise ConfigError("[thumbnails] enabled needs the Pillow package")
+            try:
+                self.thumbnails = ThumbnailCache(
+                    thumbnails.get('cache_dir', os.path.join(self.state_dir, 'thumbnails')),
+                    os.path.join(self.state_dir, 'thumbnails.db'),
+                    sizes=thumbnails.get('sizes', [128, 256, 512]),
+                    extensions=thumbnails.get('extensions', 'png,jpg,jpeg,gif').split(','),
+                    quality=thumbnails.get('quality', 80),
+                    max_pixels=thumbnails.get('max_megapixels', 50) * 1000 * 1000,
+                    workers=thumbnails.get('pregenerate_workers', 0),
+                    open_file=open_stored
+                )
+            except ValueError as e:
+                raise ConfigError(f"[thumbnails] {e}")
+            if self.metrics:
+                self.metrics.add_collector(lambda: [
+                    ('android_api_thumbnails_total', {'result': 'cached'}, self.thumbnails.hits),
+                    ('android_api_thumbnails_total', {'result': 'generated'}, self.thumbnails.generated),
+                ])
+
+        # Row ranges, columns and JSON paths of CSV/JSON files, through a
+        # row-offset index built the first time each file version is read
+        self.reads_config = config.get('reads', {})
+        self.row_index = None
+        if self.reads_config.get('enabled', True):
+            self.row_index = RowIndex(
+                os.path.join(self.state_dir, 'row_index'), open_file=open_stored,
+                cache_bytes=int(self.reads_config.get('cache_mb', 32) * 1024 * 1024)
+            )
+            if self.metrics:
+                self.metrics.add_collector(lambda: [
+                    ('android_api_row_index_builds_total', None, self.row_index.builds),
+                ])
+
+        # Upload rate limiting. The sqlite backend is shared by all gunicorn
+        # workers; the memory backend is per process.
+        backend = config['security'].get('rate_limit_backend', 'sqlite')
+        rate_limit = self.config_watcher.limits.rate_limit
+        if backend == 'memory':
+            self.rate_limiter = MemoryRateLimiter(rate_limit)
+        elif backend == 'sqlite':
+            self.rate_limiter = SQLiteRateLimiter(
+                os.path.join(self.state_dir, 'ratelimit.db'), rate_limit
+            )
+        else:
+            raise ConfigError("[security] rate_limit_backend must be 'sqlite' or 'memory'")
+
+        self.config_watcher.on_reload(self.apply_limits)
+
+    def apply_limits(self, limits):
+        """Settings that live outside g.limits follow a config reload"""
+        self.rate_limiter.limit = limits.rate_limit
+        logging.getLogger().setLevel(limits.log_level)
+
+    def install_reload_signal(self):
+        """
+        Make SIGHUP reload config.toml in this process. gunicorn's master
+        restarts its workers on SIGHUP instead, and each worker resets the
+        signal, so gunicorn.conf.py calls this again in every worker.
+        """
+        try:
+            signal.signal(signal.SIGHUP, self.config_watcher.request_reload)
+        except ValueError:
+            pass    # not the main thread
+
+    def get_student_dir(self, netid):
+        """Get student's upload directory path"""
+        return self.student_dirs.get(netid)
+
+    def counts_original_size(self, filename):
+        """True if `filename` may be stored compressed and is charged uncompressed"""
+        return (self.compressed_store is not None and self.quota_counts == 'logical'
+                and self.compressed_store.compressible(filename))
+
+    def quota_size(self, path):
+        """Bytes a stored file counts against the quota"""
+        if self.counts_original_size(os.path.basename(path)):
+            return original_size(path)
+        return os.path.getsize(path)
+
+    def get_directory_size(self, path, _seen=None):
+        """Calculate total size of directory in bytes"""
+        # Hardlinked copies (deduplicated storage) are counted once
+        seen = set() if _seen is None else _seen
+        total = 0
+        try:
+            for entry in os.scandir(path):
+                if entry.is_file(follow_symlinks=False):
+                    if is_temp_file(entry.name):
+                        # Uploads in progress are charged when they complete,
+                        # except for the reservation of a resumable upload
+                        total += self.chunked_uploads.reserved_size(entry.name)
+                    elif entry.inode() not in seen:
+                        seen.add(entry.inode())
+                        if self.counts_original_size(entry.name):
+                            total += original_size(entry.path)
+                        else:
+                            total += entry.stat().st_size
+                elif entry.is_dir(follow_symlinks=False):
+                    total += self.get_directory_size(entry.path, seen)
+        except PermissionError:
+            logger.warning("Permission denied calculating size: %s", path)
+        return total
+
+
+# The APIState of the app handling the current request
+state = LocalProxy(lambda: current_app.extensions['android_api'])
+
+# (rule, view function, options) registered on every app by create_app()
+_ROUTES = []
+
+
+def route(rule, **options):
+    """Like app.route(), for the app create_app() will build"""
+    def register(view):
+        _ROUTES.append((rule, view, options))
+        return view
+    return register
+
+
+def validate_token(token):
+    """
+    Validate authentication token and return associated NetID
+    Returns NetID if valid, None if invalid
+    """
+    if not token:
+        return None
+
+    netid = state.token_index.lookup(token)
+    g.netid = netid
+
+    if netid:
+        logger.debug("Token validated for NetID: %s", netid)
+    else:
+        logger.warning("Invalid token attempted")
+
+    return netid
+
+
+def start_request_timer():
+    g.start_time = time.perf_counter()
+    g.limits = state.config_watcher.current()
+
+
+def record_request(response):
+    """Metrics and (in json logging mode) an access record per request"""
+    method = request.method
+    path = request.path
+    endpoint = request.endpoint
+    netid = g.get('netid')
+    remote_addr = request.remote_addr
+    start_time = g.start_time
+    bytes_in = request.content_length or 0
+    # finished() may run after the app context is gone
+    metrics = state.metrics
+    json_logging = state.json_logging
+
+    def finished():
+        # Runs once the body has been sent, so downloads are fully timed
+        seconds = time.perf_counter() - start_time
+        bytes_out = response.content_length or 0
+        if metrics:
+            metrics.observe_request(
+                endpoint, method, response.status_code, seconds, bytes_in, bytes_out
+            )
+        if json_logging:
+            access_logger.info(
+                "%s %s %s", method, path, response.status_code,
+                extra={
+                    'netid': netid,
+                    'endpoint': endpoint,
+                    'method': method,
+                    'status': response.status_code,
+                    'bytes': bytes_in if method in ('POST', 'PUT') else bytes_out,
+                    'latency_ms': round(seconds * 1000, 2),
+                    'remote_addr': remote_addr,
+                }
+            )
+
+    if response.direct_passthrough:
+        # File downloads hand the open file to the server (sendfile), which
+        # closes it directly; count them now rather than never
+        finished()
+    else:
+        response.call_on_close(finished)
+    return response
+
+
+def expire_upload_sessions():
+    """Abandoned resumable uploads give their reserved quota back"""
+    state.chunked_uploads.maybe_collect_garbage()
+
+
+def allowed_file(filename):
+    """Check if file extension is allowed"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in g.limits.allowed_extensions
+
+
+def check_rate_limit(netid):
+    """Check if user has exceeded rate limit"""
+    if not g.limits.rate_limiting:
+        return True
+    
+    return state.rate_limiter.hit(netid)
+
+
+def is_published(path):
+    """True if `path` is a stored file, not a name reserved for an upload being staged"""
+    try:
+        return not is_placeholder(os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def name_conflict(student_dir, filename):
+    """True if an upload of `filename` must be refused (reject policy)"""
+    return state.duplicate_policy == 'reject' and os.path.exists(os.path.join(student_dir, filename))
+
+
+class StagedUpload:
+    """
+    A received upload on its way into the student's directory: its final
+    name, and what it replaces. stage_upload() -> publish_upload() ->
+    record_upload(); unstage_upload() takes back the first two.
+    """
+
+    def __init__(self, netid, student_dir, filename, temp_path, file_size, sha256):
+        self.netid = netid
+        self.student_dir = student_dir
+        self.filename = filename
+        self.temp_path = temp_path
+        self.file_size = file_size
+        self.sha256 = sha256
+        self.charged = file_size    # bytes the new file counts against the quota
+        self.reserved = False       # an empty placeholder holds the name until we replace it
+        self.replaced = 0           # bytes of an overwritten file that stop counting
+        self.old_sha256 = None
+        self.backup = None          # hardlink to the overwritten file, for unstage_upload()
+        self.version = None         # version file holding the overwritten content
+        self.versioned = 0          # bytes added to the file's version history
+        self.drop_history = False   # history left from the "version" policy, now stale
+        self.published = False
+
+    @property
+    def filepath(self):
+        return os.path.join(self.student_dir, self.filename)
+
+
+def link_backup(path):
+    """Hardlink `path` to a temp name beside it; None if it doesn't exist"""
+    backup = os.path.join(os.path.dirname(path), f"{TEMP_PREFIX}{secrets.token_hex(8)}{TEMP_SUFFIX}")
+    try:
+        os.link(path, backup)
+    except FileNotFoundError:
+        return None
+    return backup
+
+
+def stage_upload(netid, student_dir, filename, temp_path, file_size, sha256=None):
+    """
+    Claim the final name of a finished temp file (duplicate policy) and
+    get it ready to publish: compressed, hashed, the file it replaces
+    saved as a version. Nothing is visible to the student yet.
+    Raises UploadError if the upload is refused.
+    """
+    # Downloads, listings and quotas trust the compression marker at the
+    # start of a stored file, so uploaded bytes must not carry one
+    if stored_encoding(temp_path):
+        raise UploadError(415, 'File content not allowed', details={
+            'reason': 'starts with a reserved compression header'
+        })
+    
+    staged = StagedUpload(netid, student_dir, filename, temp_path, file_size, sha256)
+    if state.duplicate_policy == 'suffix':
+        staged.filename = state.name_index.claim(netid, student_dir, filename)
+        staged.reserved = True
+    elif state.duplicate_policy == 'reject':
+        if not create_exclusive(staged.filepath):
+            raise UploadError(409, 'File already exists', details={'filename': filename})
+        staged.reserved = True
+    # Its deltas lead back from the current content, which this replaces
+    staged.drop_history = (state.duplicate_policy != 'version'
+                           and state.version_store.has_history(student_dir, staged.filename))
+    
+    try:
+        if not staged.reserved:
+            staged.backup = link_backup(staged.filepath)
+        if staged.backup:
+            staged.replaced = state.quota_size(staged.backup)
+            if state.object_store:
+                row = state.object_store.lookup(netid, filename)
+                staged.old_sha256 = row[0] if row else None
+            if state.duplicate_policy == 'version':
+                # The old content is charged as its stored delta from now on
+                staged.version, staged.versioned = state.version_store.add(
+                    netid, student_dir, filename, temp_path
+                )
+        if state.object_store:
+            # Content is identified by its uncompressed bytes
+            staged.sha256 = sha256 or hash_file(temp_path)
+        if state.compressed_store:
+            on_disk = state.compressed_store.compress(temp_path, filename, file_size)
+            if state.quota_counts == 'physical':
+                staged.charged = on_disk
+    except BaseException:
+        unstage_upload(staged)
+        raise
+    return staged
+
+
+def publish_upload(staged):
+    """Move a staged upload into place (one rename)"""
+    if state.object_store:
+        state.object_store.link(staged.temp_path, staged.filepath, staged.sha256)
+    else:
+        os.replace(staged.temp_path, staged.filepath)
+    staged.published = True
+
+
+def unstage_upload(staged):
+    """
+    Undo stage_upload() and publish_upload(): the name holds what it did
+    before (the temp file is left to the caller)
+    """
+    if staged.published:
+        if staged.backup:
+            os.replace(staged.backup, staged.filepath)
+            staged.backup = None
+        else:
+            os.remove(staged.filepath)
+        staged.published = False
+    elif staged.reserved:
+        # Give the name back
+        os.remove(staged.filepath)
+    if staged.backup:
+        os.remove(staged.backup)
+    if staged.version:
+        # The old content is still current, so it isn't a version either
+        state.version_store.discard(staged.version)
+
+
+def record_upload(staged):
+    """Charge a published upload and update the caches; returns the student's usage"""
+    netid, student_dir, filename = staged.netid, staged.student_dir, staged.filename
+    if staged.backup:
+        os.remove(staged.backup)
+        staged.backup = None
+    
+    charged = staged.charged
+    replaced = staged.replaced
+    if state.object_store:
+        sha256, old_sha256 = staged.sha256, staged.old_sha256
+        # A second copy of content the student already has is free
+        if state.object_store.holds(netid, sha256):
+            charged = 0
+        state.object_store.record(netid, filename, sha256, staged.file_size)
+        if old_sha256 is not None:
+            if old_sha256 != sha256:
+                state.object_store.release(old_sha256)
+            # Overwritten content another file still uses stays charged
+            if old_sha256 == sha256 or state.object_store.holds(netid, old_sha256):
+                replaced = 0
+    
+    versioned = staged.versioned
+    if staged.version:
+        versioned -= state.version_store.prune(student_dir, filename)
+    elif staged.drop_history:
+        versioned -= state.version_store.remove(student_dir, filename)
+    usage = state.quota_ledger.add(netid, charged - replaced + versioned)
+    if usage is None:
+        usage = state.quota_ledger.usage(netid, student_dir)
+    state.listing_cache.invalidate(netid)
+    if state.thumbnails and state.thumbnails.handles(filename):
+        # Previews of the content this replaced are stale
+        state.thumbnails.forget(netid, filename)
+        state.thumbnails.schedule(netid, staged.filepath)
+    if state.row_index and readable(filename):
+        state.row_index.forget(netid, filename)
+    return usage
+
+
+def keeps_history(student_dir, filename):
+    """
+    True if writes to `filename` go through its version lock: under the
+    "version" policy, or while a history from a time it was in use is left
+    """
+    return state.duplicate_policy == 'version' or state.version_store.has_history(student_dir, filename)
+
+
+def store_upload(netid, student_dir, filename, temp_path, file_size, sha256=None):
+    """
+    Move a finished temp file into place and charge it to the student.
+    An existing file of the same name is handled by the duplicate policy.
+    Returns (final filename, student's usage in bytes).
+    """
+    if keeps_history(student_dir, filename):
+        # One writer per file so each delta is against what becomes current
+        with state.version_store.locked(student_dir, filename):
+            return _store_upload(netid, student_dir, filename, temp_path, file_size, sha256)
+    return _store_upload(netid, student_dir, filename, temp_path, file_size, sha256)
+
+
+def _store_upload(netid, student_dir, filename, temp_path, file_size, sha256):
+    """store_upload() body; runs under the file's version lock if needed"""
+    staged = stage_upload(netid, student_dir, filename, temp_path, file_size, sha256)
+    try:
+        publish_upload(staged)
+    except BaseException:
+        unstage_upload(staged)
+        raise
+    return staged.filename, record_upload(staged)
+
+
+def store_batch(netid, student_dir, parts):
+    """
+    Store every part of an atomic batch or none: all are staged first,
+    then published, and the published ones are taken back if one fails.
+    Returns the final names and the student's usage; raises UploadError.
+    """
+    names = [secure_filename(part.filename) for part in parts]
+    if state.duplicate_policy in ('overwrite', 'version') and len(set(names)) < len(names):
+        raise UploadError(400, 'The same file name appears more than once')
+    
+    with contextlib.ExitStack() as locks:
+        # Sorted, so two batches never wait for each other's locks
+        for name in sorted(names):
+            if keeps_history(student_dir, name):
+                locks.enter_context(state.version_store.locked(student_dir, name))
+        
+        staged = []
+        try:
+            for part, name in zip(parts, names):
+                try:
+                    staged.append(stage_upload(
+                        netid, student_dir, name, part.temp_path, part.size, part.sha256
+                    ))
+                except UploadError as e:
+                    e.details.setdefault('filename', part.filename)
+                    raise
+            for item in staged:
+                publish_upload(item)
+        except BaseException:
+            for item in reversed(staged):
+                unstage_upload(item)
+            raise
+        
+        for part in parts:
+            part.temp_path = None
+        usage = None
+        for item in staged:
+            usage = record_upload(item)
+    return [item.filename for item in staged], usage
+
+
+@route('/android/upload', methods=['POST'])
+def upload_file():
+    """Handle file upload via HTTP POST"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            logger.warning("Upload attempt with invalid token from %s", request.remote_addr)
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Check rate limit
+        if not check_rate_limit(netid):
+            logger.warning("Rate limit exceeded for %s", netid)
+            return jsonify({'error': f'Rate limit exceeded. Maximum {g.limits.rate_limit} uploads per minute'}), 429
+        
+        # Only multipart bodies can carry a file
+        boundary = get_boundary(request.content_type)
+        if boundary is None:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        # Check quota before reading the body
+        student_dir = state.get_student_dir(netid)
+        current_usage = state.quota_ledger.usage(netid, student_dir)
+        remaining = g.limits.student_quota - current_usage
+        
+        def check_filename(name):
+            # Validate file type before any bytes hit the disk
+            if not allowed_file(name) or not secure_filename(name):
+                raise UploadError(400, 'File type not allowed', details={
+                    'allowed_types': sorted(g.limits.allowed_extensions)
+                })
+            if name_conflict(student_dir, secure_filename(name)):
+                raise UploadError(409, 'File already exists', details={
+                    'filename': secure_filename(name)
+                })
+        
+        # Stream the file part into a temp file, aborting as soon as a
+        # limit is crossed
+        digest = hashlib.sha256() if state.object_store else None
+        try:
+            original_name, temp_path, file_size = receive_file(
+                request.stream, boundary, student_dir, 'file',
+                max_size=g.limits.max_file_size,
+                quota_remaining=remaining,
+                check_filename=check_filename,
+                digest=digest
+            )
+        except FileTooLarge as e:
+            return jsonify({
+                'error': f'File too large. Maximum size: {g.limits.max_file_size / (1024*1024):.0f} MB',
+                'received_mb': e.received / (1024*1024),
+                'max_size_mb': g.limits.max_file_size / (1024*1024)
+            }), 413
+        except QuotaExceeded as e:
+            return jsonify({
+                'error': 'Quota exceeded',
+                'current_usage_mb': current_usage / (1024*1024),
+                'quota_mb': g.limits.student_quota / (1024*1024),
+                'remaining_mb': remaining / (1024*1024),
+                'received_mb': e.received / (1024*1024)
+            }), 507
+        except UploadError as e:
+            return jsonify({'error': e.message, **e.details}), e.status
+        
+        # Move into place
+        try:
+            filename, total_usage = store_upload(
+                netid, student_dir, secure_filename(original_name), temp_path,
+                file_size, sha256=digest.hexdigest() if digest else None
+            )
+        except BaseException as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if isinstance(e, UploadError):
+                # Refused content, or name taken meanwhile (reject policy)
+                return jsonify({'error': e.message, **e.details}), e.status
+            raise
+        
+        logger.info("Upload successful - NetID: %s, File: %s, Size: %s bytes", netid, filename, file_size)
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'filename': filename,
+            'size_bytes': file_size,
+            'current_usage_mb': round(total_usage / (1024*1024), 2),
+            'quota_mb': g.limits.student_quota / (1024*1024)
+        }), 201
+        
+    except Exception as e:
+        logger.error("Upload error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/upload/batch', methods=['POST'])
+def batch_upload():
+    """
+    Upload several files (multipart parts named "files" or "files[N]") in
+    one request. Per-file results by default; with ?atomic=1 either every
+    file is stored or none is.
+    """
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            logger.warning("Batch upload attempt with invalid token from %s", request.remote_addr)
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Check rate limit (the batch counts as one upload)
+        if not check_rate_limit(netid):
+            logger.warning("Rate limit exceeded for %s", netid)
+            return jsonify({'error': f'Rate limit exceeded. Maximum {g.limits.rate_limit} uploads per minute'}), 429
+        
+        boundary = get_boundary(request.content_type)
+        if boundary is None:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        atomic = request.args.get('atomic', '').lower() in ('1', 'true', 'yes')
+        
+        # One quota check for the whole batch; the receiver enforces the
+        # combined size of the accepted files against it
+        student_dir = state.get_student_dir(netid)
+        current_usage = state.quota_ledger.usage(netid, student_dir)
+        remaining = g.limits.student_quota - current_usage
+        
+        def check_filename(name):
+            if not allowed_file(name) or not secure_filename(name):
+                raise UploadError(400, 'File type not allowed', details={
+                    'allowed_types': sorted(g.limits.allowed_extensions)
+                })
+            if name_conflict(student_dir, secure_filename(name)):
+                raise UploadError(409, 'File already exists')
+        
+        try:
+            parts = receive_files(
+                request.stream, boundary, student_dir, 'files',
+                max_size=g.limits.max_file_size,
+                quota_remaining=remaining,
+                max_files=state.max_batch_files,
+                check_filename=check_filename,
+                hash_files=state.object_store is not None,
+                stop_on_error=atomic
+            )
+        except UploadError as e:
+            # Atomic batches fail as a whole on the first rejected file
+            return jsonify({'error': e.message, **e.details}), e.status
+        
+        results = []
+        total_usage = current_usage
+        try:
+            if atomic:
+                try:
+                    stored_as, total_usage = store_batch(netid, student_dir, parts)
+                except UploadError as e:
+                    return jsonify({'error': e.message, **e.details}), e.status
+                results = [
+                    {'filename': part.filename, 'status': 201, 'stored_as': filename,
+                     'size_bytes': part.size}
+                    for part, filename in zip(parts, stored_as)
+                ]
+            else:
+                for part in parts:
+                    if part.error is not None:
+                        if part.error.status == 507 and state.metrics:
+                            # The batch itself answers 207, not 507
+                            state.metrics.inc('android_api_quota_rejections_total')
+                        results.append({
+                            'filename': part.filename,
+                            'status': part.error.status,
+                            'error': part.error.message
+                        })
+                        continue
+                    try:
+                        filename, total_usage = store_upload(
+                            netid, student_dir, secure_filename(part.filename), part.temp_path,
+                            part.size, sha256=part.sha256
+                        )
+                    except UploadError as e:
+                        # Refused content, or name taken meanwhile (reject policy)
+                        results.append({
+                            'filename': part.filename,
+                            'status': e.status,
+                            'error': e.message
+                        })
+                        continue
+                    part.temp_path = None
+                    results.append({
+                        'filename': part.filename,
+                        'status': 201,
+                        'stored_as': filename,
+                        'size_bytes': part.size
+                    })
+        finally:
+            for part in parts:
+                part.discard()
+        
+        uploaded = sum(1 for r in results if r['status'] == 201)
+        logger.info("Batch upload - NetID: %s, Stored: %s, Rejected: %s",
+                    netid, uploaded, len(results) - uploaded)
+        
+        return jsonify({
+            'message': 'Batch processed',
+            'uploaded': uploaded,
+            'failed': len(results) - uploaded,
+            'files': results,
+            'current_usage_mb': round(total_usage / (1024*1024), 2),
+            'quota_mb': g.limits.student_quota / (1024*1024)
+        }), 201 if uploaded == len(results) else 207
+        
+    except Exception as e:
+        logger.error("Batch upload error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/upload/init', methods=['POST'])
+def chunked_upload_init():
+    """Start a resumable upload session"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Check rate limit (the session counts as one upload)
+        if not check_rate_limit(netid):
+            logger.warning("Rate limit exceeded for %s", netid)
+            return jsonify({'error': f'Rate limit exceeded. Maximum {g.limits.rate_limit} uploads per minute'}), 429
+        
+        params = request.get_json(silent=True) or {}
+        original_name = params.get('filename') or ''
+        file_size = params.get('size')
+        
+        if not original_name:
+            return jsonify({'error': 'Empty filename'}), 400
+        
+        if not allowed_file(original_name) or not secure_filename(original_name):
+            return jsonify({
+                'error': 'File type not allowed',
+                'allowed_types': sorted(g.limits.allowed_extensions)
+            }), 400
+        
+        if not isinstance(file_size, int) or file_size < 0:
+            return jsonify({'error': 'size must be a non-negative integer'}), 400
+        
+        if file_size > g.limits.max_file_size:
+            return jsonify({
+                'error': f'File too large. Maximum size: {g.limits.max_file_size / (1024*1024):.0f} MB',
+                'file_size_mb': file_size / (1024*1024),
+                'max_size_mb': g.limits.max_file_size / (1024*1024)
+            }), 413
+        
+        # Check quota
+        student_dir = state.get_student_dir(netid)
+        current_usage = state.quota_ledger.usage(netid, student_dir)
+        
+        if name_conflict(student_dir, secure_filename(original_name)):
+            return jsonify({
+                'error': 'File already exists',
+                'filename': secure_filename(original_name)
+            }), 409
+        
+        if current_usage + file_size > g.limits.student_quota:
+            remaining = g.limits.student_quota - current_usage
+            return jsonify({
+                'error': 'Quota exceeded',
+                'current_usage_mb': current_usage / (1024*1024),
+                'quota_mb': g.limits.student_quota / (1024*1024),
+                'remaining_mb': remaining / (1024*1024),
+                'file_size_mb': file_size / (1024*1024)
+            }), 507
+        
+        # Reserves file_size of the quota until the session ends
+        session = state.chunked_uploads.create(
+            netid, student_dir, secure_filename(original_name), file_size,
+            sha256=params.get('sha256')
+        )
+        
+        return jsonify(state.chunked_uploads.status(session)), 201
+        
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    except Exception as e:
+        logger.error("Chunked upload init error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/upload/<upload_id>/chunk/<int:index>', methods=['PUT'])
+def chunked_upload_chunk(upload_id, index):
+    """Store one chunk of a resumable upload"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        session = state.chunked_uploads.get(upload_id, netid)
+        state.chunked_uploads.write_chunk(
+            session, index, request.stream, request.content_length,
+            request.headers.get('X-Chunk-SHA256')
+        )
+        
+        return jsonify({'upload_id': upload_id, 'chunk': index, 'status': 'stored'}), 200
+        
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    except Exception as e:
+        logger.error("Chunk upload error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/upload/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Report which chunks of a resumable upload have been received"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        session = state.chunked_uploads.get(upload_id, netid)
+        return jsonify(state.chunked_uploads.status(session)), 200
+        
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    except Exception as e:
+        logger.error("Chunked upload status error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/upload/<upload_id>/complete', methods=['POST'])
+def chunked_upload_complete(upload_id):
+    """Assemble a resumable upload once every chunk has arrived"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        session = state.chunked_uploads.get(upload_id, netid)
+        # Claims the session: a concurrent complete of it now gets 409
+        part_path = state.chunked_uploads.finalize(session)
+        file_size = session['size']
+        
+        # The session's reservation is part of the usage; the quota may
+        # have been lowered since init
+        student_dir = state.get_student_dir(netid)
+        try:
+            current_usage = state.quota_ledger.usage(netid, student_dir) - file_size
+        except BaseException:
+            state.chunked_uploads.release(session)
+            raise
+        
+        if current_usage + file_size > g.limits.student_quota:
+            state.chunked_uploads.discard(session)
+            return jsonify({
+                'error': 'Quota exceeded',
+                'current_usage_mb': current_usage / (1024*1024),
+                'quota_mb': g.limits.student_quota / (1024*1024),
+                'remaining_mb': (g.limits.student_quota - current_usage) / (1024*1024),
+                'file_size_mb': file_size / (1024*1024)
+            }), 507
+        
+        try:
+            filename, total_usage = store_upload(
+                netid, student_dir, session['filename'], part_path, file_size,
+                sha256=session['sha256']
+            )
+        except UploadError:
+            # Refused content, or name taken meanwhile (reject policy)
+            state.chunked_uploads.discard(session)
+            raise
+        except BaseException:
+            # Not stored: reopen the session so the client can retry
+            state.chunked_uploads.release(session)
+            raise
+        # Now charged as a stored file: release the reservation
+        state.chunked_uploads.discard(session, remove_part=False)
+        total_usage = state.quota_ledger.usage(netid, student_dir)
+        
+        logger.info("Upload successful - NetID: %s, File: %s, Size: %s bytes (chunked)", netid, filename, file_size)
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'filename': filename,
+            'size_bytes': file_size,
+            'current_usage_mb': round(total_usage / (1024*1024), 2),
+            'quota_mb': g.limits.student_quota / (1024*1024)
+        }), 201
+        
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    except Exception as e:
+        logger.error("Chunked upload complete error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/upload/<upload_id>', methods=['DELETE'])
+def chunked_upload_abort(upload_id):
+    """Abandon a resumable upload and free its space"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        session = state.chunked_uploads.get(upload_id, netid)
+        state.chunked_uploads.discard(session)
+        
+        return jsonify({'message': 'Upload cancelled', 'upload_id': upload_id}), 200
+        
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    except Exception as e:
+        logger.error("Chunked upload abort error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/download/<filename>', methods=['GET'])
+def download_file(filename):
+    """Handle file download via HTTP GET"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Get student directory
+        student_dir = state.get_student_dir(netid)
+        filepath = os.path.join(student_dir, secure_filename(filename))
+        
+        # Check if file exists
+        if not is_published(filepath):
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Prevent directory traversal
+        if not os.path.abspath(filepath).startswith(os.path.abspath(student_dir)):
+            logger.warning("Directory traversal attempt by %s: %s", netid, filename)
+            return jsonify({'error': 'Invalid file path'}), 403
+        
+        logger.info("Download successful - NetID: %s, File: %s", netid, filename)
+        
+        # Compressed at rest: send as-is if the client takes the encoding,
+        # decompress on the fly otherwise
+        stored = stored_encoding(filepath)
+        content_encoding = None
+        if stored:
+            content_encoding = stored[0]
+            if not request.accept_encodings.quality(content_encoding):
+                return serve_decoded(request.environ, *open_stored(filepath), os.path.basename(filepath))
+        
+        return serve_file(
+            request.environ, filepath, os.path.basename(filepath),
+            mode=state.download_mode,
+            base_dir=state.upload_dir,
+            accel_prefix=state.download_config.get('accel_prefix', '/protected-uploads'),
+            content_encoding=content_encoding
+        )
+        
+    except Exception as e:
+        logger.error("Download error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/thumbnail/<filename>', methods=['GET'])
+def thumbnail(filename):
+    """Resized preview of an uploaded image (?size=<pixels>)"""
+    if not state.thumbnails:
+        return jsonify({'error': 'Thumbnails are disabled'}), 404
+    
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        requested = request.args.get('size')
+        if requested is not None and (not requested.isdigit() or int(requested) < 1):
+            return jsonify({'error': 'Invalid query parameter: size must be a positive number of pixels'}), 400
+        size = state.thumbnails.pick_size(int(requested) if requested else None)
+        
+        # Get student directory
+        student_dir = state.get_student_dir(netid)
+        filename = secure_filename(filename)
+        filepath = os.path.join(student_dir, filename)
+        
+        # Check if file exists
+        if not filename or not is_published(filepath):
+            return jsonify({'error': 'File not found'}), 404
+        
+        if not state.thumbnails.handles(filename):
+            return jsonify({
+                'error': 'No thumbnails for this file type',
+                'allowed_types': sorted(state.thumbnails.extensions)
+            }), 415
+        
+        try:
+            preview = state.thumbnails.get(netid, filepath, size)
+        except NotAnImage as e:
+            logger.info("No thumbnail - NetID: %s, File: %s: %s", netid, filename, e)
+            return jsonify({'error': 'File is not a readable image'}), 415
+        
+        # Served from the cache (outside upload_dir, so never through the
+        # front-end server)
+        base, _ = os.path.splitext(filename)
+        response = serve_file(request.environ, preview, f"{base}.{size}{os.path.splitext(preview)[1]}")
+        if 'Content-Disposition' in response.headers:
+            response.headers['Content-Disposition'] = response.headers['Content-Disposition'].replace(
+                'attachment', 'inline', 1
+            )
+        return response
+        
+    except FileNotFoundError:
+        # Deleted or replaced while we were reading it
+        return jsonify({'error': 'File not found'}), 404
+    except Exception as e:
+        logger.error("Thumbnail error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+def _int_arg(name, default=None):
+    """Non-negative integer query parameter"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    if not value.isdigit():
+        raise ValueError(f'{name} must be a non-negative integer')
+    return int(value)
+
+
+def _row_window(selector, count, offset, total):
+    """[start, stop) of the rows a head / tail / offset read selects"""
+    if selector == 'head':
+        return 0, min(count, total)
+    if selector == 'tail':
+        return max(total - count, 0), total
+    start = min(offset, total)
+    return start, min(start + count, total)
+
+
+def _project(value, steps, columns):
+    """A JSON row narrowed to `steps` (path) and then `columns` (object keys)"""
+    if steps:
+        try:
+            value = resolve_path(value, steps)
+        except PathNotFound:
+            return None
+    if columns:
+        if not isinstance(value, dict):
+            return None
+        value = {column: value.get(column) for column in columns}
+    return value
+
+
+@route('/android/read/<filename>', methods=['GET'])
+def read_rows(filename):
+    """Rows, columns or a JSON path of a CSV/JSON file, without downloading it"""
+    if not state.row_index:
+        return jsonify({'error': 'Row reads are disabled'}), 404
+    
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Row selection and projection parameters
+        max_rows = state.reads_config.get('max_rows', 1000)
+        try:
+            selectors = [name for name in ('head', 'tail', 'offset') if name in request.args]
+            if len(selectors) > 1:
+                raise ValueError('use only one of head, tail and offset')
+            selector = selectors[0] if selectors else 'offset'
+            if selector == 'offset':
+                count = _int_arg('limit', state.reads_config.get('default_rows', 100))
+            else:
+                count = _int_arg(selector)
+            if count > max_rows:
+                raise ValueError(f'at most {max_rows} rows per read')
+            offset = _int_arg('offset', 0)
+            columns = [name for name in request.args.get('columns', '').split(',') if name]
+            path = request.args.get('path')
+            steps = parse_path(path) if path is not None else None
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+        
+        # Get student directory
+        student_dir = state.get_student_dir(netid)
+        filename = secure_filename(filename)
+        filepath = os.path.join(student_dir, filename)
+        
+        # Check if file exists
+        if not filename or not is_published(filepath):
+            return jsonify({'error': 'File not found'}), 404
+        
+        if not readable(filename):
+            return jsonify({
+                'error': 'Row reads are only for CSV and JSON files',
+                'allowed_types': sorted(ROW_EXTENSIONS)
+            }), 415
+        
+        # The same query of the same file version has the same answer
+        etag = f"{make_etag(os.stat(filepath))}-{hashlib.sha256(request.query_string).hexdigest()[:16]}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        
+        try:
+            with state.row_index.open(netid, filepath) as rows:
+                if rows.kind == KIND_DOCUMENT:
+                    # No rows: parse it whole and follow the path
+                    document = state.row_index.document(
+                        filepath, state.reads_config.get('max_document_mb', 16) * 1024 * 1024
+                    )
+                    try:
+                        value = resolve_path(document, steps or [])
+                    except PathNotFound:
+                        return jsonify({'error': 'Path not found', 'path': path}), 404
+                    if not isinstance(value, list):
+                        if selectors or columns:
+                            return jsonify({'error': 'Path does not select an array', 'path': path}), 400
+                        body = {'filename': filename, 'path': path, 'value': value}
+                    else:
+                        start, stop = _row_window(selector, count, offset, len(value))
+                        body = {
+                            'filename': filename,
+                            'path': path,
+                            'total_rows': len(value),
+                            'offset': start,
+                            'rows': [_project(item, None, columns) for item in value[start:stop]]
+                        }
+                
+                else:
+                    if rows.kind == KIND_CSV and steps is not None:
+                        return jsonify({'error': 'path is only for JSON files'}), 400
+                    start, stop = _row_window(selector, count, offset, rows.rows)
+                    max_bytes = state.reads_config.get('max_response_mb', 8) * 1024 * 1024
+                    if rows.span(start, stop) > max_bytes:
+                        return jsonify({
+                            'error': 'Requested rows are too large; ask for fewer',
+                            'max_response_mb': max_bytes / (1024 * 1024)
+                        }), 413
+                    
+                    selected = rows.rows_between(start, stop)
+                    body = {
+                        'filename': filename,
+                        'total_rows': rows.rows,
+                        'offset': start
+                    }
+                    if rows.kind == KIND_CSV:
+                        header = rows.columns()
+                        missing = [name for name in columns if name not in header]
+                        if missing:
+                            return jsonify({
+                                'error': 'Unknown column', 'missing': missing, 'columns': header
+                            }), 400
+                        if columns:
+                            picks = [header.index(name) for name in columns]
+                            selected = [[row[i] if i < len(row) else None for i in picks] for row in selected]
+                        body['columns'] = columns or header
+                        body['rows'] = selected
+                    else:
+                        body['rows'] = [_project(row, steps, columns) for row in selected]
+        
+        except NotReadable as e:
+            logger.info("Read failed - NetID: %s, File: %s: %s", netid, filename, e)
+            return jsonify({'error': 'File cannot be read as rows', 'details': str(e)}), 422
+        
+        logger.info("Read - NetID: %s, File: %s, Query: %s", netid, filename,
+                    request.query_string.decode('utf-8', errors='replace'))
+        
+        response = jsonify(body)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
+        
+    except FileNotFoundError:
+        # Deleted while we were reading it
+        return jsonify({'error': 'File not found'}), 404
+    except Exception as e:
+        logger.error("Read error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/archive', methods=['GET'])
+def download_archive():
+    """Stream a ZIP of the student's files (all, or filtered)"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Filter parameters
+        try:
+            compression = request.args.get('compression', state.archive_compression)
+            if compression not in ARCHIVE_COMPRESSION:
+                raise ValueError(f"compression must be one of: {', '.join(ARCHIVE_COMPRESSION)}")
+            names = request.args.get('files')
+            pattern = request.args.get('pattern')
+            since = request.args.get('since')
+            since_ns = parse_since(since) if since else None
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+        
+        # Get student directory
+        student_dir = state.get_student_dir(netid)
+        listing = state.listing_cache.get(netid, student_dir)
+        entries = {name: -neg_mtime for neg_mtime, name, _, _ in listing.entries}
+        
+        if names:
+            wanted = [secure_filename(name) for name in names.split(',') if name]
+            missing = [name for name in wanted if name not in entries]
+            if missing:
+                return jsonify({'error': 'File not found', 'missing': missing}), 404
+        else:
+            wanted = list(entries)
+        
+        selected = sorted(
+            name for name in set(wanted)
+            if (pattern is None or fnmatch.fnmatch(name, pattern))
+            and (since_ns is None or entries[name] > since_ns)
+        )
+        if not selected:
+            return jsonify({'error': 'No matching files'}), 404
+        
+        logger.info("Archive download - NetID: %s, Files: %s, Compression: %s",
+                    netid, len(selected), compression)
+        
+        files = ((name, os.path.join(student_dir, name)) for name in selected)
+        response = current_app.response_class(
+            stream_zip(files, compression, open_file=open_stored), mimetype='application/zip'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="{netid}-files.zip"'
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+        
+    except Exception as e:
+        logger.error("Archive error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/list', methods=['GET'])
+def list_files():
+    """List all files in student's directory"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Paging / filter parameters
+        try:
+            limit = request.args.get('limit', type=int)
+            if limit is not None and limit < 1:
+                raise ValueError('limit must be positive')
+            cursor = request.args.get('cursor')
+            cursor_key = decode_cursor(cursor) if cursor else None
+            since = request.args.get('since')
+            since_ns = parse_since(since) if since else None
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+        
+        # Get student directory
+        student_dir = state.get_student_dir(netid)
+        
+        # Cached listing, rebuilt only when the directory changed
+        listing = state.listing_cache.get(netid, student_dir)
+        
+        # Get usage stats
+        total_usage = state.quota_ledger.usage(netid, student_dir)
+        
+        # Polling clients get a 304 when nothing changed
+        etag = f"{listing.etag_base()}-{total_usage:x}-{g.limits.student_quota:x}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        
+        entries, next_key = listing.page(cursor_key, since_ns, limit)
+        files = [
+            {'filename': name, 'size_bytes': size, 'modified': modified}
+            for _, name, size, modified in entries
+        ]
+        
+        response = jsonify({
+            'files': files,
+            'total_files': len(listing.entries),
+            'total_usage_mb': round(total_usage / (1024*1024), 2),
+            'quota_mb': g.limits.student_quota / (1024*1024),
+            'remaining_mb': round((g.limits.student_quota - total_usage) / (1024*1024), 2),
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        })
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
+        
+    except Exception as e:
+        logger.error("List error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/versions/<filename>', methods=['GET'])
+def list_versions(filename):
+    """List the kept older versions of a file"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        student_dir = state.get_student_dir(netid)
+        filename = secure_filename(filename)
+        filepath = os.path.join(student_dir, filename)
+        
+        if not filename or not is_published(filepath):
+            return jsonify({'error': 'File not found'}), 404
+        
+        st = os.stat(filepath)
+        size = original_size(filepath)
+        versions = [
+            {
+                'version': number,
+                'size_bytes': size,
+                'stored_bytes': stored,
+                'modified': datetime.fromtimestamp(mtime_ns / 1e9).isoformat()
+            }
+            for number, size, mtime_ns, stored in state.version_store.versions(student_dir, filename)
+        ]
+        
+        return jsonify({
+            'filename': filename,
+            'current': {
+                'size_bytes': size,
+                'modified': datetime.fromtimestamp(st.st_mtime).isoformat()
+            },
+            'versions': versions
+        }), 200
+        
+    except Exception as e:
+        logger.error("List versions error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/versions/<filename>/<int:version>', methods=['GET'])
+def download_version(filename, version):
+    """Download an older version of a file"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        student_dir = state.get_student_dir(netid)
+        filename = secure_filename(filename)
+        
+        if not filename or not is_published(os.path.join(student_dir, filename)):
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Rebuilt in memory from the current file and the deltas after it
+        data = state.version_store.read(student_dir, filename, version)
+        if data is None:
+            return jsonify({'error': 'Version not found'}), 404
+        
+        logger.info("Version download - NetID: %s, File: %s, Version: %s", netid, filename, version)
+        
+        base, ext = os.path.splitext(filename)
+        response = current_app.response_class(data, mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename="{base}.v{version}{ext}"'
+        return response
+        
+    except Exception as e:
+        logger.error("Version download error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/delete/<filename>', methods=['DELETE'])
+def delete_file(filename):
+    """Delete a file from student's directory"""
+    try:
+        # Validate token
+        token = request.headers.get('X-Auth-Token')
+        netid = validate_token(token)
+        
+        if not netid:
+            return jsonify({'error': 'Invalid or missing authentication token'}), 401
+        
+        # Get student directory
+        student_dir = state.get_student_dir(netid)
+        filepath = os.path.join(student_dir, secure_filename(filename))
+        
+        # Check if file exists
+        if not is_published(filepath):
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Prevent directory traversal
+        if not os.path.abspath(filepath).startswith(os.path.abspath(student_dir)):
+            logger.warning("Directory traversal attempt by %s: %s", netid, filename)
+            return jsonify({'error': 'Invalid file path'}), 403
+        
+        # Delete file (and its version history, kept under the "version"
+        # policy or left from a time it was in use)
+        file_size = state.quota_size(filepath)
+        name = os.path.basename(filepath)
+        history_size = 0
+        if keeps_history(student_dir, name):
+            with state.version_store.locked(student_dir, name):
+                os.remove(filepath)
+                history_size = state.version_store.remove(student_dir, name)
+        else:
+            os.remove(filepath)
+        state.listing_cache.invalidate(netid)
+        
+        if state.object_store:
+            sha256 = state.object_store.forget(netid, os.path.basename(filepath))
+            # Still charged if another of the student's files has this content
+            if sha256 and state.object_store.holds(netid, sha256):
+                file_size = 0
+        if state.thumbnails:
+            state.thumbnails.forget(netid, os.path.basename(filepath))
+        if state.row_index:
+            state.row_index.forget(netid, os.path.basename(filepath))
+        
+        logger.info("Delete successful - NetID: %s, File: %s", netid, filename)
+        
+        # Get updated usage
+        total_usage = state.quota_ledger.add(netid, -(file_size + history_size))
+        if total_usage is None:
+            total_usage = state.quota_ledger.usage(netid, student_dir)
+        
+        return jsonify({
+            'message': 'File deleted successfully',
+            'filename': filename,
+            'current_usage_mb': round(total_usage / (1024*1024), 2),
+            'quota_mb': g.limits.student_quota / (1024*1024)
+        }), 200
+        
+    except Exception as e:
+        logger.error("Delete error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+def is_local_request():
+    """True for a request from this machine that didn't come through the proxy"""
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+@route('/android/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for all workers (optional bearer token)"""
+    if not state.metrics:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    if state.metrics_config.get('local_only', False) and not is_local_request():
+        return jsonify({'error': 'Metrics are only served to local scrapers'}), 403
+    
+    token = state.metrics_config.get('token')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({'error': 'Invalid or missing metrics token'}), 401
+    
+    try:
+        students, used, near_quota = state.quota_ledger.totals(g.limits.student_quota)
+        gauges = [
+            ('android_api_storage_used_bytes', 'Bytes stored by all students', None, used),
+            ('android_api_storage_students', 'Students with stored files', None, students),
+            ('android_api_storage_students_near_quota', 'Students at 90% of quota or more', None, near_quota),
+            ('android_api_student_quota_bytes', 'Per-student storage quota', None, g.limits.student_quota),
+        ]
+        return current_app.response_class(
+            state.metrics.render(gauges), status=200,
+            mimetype='text/plain; version=0.0.4'
+        )
+        
+    except Exception as e:
+        logger.error("Metrics error: %s", e, exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/android/health', methods=['GET'])
+def health_check():
+    """Health check endpoint (no authentication required)"""
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'version': '1.0.0'
+    }), 200
+
+
+def create_app(config, config_file=None):
+    """
+    Build the API from a parsed config.toml. `config_file` is the file
+    it came from, watched for limit changes (None: never reloaded).
+    Raises ConfigError for invalid settings and KeyError for missing ones.
+    """
+    setup_logging(config)
+
+    app = Flask(__name__)
+    api_state = APIState(config, config_file)
+    app.extensions['android_api'] = api_state
+    app.before_request(start_request_timer)
+    app.before_request(expire_upload_sessions)
+    app.after_request(record_request)
+    for rule, view, options in _ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    if config_file:
+        api_state.install_reload_signal()
+
+    logger.info("Configuration loaded from %s", config_file or 'a config dict')
+    logger.info("Upload directory: %s", api_state.upload_dir)
+    logger.info("Token file: %s", api_state.token_file)
+    return app
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the course API
+Serves the same Flask app (every /android/* route) from an ASGI server
+such as uvicorn. Request bodies are fed to the app as they arrive and
+response bodies are streamed back with file reads done in a thread pool,
+so a slow client ties up a coroutine rather than a worker process.
+
+    uvicorn asgi:app --host 127.0.0.1 --port 5000
+
+The WSGI `app:app` used by gunicorn is unchanged.
+"""
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import CONFIG, app as wsgi_app
+
+ASGI_CONFIG = CONFIG.get('asgi', {})
+
+# Upper bound on requests running Flask code at once; a slow upload holds
+# one of these while its body trickles in, a slow download does not
+THREADS = ASGI_CONFIG.get('threads', 64)
+
+# Bytes read from disk per response message
+BLOCK_SIZE = ASGI_CONFIG.get('block_size_kb', 256) * 1024
+
+
+class ClientDisconnected(OSError):
+    """The client went away before the request body was complete"""
+
+
+class RequestBody(io.RawIOBase):
+    """
+    Blocking `wsgi.input` for the app thread, filled from the ASGI
+    `receive` channel on the event loop one message at a time.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                raise ClientDisconnected("client disconnected during upload")
+            self._buffer = message.get('body', b'')
+            self._more = message.get('more_body', False)
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class FileWrapper:
+    """
+    `wsgi.file_wrapper` for this server: lets download responses reach the
+    event loop as a file, which is then read in the thread pool.
+    """
+
+    def __init__(self, filelike, block_size=BLOCK_SIZE):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            data = self.filelike.read(self.block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The body ends where the client's does (chunked requests have no
+        # Content-Length); without this Werkzeug reads them as empty
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': FileWrapper,
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            key = 'CONTENT_TYPE'
+        elif name == 'CONTENT_LENGTH':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = f"HTTP_{name}"
+        if key in environ:
+            value = f"{environ[key]},{value}"
+        environ[key] = value
+    return environ
+
+
+class AsgiApp:
+    """ASGI application running a WSGI app in a thread pool"""
+
+    def __init__(self, wsgi, threads=THREADS):
+        self.wsgi = wsgi
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, RequestBody(receive, loop))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        try:
+            result = await loop.run_in_executor(self.executor, self.wsgi, environ, start_response)
+        except ClientDisconnected:
+            return
+
+        # The app is done with the body; from here on receive() only
+        # reports the client going away, which stops a download early
+        disconnected = asyncio.Event()
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+        watcher = loop.create_task(watch_disconnect())
+
+        try:
+            if isinstance(result, FileWrapper):
+                # Downloads: read the file in the pool, send from the loop
+                read = result.filelike.read
+                block_size = result.block_size
+                async def next_chunk():
+                    return await loop.run_in_executor(self.executor, read, block_size) or None
+            else:
+                iterator = iter(result)
+                async def next_chunk():
+                    return await loop.run_in_executor(self.executor, next, iterator, None)
+
+            chunk = await next_chunk()
+            await send({
+                'type': 'http.response.start',
+                'status': started['status'],
+                'headers': started['headers'],
+            })
+            started['sent'] = True
+
+            if chunk is None:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            while chunk is not None and not disconnected.is_set():
+                following = await next_chunk()
+                if chunk or following is None:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': following is not None,
+                    })
+                chunk = following
+        finally:
+            watcher.cancel()
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+app = AsgiApp(wsgi_app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(
+        'asgi:app',
+        host=CONFIG['server']['host'],
+        port=CONFIG['server']['port'],
+        timeout_keep_alive=5
+    )
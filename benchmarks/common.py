@@ -0,0 +1,141 @@
+"""
+Shared helpers for the benchmark scripts
+Builds a throwaway deployment (config, tokens, student files) under a
+scratch directory and summarises latency samples.
+"""
+
+import os
+import random
+import string
+import sys
+
+CONFIG_ENV = 'ANDROID_API_CONFIG'
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+EXTENSIONS = ('txt', 'json', 'csv', 'png', 'pdf')
+
+sys.path.insert(0, REPO_DIR)
+
+from token_store import save_tokens  # noqa: E402
+
+
+def netid_for(i):
+    """Deterministic NetID for synthetic student `i`"""
+    return f"bench{i:05d}"
+
+
+def token_for(i):
+    """Deterministic token for synthetic student `i`"""
+    return f"bench-token-{i:05d}-{'x' * 24}"
+
+
+def write_config(root, quota_mb=500, max_file_size_mb=50, rate_limit=10,
+                 enable_rate_limiting=True, extra=''):
+    """
+    Write a config.toml for a deployment rooted at `root` and return its
+    path. `extra` is appended verbatim (more TOML sections).
+    """
+    paths = {name: os.path.join(root, name) for name in ('uploads', 'tokens', 'logs', 'state')}
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+
+    config_toml = f"""# Benchmark configuration (generated)
+
+[server]
+host = "127.0.0.1"
+port = 5000
+workers = 2
+timeout = 120
+
+[paths]
+upload_dir = "{paths['uploads']}"
+token_dir = "{paths['tokens']}"
+log_dir = "{paths['logs']}"
+state_dir = "{paths['state']}"
+
+[storage]
+max_file_size_mb = {max_file_size_mb}
+student_quota_mb = {quota_mb}
+rate_limit = {rate_limit}
+allowed_extensions = "{','.join(EXTENSIONS)}"
+
+[logging]
+level = "WARNING"
+format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+[security]
+require_https = false
+enable_rate_limiting = {str(enable_rate_limiting).lower()}
+{extra}"""
+
+    config_file = os.path.join(root, 'config.toml')
+    with open(config_file, 'w') as f:
+        f.write(config_toml)
+    return config_file
+
+
+def write_tokens(root, students):
+    """Create tokens.json for `students` synthetic NetIDs"""
+    tokens = {netid_for(i): token_for(i) for i in range(students)}
+    save_tokens(os.path.join(root, 'tokens', 'tokens.json'), tokens)
+    return tokens
+
+
+def populate(root, students, files_per_student, file_size, seed=0):
+    """
+    Fill each student's upload directory with `files_per_student` files
+    of `file_size` bytes. Returns {netid: [filenames]}.
+    """
+    rng = random.Random(seed)
+    payload = os.urandom(file_size) if file_size else b''
+    files = {}
+
+    for i in range(students):
+        netid = netid_for(i)
+        student_dir = os.path.join(root, 'uploads', netid)
+        os.makedirs(student_dir, exist_ok=True)
+        names = []
+        for n in range(files_per_student):
+            name = f"file{n:05d}.{rng.choice(EXTENSIONS)}"
+            with open(os.path.join(student_dir, name), 'wb') as f:
+                f.write(payload)
+            names.append(name)
+        files[netid] = names
+    return files
+
+
+def random_name(rng, ext='txt'):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(10)) + '.' + ext
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_samples) + 0.5)) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
+
+
+def summarize(name, samples, elapsed=None):
+    """One result row: count, throughput and p50/p95/p99 in milliseconds"""
+    ordered = sorted(samples)
+    row = {
+        'name': name,
+        'count': len(ordered),
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+    }
+    total = elapsed if elapsed is not None else sum(ordered)
+    row['ops_per_s'] = len(ordered) / total if total else 0.0
+    return row
+
+
+def print_table(rows):
+    """Print summarize() rows as a fixed-width table"""
+    print(f"{'name':<28} {'count':>8} {'ops/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print("-" * 89)
+    for row in rows:
+        print(f"{row['name']:<28} {row['count']:>8} {row['ops_per_s']:>11.1f} "
+              f"{row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['max_ms']:>9.3f}")
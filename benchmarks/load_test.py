@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Load test for the upload/list/download/delete routes
+Simulates a lab section of students hitting the API at once, either
+in-process through the Flask test client or over HTTP against a gunicorn
+started for the run, and reports throughput and p50/p95/p99 latency per
+route.
+
+Examples:
+    python benchmarks/load_test.py                      # 40 students, in-process
+    python benchmarks/load_test.py --target gunicorn --workers 4
+    python benchmarks/load_test.py --mix upload=1 --size-kb 2048 --duration 30
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import (  # noqa: E402
+    CONFIG_ENV, REPO_DIR, netid_for, populate, print_table, random_name,
+    summarize, token_for, write_config, write_tokens
+)
+
+OPERATIONS = ('upload', 'list', 'download', 'delete')
+BOUNDARY = 'benchmark-boundary-7d3f9a'
+
+
+def parse_mix(text):
+    """'upload=4,list=3' -> {'upload': 4, 'list': 3}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def multipart_body(filename, payload):
+    head = (
+        f'--{BOUNDARY}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    return head + payload + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+class InProcessClient:
+    """Requests through the Flask test client (no network, no server)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers, body=None):
+        response = self.client.open(path, method=method, headers=headers, data=body)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+
+
+class HTTPClient:
+    """Plain HTTP/1.1 requests, one connection per request (gunicorn sync workers)"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def request(self, method, path, headers, body=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+
+def student_worker(client, students, files, mix, payload, deadline, rng, results, statuses):
+    """Run random operations for `students` (owned by this thread) until `deadline`"""
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    upload_headers = {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}
+
+    while time.monotonic() < deadline:
+        i = rng.choice(students)
+        netid = netid_for(i)
+        headers = {'X-Auth-Token': token_for(i)}
+        op = rng.choices(ops, weights)[0]
+        names = files[netid]
+
+        if op in ('download', 'delete') and not names:
+            op = 'upload'
+
+        if op == 'upload':
+            body = multipart_body(random_name(rng), payload)
+            start = time.perf_counter()
+            status, data = client.request('POST', '/android/upload',
+                                          {**headers, **upload_headers}, body)
+            if status == 201:
+                names.append(json.loads(data)['filename'])
+        elif op == 'list':
+            start = time.perf_counter()
+            status, _ = client.request('GET', '/android/list', headers)
+        elif op == 'download':
+            name = rng.choice(names)
+            start = time.perf_counter()
+            status, _ = client.request('GET', f'/android/download/{name}', headers)
+        else:
+            name = names.pop(rng.randrange(len(names)))
+            start = time.perf_counter()
+            status, _ = client.request('DELETE', f'/android/delete/{name}', headers)
+
+        results[op].append(time.perf_counter() - start)
+        statuses[op][status] += 1
+
+
+def run_load(client, args, files):
+    """Start one thread per `--concurrency` and collect latency samples"""
+    payload = os.urandom(args.size_kb * 1024)
+    results = {op: [] for op in OPERATIONS}
+    statuses = {op: Counter() for op in OPERATIONS}
+    deadline = time.monotonic() + args.duration
+
+    # Each thread owns a disjoint set of students so file lists never race
+    threads = []
+    for t in range(args.concurrency):
+        owned = list(range(t, args.students, args.concurrency))
+        if not owned:
+            continue
+        thread = threading.Thread(
+            target=student_worker,
+            args=(client(), owned, files, args.mix, payload, deadline,
+                  random.Random(args.seed + t), results, statuses)
+        )
+        threads.append(thread)
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    rows = [summarize(op, results[op], elapsed) for op in OPERATIONS if results[op]]
+    rows.append(summarize('total', [s for op in OPERATIONS for s in results[op]], elapsed))
+    return rows, statuses
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(config_file, workers, port):
+    """Launch gunicorn on app:app and wait until /android/health answers"""
+    env = dict(os.environ, **{CONFIG_ENV: config_file})
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+         '-w', str(workers), '-b', f'127.0.0.1:{port}', '--chdir', REPO_DIR, '--timeout', '120', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+    probe = HTTPClient('127.0.0.1', port)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited: {proc.stderr.read().decode(errors='replace')}")
+        try:
+            if probe.request('GET', '/android/health', {})[0] == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become ready within 30 seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', choices=('inprocess', 'gunicorn'), default='inprocess')
+    parser.add_argument('--students', type=int, default=40, help='Synthetic students (default: 40)')
+    parser.add_argument('--files', type=int, default=20,
+                        help='Existing files per student before the run (default: 20)')
+    parser.add_argument('--size-kb', type=int, default=64,
+                        help='Size of existing and uploaded files in KB (default: 64)')
+    parser.add_argument('--concurrency', type=int, default=40,
+                        help='Concurrent clients (default: 40)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run (default: 10)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('upload=2,list=4,download=3,delete=1'),
+                        help='Operation weights (default: upload=2,list=4,download=3,delete=1)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default: 2)')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='Keep the upload rate limit on (off by default so uploads are measured)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--root', help='Scratch directory (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help='Do not delete the scratch directory')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='android-api-bench-')
+    proc = None
+    try:
+        config_file = write_config(
+            root,
+            quota_mb=max(500, args.files * args.size_kb // 1024 * 4),
+            max_file_size_mb=max(50, args.size_kb // 1024 + 1),
+            enable_rate_limiting=args.rate_limit
+        )
+        write_tokens(root, args.students)
+        files = populate(root, args.students, args.files, args.size_kb * 1024, args.seed)
+
+        if args.target == 'inprocess':
+            sys.path.insert(0, REPO_DIR)
+            import android_api  # noqa: E402
+            app = android_api.create_app(android_api.load_config(config_file))
+            def client():
+                return InProcessClient(app)
+        else:
+            port = free_port()
+            proc = start_gunicorn(config_file, args.workers, port)
+            def client():
+                return HTTPClient('127.0.0.1', port)
+
+        print(f"{args.target}: {args.students} students x {args.files} files of {args.size_kb} KB, "
+              f"{args.concurrency} clients for {args.duration:g}s\n")
+        rows, statuses = run_load(client, args, files)
+        print_table(rows)
+        print()
+        for op in OPERATIONS:
+            if statuses[op]:
+                counts = ', '.join(f"{status}: {n}" for status, n in sorted(statuses[op].items()))
+                print(f"  {op} status codes - {counts}")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({
+                    'target': args.target,
+                    'args': {k: v for k, v in vars(args).items() if k != 'json'},
+                    'results': rows,
+                    'statuses': {op: dict(c) for op, c in statuses.items()},
+                }, f, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if not args.keep and not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-request helpers
+Times validate_token, get_directory_size (and the quota ledger that
+replaces it on the hot path) and check_rate_limit against a synthetic
+course of 1,000 students with 10,000 files per directory.
+
+Directory scans cost the same for every student, so only `--scan-dirs`
+of the directories are actually created; pass a larger value to
+exercise the page cache across more of them.
+
+Examples:
+    python benchmarks/micro.py
+    python benchmarks/micro.py --students 5000 --files 20000 --iterations 20000
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import (  # noqa: E402
+    REPO_DIR, netid_for, populate, print_table, summarize,
+    token_for, write_config, write_tokens
+)
+
+
+def timed(func, args_list):
+    """Call func(*args) for each args tuple, returning per-call seconds"""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=1000, help='Students in tokens.json (default: 1000)')
+    parser.add_argument('--files', type=int, default=10000, help='Files per scanned directory (default: 10000)')
+    parser.add_argument('--scan-dirs', type=int, default=3,
+                        help='Student directories actually populated (default: 3)')
+    parser.add_argument('--iterations', type=int, default=10000,
+                        help='Calls per token/rate-limit benchmark (default: 10000)')
+    parser.add_argument('--scan-iterations', type=int, default=20,
+                        help='Calls per directory-scan benchmark (default: 20)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--root', help='Scratch directory (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help='Do not delete the scratch directory')
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='android-api-micro-')
+    rng = random.Random(args.seed)
+    try:
+        config_file = write_config(root, enable_rate_limiting=True)
+        write_tokens(root, args.students)
+        print(f"Creating {args.scan_dirs} x {args.files} files...")
+        populate(root, args.scan_dirs, args.files, 16, args.seed)
+
+        sys.path.insert(0, REPO_DIR)
+        import android_api as api  # noqa: E402
+        from flask import g  # noqa: E402
+        from rate_limit import MemoryRateLimiter, SQLiteRateLimiter  # noqa: E402
+
+        app = api.create_app(api.load_config(config_file))
+        state = app.extensions['android_api']
+
+        # Invalid tokens log a warning each; keep them out of the terminal
+        for handler in logging.getLogger().handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(logging.ERROR)
+
+        rows = []
+        students = [rng.randrange(args.students) for _ in range(args.iterations)]
+
+        with app.test_request_context():
+            valid = [(token_for(i),) for i in students]
+            rows.append(summarize('validate_token (valid)', timed(api.validate_token, valid)))
+            invalid = [(f"not-a-token-{n}",) for n in range(args.iterations // 10)]
+            rows.append(summarize('validate_token (invalid)', timed(api.validate_token, invalid)))
+
+        dirs = [(os.path.join(root, 'uploads', netid_for(i % args.scan_dirs)),)
+                for i in range(args.scan_iterations)]
+        rows.append(summarize(f'get_directory_size ({args.files})', timed(state.get_directory_size, dirs)))
+        usage = [(netid_for(i % args.scan_dirs), path) for i, (path,) in enumerate(dirs)]
+        for netid, path in set(usage):
+            state.quota_ledger.usage(netid, path)
+        rows.append(summarize('quota_ledger.usage (cached)', timed(state.quota_ledger.usage, usage)))
+
+        hits = [(netid_for(i),) for i in students]
+        rate_limit = state.config_watcher.limits.rate_limit
+        for name, limiter in (
+            ('memory', MemoryRateLimiter(rate_limit)),
+            ('sqlite', SQLiteRateLimiter(os.path.join(root, 'state', 'bench-ratelimit.db'), rate_limit)),
+        ):
+            state.rate_limiter = limiter
+            with app.test_request_context():
+                g.limits = state.config_watcher.current()
+                rows.append(summarize(f'check_rate_limit ({name})', timed(api.check_rate_limit, hits)))
+
+        print(f"\n{args.students} students, {args.files} files per directory\n")
+        print_table(rows)
+    finally:
+        if not args.keep and not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
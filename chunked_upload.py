@@ -0,0 +1,366 @@
+"""
+Resumable chunked uploads
+A client opens a session, PUTs numbered chunks (each with a SHA-256
+checksum) in any order and over as many requests as it needs, and then
+finalizes. Chunks are written at their final offset in a single part
+file in the student's directory, so finalizing is a rename, not a copy.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import time
+
+from streaming_upload import TEMP_PREFIX, TEMP_SUFFIX, UploadError
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+
+UPLOAD_ID_RE = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+
+def upload_id_of(name):
+    """Session id of a chunked upload's part file name, or None"""
+    if name.startswith(TEMP_PREFIX) and name.endswith(TEMP_SUFFIX):
+        upload_id = name[len(TEMP_PREFIX):-len(TEMP_SUFFIX)]
+        if UPLOAD_ID_RE.match(upload_id):
+            return upload_id
+    return None
+
+
+class ChunkedUploads:
+    """
+    Upload sessions stored on disk so every gunicorn worker sees them.
+
+    For each session `<state_dir>/<id>.json` holds the metadata written at
+    init and `<state_dir>/<id>.chunks` is an append-only log of received
+    chunk indexes. finalize() renames the metadata to `<id>.json.completing`
+    so only one request completes a session. Sessions untouched for
+    `session_ttl` seconds are removed by collect_garbage().
+
+    The declared size of a session is charged up front through
+    `charge(netid, delta)` (the quota ledger) and given back when the
+    session ends: completed, aborted or expired. A student may have at
+    most `max_sessions` open at once (0: no limit).
+    """
+
+    def __init__(self, state_dir, chunk_size=1024 * 1024, session_ttl=86400,
+                 gc_interval=600, max_sessions=0, charge=None):
+        self.state_dir = state_dir
+        self.chunk_size = chunk_size
+        self.session_ttl = session_ttl
+        self.gc_interval = gc_interval
+        self.max_sessions = max_sessions
+        self.charge = charge
+        self._next_gc = 0.0
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.state_dir, f"{upload_id}.json")
+
+    def _log_path(self, upload_id):
+        return os.path.join(self.state_dir, f"{upload_id}.chunks")
+
+    def _claim_path(self, upload_id):
+        return os.path.join(self.state_dir, f"{upload_id}.json.completing")
+
+    def create(self, netid, student_dir, filename, size, sha256=None):
+        """Open a new session, reserve its size and return its metadata"""
+        self.maybe_collect_garbage()
+
+        if self.max_sessions and len(self.open_sessions(student_dir)) >= self.max_sessions:
+            raise UploadError(429, 'Too many unfinished uploads', details={
+                'max_sessions': self.max_sessions
+            })
+
+        upload_id = secrets.token_urlsafe(16)
+        total_chunks = max(1, -(-size // self.chunk_size))
+        session = {
+            'upload_id': upload_id,
+            'netid': netid,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'chunk_size': self.chunk_size,
+            'total_chunks': total_chunks,
+            'part_path': os.path.join(student_dir, f"{TEMP_PREFIX}{upload_id}{TEMP_SUFFIX}"),
+            'created': time.time(),
+        }
+
+        # Metadata first: from here on discard() finds and releases everything
+        tmp = self._meta_path(upload_id) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(session, f)
+        os.rename(tmp, self._meta_path(upload_id))
+        if self.charge:
+            self.charge(netid, size)
+
+        try:
+            open(self._log_path(upload_id), 'xb').close()
+            # Create the (sparse) part file up front so chunks can be pwrite()n
+            with open(session['part_path'], 'xb'):
+                pass
+        except BaseException:
+            self.discard(session)
+            raise
+
+        logger.info("Chunked upload started - NetID: %s, File: %s, Size: %s bytes, Chunks: %s, ID: %s",
+                    netid, filename, size, total_chunks, upload_id)
+        return session
+
+    def _load(self, upload_id):
+        with open(self._meta_path(upload_id), 'r') as f:
+            return json.load(f)
+
+    def open_sessions(self, student_dir):
+        """Ids of the sessions whose part files are in `student_dir`"""
+        sessions = []
+        for entry in os.scandir(student_dir):
+            upload_id = upload_id_of(entry.name)
+            if upload_id and (os.path.exists(self._meta_path(upload_id))
+                              or os.path.exists(self._claim_path(upload_id))):
+                sessions.append(upload_id)
+        return sessions
+
+    def reserved_size(self, part_name):
+        """Bytes reserved by the session a part file belongs to (0 if none)"""
+        upload_id = upload_id_of(part_name)
+        if upload_id is None:
+            return 0
+        for path in (self._meta_path(upload_id), self._claim_path(upload_id)):
+            try:
+                with open(path, 'r') as f:
+                    return json.load(f)['size']
+            except (OSError, ValueError, KeyError):
+                continue
+        return 0
+
+    def get(self, upload_id, netid):
+        """Return the session `upload_id` if it belongs to `netid`"""
+        if not UPLOAD_ID_RE.match(upload_id or ''):
+            raise UploadError(404, 'Upload session not found')
+        try:
+            session = self._load(upload_id)
+        except FileNotFoundError:
+            self._check_claimed(upload_id, netid)
+            raise UploadError(404, 'Upload session not found')
+        if session['netid'] != netid:
+            raise UploadError(404, 'Upload session not found')
+        return session
+
+    def _check_claimed(self, upload_id, netid):
+        """409 if another request of `netid` is completing `upload_id`"""
+        try:
+            with open(self._claim_path(upload_id), 'r') as f:
+                claimed = json.load(f)
+        except (OSError, ValueError):
+            return
+        if claimed.get('netid') == netid:
+            raise UploadError(409, 'Upload is already being completed')
+
+    def expected_length(self, session, index):
+        """Exact byte length chunk `index` must have"""
+        if index < 0 or index >= session['total_chunks']:
+            raise UploadError(416, 'Chunk index out of range', details={
+                'total_chunks': session['total_chunks']
+            })
+        if index < session['total_chunks'] - 1:
+            return session['chunk_size']
+        return session['size'] - index * session['chunk_size']
+
+    def write_chunk(self, session, index, stream, content_length, checksum):
+        """Verify and store chunk `index` read from `stream`"""
+        expected = self.expected_length(session, index)
+        if not checksum:
+            raise UploadError(400, 'Missing X-Chunk-SHA256 header')
+        if content_length != expected:
+            raise UploadError(400, 'Wrong chunk length', details={
+                'expected_bytes': expected,
+                'received_bytes': content_length
+            })
+
+        digest = hashlib.sha256()
+        offset = index * session['chunk_size']
+        written = 0
+        try:
+            fd = os.open(session['part_path'], os.O_WRONLY)
+        except FileNotFoundError:
+            # Completed, aborted or collected since the session was looked up
+            raise UploadError(404, 'Upload session not found')
+        try:
+            while written < expected:
+                data = stream.read(min(READ_SIZE, expected - written))
+                if not data:
+                    break
+                digest.update(data)
+                os.pwrite(fd, data, offset + written)
+                written += len(data)
+        finally:
+            os.close(fd)
+
+        if written != expected:
+            raise UploadError(400, 'Incomplete chunk', details={
+                'expected_bytes': expected,
+                'received_bytes': written
+            })
+        if digest.hexdigest() != checksum.strip().lower():
+            raise UploadError(422, 'Chunk checksum mismatch', details={'chunk': index})
+
+        # O_APPEND keeps concurrent small writes from different workers intact
+        try:
+            fd = os.open(self._log_path(session['upload_id']), os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            raise UploadError(404, 'Upload session not found')
+        try:
+            os.write(fd, f"{index}\n".encode())
+        finally:
+            os.close(fd)
+
+    def received_chunks(self, session):
+        """Sorted list of chunk indexes stored so far"""
+        try:
+            with open(self._log_path(session['upload_id']), 'r') as f:
+                return sorted({int(line) for line in f if line.strip()})
+        except FileNotFoundError:
+            return []
+
+    def status(self, session):
+        """Client-facing progress summary"""
+        received = self.received_chunks(session)
+        missing = sorted(set(range(session['total_chunks'])) - set(received))
+        return {
+            'upload_id': session['upload_id'],
+            'filename': session['filename'],
+            'size_bytes': session['size'],
+            'chunk_size': session['chunk_size'],
+            'total_chunks': session['total_chunks'],
+            'received_chunks': received,
+            'missing_chunks': missing,
+        }
+
+    def finalize(self, session):
+        """
+        Check that every chunk arrived, claim the session and return the
+        completed part path. The caller moves it into place and then calls
+        discard(), or release() if it gives up.
+        """
+        status = self.status(session)
+        if status['missing_chunks']:
+            raise UploadError(409, 'Upload incomplete', details={
+                'missing_chunks': status['missing_chunks']
+            })
+
+        # One rename decides which of two concurrent completes goes ahead
+        upload_id = session['upload_id']
+        try:
+            os.rename(self._meta_path(upload_id), self._claim_path(upload_id))
+        except FileNotFoundError:
+            raise UploadError(409, 'Upload is already being completed')
+
+        part_path = session['part_path']
+        try:
+            os.truncate(part_path, session['size'])
+            if session['sha256']:
+                digest = hashlib.sha256()
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(block)
+                if digest.hexdigest() != session['sha256']:
+                    raise UploadError(422, 'File checksum mismatch')
+        except BaseException:
+            self.release(session)
+            raise
+        return part_path
+
+    def release(self, session):
+        """Reopen a session claimed by finalize() (no-op once discarded)"""
+        upload_id = session['upload_id']
+        try:
+            os.rename(self._claim_path(upload_id), self._meta_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def discard(self, session, remove_part=True):
+        """
+        Remove the session state (and the part file unless it was kept)
+        and release its reservation. Only the first call for a session
+        releases anything.
+        """
+        # The metadata is under one of the two names, never both
+        released = False
+        for path in (self._meta_path(session['upload_id']), self._claim_path(session['upload_id'])):
+            try:
+                os.remove(path)
+                released = True
+            except FileNotFoundError:
+                pass
+        if released and self.charge:
+            self.charge(session['netid'], -session['size'])
+        paths = [self._log_path(session['upload_id'])]
+        if remove_part:
+            paths.append(session['part_path'])
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def maybe_collect_garbage(self):
+        """Run collect_garbage() at most once every gc_interval seconds"""
+        now = time.monotonic()
+        if now >= self._next_gc:
+            self._next_gc = now + self.gc_interval
+            self.collect_garbage()
+
+    def collect_garbage(self, temp_age=3600):
+        """
+        Remove sessions with no activity for session_ttl seconds, sessions
+        whose part file is gone (student directory removed) and the
+        leftovers of a crashed create() older than `temp_age` seconds
+        """
+        now = time.time()
+        cutoff = now - self.session_ttl
+        removed = 0
+        for entry in os.scandir(self.state_dir):
+            try:
+                if entry.name.endswith('.json'):
+                    upload_id = entry.name[:-len('.json')]
+                    try:
+                        # The chunk log is touched by every PUT
+                        last_activity = os.stat(self._log_path(upload_id)).st_mtime
+                    except FileNotFoundError:
+                        last_activity = entry.stat().st_mtime
+                    try:
+                        session = self._load(upload_id)
+                    except ValueError:
+                        continue
+                    orphaned = (last_activity < now - temp_age
+                                and not os.path.exists(session['part_path']))
+                    if last_activity >= cutoff and not orphaned:
+                        continue
+                    self.discard(session)
+                    removed += 1
+                elif entry.name.endswith('.json.completing'):
+                    # A complete that crashed; rename() set its ctime
+                    if entry.stat().st_ctime >= cutoff:
+                        continue
+                    with open(entry.path, 'r') as f:
+                        self.discard(json.load(f))
+                    removed += 1
+                elif entry.name.endswith(('.json.tmp', '.chunks')):
+                    upload_id = entry.name.split('.', 1)[0]
+                    if entry.name.endswith('.chunks') and (
+                            os.path.exists(self._meta_path(upload_id))
+                            or os.path.exists(self._claim_path(upload_id))):
+                        continue
+                    if entry.stat().st_mtime < now - temp_age:
+                        os.remove(entry.path)
+            except FileNotFoundError:
+                continue    # discarded meanwhile
+        if removed:
+            logger.info("Removed %s abandoned chunked upload session(s)", removed)
+        return removed
@@ -0,0 +1,196 @@
+"""
+Transparent at-rest compression of uploaded files
+Compressible uploads (text, CSV, JSON, XML) are stored gzip or zstd
+compressed under their own name. A marker in the stream header (a gzip
+extra field, or a zstd skippable frame) records the original size, so a
+stored file is still a standard .gz / .zst stream that can be sent as-is
+with a Content-Encoding header, and files without the marker are read
+unchanged. Uploads that already start with a marker are refused (see
+android_api.store_upload), so a marker on disk was always written here.
+"""
+
+import gzip
+import os
+import struct
+import tempfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:     # optional, only needed for encoding = "zstd"
+    zstandard = None
+
+from streaming_upload import TEMP_PREFIX, TEMP_SUFFIX
+
+CHUNK_SIZE = 256 * 1024
+
+ENCODINGS = ('gzip', 'zstd')
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+# Marker payload: magic + original size
+MARKER = b'ACZ1'
+_PAYLOAD = struct.Struct('<4sQ')
+
+# gzip: magic, method, flags, mtime, xfl, os, xlen + one extra subfield
+_GZIP_HEADER = struct.Struct('<2sBBIBBH2sH')
+_GZIP_FEXTRA = 0x04
+_GZIP_SUBFIELD = b'AZ'
+# zstd: skippable frame magic, frame size
+_ZSTD_SKIPPABLE = struct.Struct('<II')
+_ZSTD_SKIPPABLE_MAGIC = 0x184D2A5A
+
+
+def _gzip_header(size):
+    return _GZIP_HEADER.pack(
+        b'\x1f\x8b', 8, _GZIP_FEXTRA, 0, 0, 255,
+        4 + _PAYLOAD.size, _GZIP_SUBFIELD, _PAYLOAD.size
+    ) + _PAYLOAD.pack(MARKER, size)
+
+
+def _zstd_header(size):
+    return _ZSTD_SKIPPABLE.pack(_ZSTD_SKIPPABLE_MAGIC, _PAYLOAD.size) + _PAYLOAD.pack(MARKER, size)
+
+
+# Everything before the size is constant
+_PREFIXES = (
+    ('gzip', _gzip_header(0)[:_GZIP_HEADER.size]),
+    ('zstd', _zstd_header(0)[:_ZSTD_SKIPPABLE.size]),
+)
+HEADER_SIZE = max(len(prefix) for _, prefix in _PREFIXES) + _PAYLOAD.size
+
+
+def read_marker(f):
+    """(encoding, original size) of a compressed stored file, or None"""
+    head = f.read(HEADER_SIZE)
+    for encoding, prefix in _PREFIXES:
+        payload = head[len(prefix):len(prefix) + _PAYLOAD.size]
+        if head.startswith(prefix) and len(payload) == _PAYLOAD.size:
+            magic, size = _PAYLOAD.unpack(payload)
+            if magic == MARKER:
+                return encoding, size
+    return None
+
+
+def stored_encoding(path):
+    """(encoding, original size) if `path` is stored compressed, else None"""
+    with open(path, 'rb') as f:
+        return read_marker(f)
+
+
+def original_size(path):
+    """Size of the file as uploaded"""
+    marker = stored_encoding(path)
+    return marker[1] if marker else os.path.getsize(path)
+
+
+class DecodedFile:
+    """Read-only file object giving the original bytes of a stored file"""
+
+    def __init__(self, reader, raw):
+        self._reader = reader
+        self._raw = raw
+
+    def read(self, size=-1):
+        return self._reader.read(size)
+
+    def close(self):
+        self._reader.close()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_stored(path):
+    """
+    Open a stored file for reading its original content.
+    Returns (file object, original size, os.stat_result of the stored file).
+    """
+    f = open(path, 'rb')
+    try:
+        st = os.fstat(f.fileno())
+        marker = read_marker(f)
+        if marker is None:
+            f.seek(0)
+            return f, st.st_size, st
+
+        encoding, size = marker
+        if encoding == 'gzip':
+            f.seek(0)
+            reader = gzip.GzipFile(fileobj=f, mode='rb')
+        else:
+            if zstandard is None:
+                raise RuntimeError(f"{path} is zstd compressed; install the zstandard package")
+            f.seek(_ZSTD_SKIPPABLE.size + _PAYLOAD.size)
+            reader = zstandard.ZstdDecompressor().stream_reader(f, closefd=False)
+        return DecodedFile(reader, f), size, st
+    except BaseException:
+        f.close()
+        raise
+
+
+def compress_file(src, dest, encoding, level):
+    """Write `src` compressed to `dest`, streaming; returns bytes written"""
+    with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+        size = os.fstat(fin.fileno()).st_size
+        if encoding == 'gzip':
+            fout.write(_gzip_header(size))
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            crc = 0
+            for chunk in iter(lambda: fin.read(CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                fout.write(compressor.compress(chunk))
+            fout.write(compressor.flush())
+            fout.write(struct.pack('<II', crc, size & 0xffffffff))
+        else:
+            fout.write(_zstd_header(size))
+            zstandard.ZstdCompressor(level=level).copy_stream(
+                fin, fout, size=size, read_size=CHUNK_SIZE
+            )
+        return fout.tell()
+
+
+class CompressedStore:
+    """Which uploads get compressed, and how"""
+
+    def __init__(self, encoding='gzip', level=None, extensions=('txt', 'csv', 'json', 'xml'),
+                 min_size=4096):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of: {', '.join(ENCODINGS)}")
+        if encoding == 'zstd' and zstandard is None:
+            raise ValueError("encoding \"zstd\" needs the zstandard package")
+        self.encoding = encoding
+        self.level = level if level is not None else DEFAULT_LEVELS[encoding]
+        self.extensions = set(extensions)
+        self.min_size = min_size
+
+    def compressible(self, filename):
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.extensions
+
+    def compress(self, temp_path, filename, size):
+        """
+        Replace the finished upload at `temp_path` by its compressed form
+        if `filename` is a compressible type and compressing saves space.
+        Returns the bytes now stored at `temp_path`.
+        """
+        if size < self.min_size or not self.compressible(filename):
+            return size
+
+        fd, packed = tempfile.mkstemp(
+            dir=os.path.dirname(temp_path), prefix=TEMP_PREFIX, suffix=TEMP_SUFFIX
+        )
+        os.close(fd)
+        try:
+            stored = compress_file(temp_path, packed, self.encoding, self.level)
+            if stored >= size:
+                os.remove(packed)
+                return size
+            os.replace(packed, temp_path)
+            return stored
+        except BaseException:
+            if os.path.exists(packed):
+                os.remove(packed)
+            raise
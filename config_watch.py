@@ -0,0 +1,165 @@
+"""
+Settings that can change without restarting the API
+The limits administrators tune during a term (file size, quota, rate
+limit, allowed extensions, log level) are derived from config.toml into
+one Limits object. ConfigWatcher re-reads the file when it changes, or
+after SIGHUP, validates it and swaps in a new Limits object with a
+single assignment: a request keeps the snapshot it started with, so an
+upload already in progress finishes under the limits it was accepted
+under.
+"""
+
+import logging
+import threading
+import time
+import tomllib
+
+from token_store import file_signature
+
+logger = logging.getLogger(__name__)
+
+# (section, key) pairs applied by a reload; anything else needs a restart
+RELOADABLE = {
+    ('storage', 'max_file_size_mb'),
+    ('storage', 'student_quota_mb'),
+    ('storage', 'rate_limit'),
+    ('storage', 'allowed_extensions'),
+    ('security', 'enable_rate_limiting'),
+    ('logging', 'level'),
+}
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+
+class ConfigError(ValueError):
+    """config.toml is readable but one of its values is not usable"""
+
+
+def _positive(section, config, key):
+    value = config[section][key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ConfigError(f"[{section}] {key} must be a positive number, not {value!r}")
+    return value
+
+
+class Limits:
+    """One consistent set of reloadable settings (treat as read-only)"""
+
+    def __init__(self, config):
+        storage = config['storage']
+        self.max_file_size = int(_positive('storage', config, 'max_file_size_mb') * 1024 * 1024)
+        self.student_quota = int(_positive('storage', config, 'student_quota_mb') * 1024 * 1024)
+        self.rate_limit = _positive('storage', config, 'rate_limit')
+        if not isinstance(self.rate_limit, int):
+            raise ConfigError("[storage] rate_limit must be a whole number")
+        self.allowed_extensions = frozenset(
+            ext.strip().lower() for ext in storage['allowed_extensions'].split(',') if ext.strip()
+        )
+        if not self.allowed_extensions:
+            raise ConfigError("[storage] allowed_extensions is empty")
+        self.rate_limiting = bool(config['security']['enable_rate_limiting'])
+        self.log_level = config['logging']['level']
+        if self.log_level not in LOG_LEVELS:
+            raise ConfigError(f"[logging] level must be one of: {', '.join(LOG_LEVELS)}")
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def _flatten(config):
+    return {
+        (section, key): value
+        for section, values in config.items() if isinstance(values, dict)
+        for key, value in values.items()
+    }
+
+
+def restart_only_changes(old, new):
+    """Sorted "section.key" names changed between two configs that a reload can't apply"""
+    old, new = _flatten(old), _flatten(new)
+    return sorted(
+        f"{section}.{key}" for section, key in old.keys() | new.keys()
+        if (section, key) not in RELOADABLE and old.get((section, key)) != new.get((section, key))
+    )
+
+
+class ConfigWatcher:
+    """
+    The current Limits of this process. config.toml is stat'ed at most
+    once every `check_interval_ms` (the same way TokenIndex watches
+    tokens.json); request_reload() forces a re-read on the next check
+    and is safe to call from a signal handler. With no `path` the
+    limits never change.
+
+    A file that fails to parse or validate is logged and ignored; the
+    previous settings stay in force until the file changes again.
+    """
+
+    def __init__(self, path, config, check_interval_ms=2000):
+        self.path = path
+        self.config = config
+        self.limits = Limits(config)
+        self.check_interval = check_interval_ms / 1000.0
+        self._signature = file_signature(path) if path else None
+        self._next_check = time.monotonic() + self.check_interval
+        self._forced = False
+        self._lock = threading.Lock()
+        self._listeners = []
+        # Counter for metrics (this process only)
+        self.reloads = 0
+
+    def on_reload(self, callback):
+        """Call `callback(limits)` after each successful reload"""
+        self._listeners.append(callback)
+
+    def request_reload(self, *_signal_args):
+        self._forced = True
+        self._next_check = 0.0
+
+    def current(self):
+        """Limits to use for a request"""
+        if self.path and time.monotonic() >= self._next_check:
+            self._check()
+        return self.limits
+
+    def _check(self):
+        # One thread checks; the others keep serving with the current limits
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            signature = file_signature(self.path)
+            if signature == self._signature and not self._forced:
+                return
+            self._signature = signature
+            self._forced = False
+            self.reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """Re-read config.toml now; returns True if new limits were applied"""
+        try:
+            config = load(self.path)
+            limits = Limits(config)
+        except (OSError, tomllib.TOMLDecodeError, ConfigError, KeyError, AttributeError) as e:
+            logger.error("config.toml not reloaded, keeping current settings: %r", e)
+            return False
+
+        pending = restart_only_changes(self.config, config)
+        if pending:
+            logger.warning("config.toml changes that need a restart: %s", ', '.join(pending))
+
+        self.config = config
+        self.limits = limits
+        self.reloads += 1
+        for callback in self._listeners:
+            callback(limits)
+        logger.info(
+            "config.toml reloaded - max file %s MB, quota %s MB, rate limit %s/min, log level %s",
+            limits.max_file_size // (1024 * 1024), limits.student_quota // (1024 * 1024),
+            limits.rate_limit, limits.log_level
+        )
+        return True
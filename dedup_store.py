@@ -0,0 +1,172 @@
+"""
+Content-addressed, deduplicated file storage
+Every stored file is a hardlink to a blob in a sharded object directory
+(`<upload_dir>/.objects/ab/cd/<sha256>`), so identical uploads from any
+student share the same bytes on disk. Student directories still hold
+ordinary files, so downloads and listings work unchanged.
+
+A per-student manifest (NetID, filename -> sha256, size, upload time) is
+kept in SQLite; it preserves each upload's own timestamp (hardlinks share
+one mtime) and tells whether a student already holds a given blob.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OBJECTS_DIRNAME = '.objects'
+HASH_BLOCK = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ObjectStore:
+    """Sharded blob directory plus per-student name -> hash manifests"""
+
+    def __init__(self, upload_dir, db_path):
+        self.objects_dir = os.path.join(upload_dir, OBJECTS_DIRNAME)
+        self.db_path = db_path
+        self._local = threading.local()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " netid TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " uploaded_ns INTEGER NOT NULL,"
+            " PRIMARY KEY (netid, name))"
+        )
+
+    def _connect(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:4], sha256)
+
+    def holds(self, netid, sha256):
+        """True if `netid` already has a file with this content"""
+        return self._connect().execute(
+            "SELECT 1 FROM manifest WHERE netid = ? AND sha256 = ? LIMIT 1",
+            (netid, sha256)
+        ).fetchone() is not None
+
+    def link(self, temp_path, dest_path, sha256):
+        """
+        Publish `temp_path` at `dest_path` (replacing whatever is there) as
+        a link to the blob for `sha256`. If the blob already exists the
+        temp file is discarded, otherwise it becomes the blob.
+        Returns True if the bytes were deduplicated.
+        """
+        obj = self.object_path(sha256)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        # Link to the blob under a temp name first so dest_path is swapped
+        # in one rename, whether or not it exists
+        stem, suffix = os.path.splitext(temp_path)
+        link_path = f"{stem}-link{suffix}"
+
+        for _ in range(3):
+            try:
+                os.link(obj, link_path)
+            except FileNotFoundError:
+                # New content: the temp file becomes the blob
+                try:
+                    os.link(temp_path, obj)
+                except FileExistsError:
+                    continue    # another worker stored it first; link to theirs
+                os.replace(temp_path, dest_path)
+                return False
+            os.replace(link_path, dest_path)
+            if os.path.lexists(link_path):
+                # dest_path already was this blob; rename() left both names
+                os.remove(link_path)
+            os.remove(temp_path)
+            return True
+
+        raise RuntimeError(f"Could not link object {sha256}")
+
+    def record(self, netid, name, sha256, size, uploaded_ns=None):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO manifest (netid, name, sha256, size, uploaded_ns) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (netid, name, sha256, size, uploaded_ns or time.time_ns())
+        )
+
+    def lookup(self, netid, name):
+        """Manifest row (sha256, size, uploaded_ns) for a file, or None"""
+        return self._connect().execute(
+            "SELECT sha256, size, uploaded_ns FROM manifest WHERE netid = ? AND name = ?",
+            (netid, name)
+        ).fetchone()
+
+    def upload_times(self, netid):
+        """{filename: uploaded_ns} for every manifest entry of `netid`"""
+        return dict(self._connect().execute(
+            "SELECT name, uploaded_ns FROM manifest WHERE netid = ?", (netid,)
+        ))
+
+    def forget(self, netid, name):
+        """
+        Drop a deleted file from the manifest and release its blob if no
+        student links to it anymore. Returns the file's sha256, or None if
+        it was not in the manifest.
+        """
+        row = self.lookup(netid, name)
+        if row is None:
+            return None
+        sha256 = row[0]
+        self._connect().execute(
+            "DELETE FROM manifest WHERE netid = ? AND name = ?", (netid, name)
+        )
+        self.release(sha256)
+        return sha256
+
+    def forget_student(self, netid):
+        """
+        Drop every manifest entry of `netid` (directory removed); their
+        blobs are freed by the next collect_garbage()
+        """
+        self._connect().execute("DELETE FROM manifest WHERE netid = ?", (netid,))
+
+    def release(self, sha256):
+        """Remove the blob once the store holds the only link to it"""
+        obj = self.object_path(sha256)
+        try:
+            if os.stat(obj).st_nlink == 1:
+                os.remove(obj)
+        except FileNotFoundError:
+            pass
+
+    def collect_garbage(self):
+        """Remove every blob no student file links to; returns bytes freed"""
+        freed = 0
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                if st.st_nlink == 1:
+                    os.remove(path)
+                    freed += st.st_size
+        return freed
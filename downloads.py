@@ -0,0 +1,276 @@
+"""
+File download responses with conditional and range request support
+Serves strong ETags / Last-Modified, answers 304, 206 (single and
+multi-range) and 416, and can hand the byte pushing off to the front-end
+web server (X-Sendfile / X-Accel-Redirect) or to the WSGI server's
+sendfile() support. Files stored compressed (compressed_store.py) are
+sent as-is with a Content-Encoding to clients that accept it and
+decompressed on the fly for the rest.
+"""
+
+import mimetypes
+import os
+import secrets
+from datetime import datetime, timezone
+
+from flask import Response
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header
+from werkzeug.wsgi import wrap_file
+
+CHUNK_SIZE = 256 * 1024
+
+# More ranges than this in one request is not a resume; serve the whole file
+MAX_RANGES = 16
+
+# Download modes
+MODE_SENDFILE = 'sendfile'              # wsgi.file_wrapper (gunicorn uses os.sendfile)
+MODE_X_SENDFILE = 'x-sendfile'          # Apache mod_xsendfile
+MODE_X_ACCEL = 'x-accel-redirect'       # nginx internal location
+MODES = (MODE_SENDFILE, MODE_X_SENDFILE, MODE_X_ACCEL)
+
+
+def make_etag(st):
+    """Strong validator derived from inode, mtime and size"""
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _base_headers(download_name, st, etag):
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    return {
+        'Content-Type': mimetype,
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',
+    }
+
+
+def _resolve_ranges(http_range, length):
+    """
+    Turn a Range header into a list of (start, stop) byte offsets.
+
+    Returns None when the header should be ignored (absent, malformed or
+    too many ranges) and [] when no range is satisfiable.
+    """
+    if not http_range:
+        return None
+    units, _, spec = http_range.partition('=')
+    if units.strip().lower() != 'bytes' or not spec:
+        return None
+
+    specs = [s.strip() for s in spec.split(',') if s.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for item in specs:
+        first, sep, last = item.partition('-')
+        if not sep:
+            return None
+        try:
+            if first == '':
+                # Suffix range: the last N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, stop = max(length - suffix, 0), length
+            else:
+                start = int(first)
+                if last:
+                    stop = int(last) + 1
+                    if stop <= start:
+                        return None
+                else:
+                    stop = length
+                stop = min(stop, length)
+        except ValueError:
+            return None
+        if start < length:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _if_range_matches(environ, etag, st):
+    header = environ.get('HTTP_IF_RANGE')
+    if not header:
+        return True
+    if_range = parse_if_range_header(header)
+    if if_range.etag is not None:
+        # If-Range requires a strong comparison
+        return header.strip() == f'"{etag}"'
+    if if_range.date is not None:
+        last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+        return if_range.date == last_modified
+    return False
+
+
+def _read_range(f, start, stop):
+    fd = f.fileno()
+    pos = start
+    while pos < stop:
+        chunk = os.pread(fd, min(CHUNK_SIZE, stop - pos), pos)
+        if not chunk:
+            break
+        pos += len(chunk)
+        yield chunk
+
+
+def _multipart_body(filepath, ranges, length, content_type, boundary):
+    with open(filepath, 'rb') as f:
+        for start, stop in ranges:
+            yield (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n"
+            ).encode('latin-1')
+            yield from _read_range(f, start, stop)
+        yield f"\r\n--{boundary}--\r\n".encode('latin-1')
+
+
+def _multipart_length(ranges, length, content_type, boundary):
+    total = len(f"\r\n--{boundary}--\r\n")
+    for start, stop in ranges:
+        total += len(
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n"
+        )
+        total += stop - start
+    return total
+
+
+def serve_file(environ, filepath, download_name, mode=MODE_SENDFILE,
+               base_dir=None, accel_prefix=None, content_encoding=None):
+    """
+    Build the download response for `filepath`.
+
+    `base_dir` and `accel_prefix` are only used in x-accel-redirect mode,
+    where the file's path relative to `base_dir` is appended to the
+    internal nginx location `accel_prefix`. `content_encoding` marks the
+    file as the compressed representation of `download_name`; ranges then
+    apply to the compressed bytes.
+    """
+    st = os.stat(filepath)
+    length = st.st_size
+    etag = make_etag(st)
+    if content_encoding:
+        etag = f"{etag}-{content_encoding}"
+    headers = _base_headers(download_name, st, etag)
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+        headers['Vary'] = 'Accept-Encoding'
+        # Front-end servers don't reliably pass Content-Encoding through
+        # an internal redirect, so these are always sent from here
+        mode = MODE_SENDFILE
+
+    if not is_resource_modified(environ, etag=etag, last_modified=http_date(st.st_mtime)):
+        del headers['Content-Type'], headers['Content-Disposition']
+        return Response(status=304, headers=headers)
+
+    # Let the front-end server push the bytes (and handle Range itself)
+    if mode == MODE_X_SENDFILE:
+        headers['X-Sendfile'] = os.path.abspath(filepath)
+        return Response(status=200, headers=headers)
+    if mode == MODE_X_ACCEL:
+        relative = os.path.relpath(filepath, base_dir)
+        headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative}"
+        return Response(status=200, headers=headers)
+
+    ranges = None
+    if environ.get('REQUEST_METHOD') in ('GET', 'HEAD') and _if_range_matches(environ, etag, st):
+        ranges = _resolve_ranges(environ.get('HTTP_RANGE'), length)
+
+    if ranges == []:
+        headers['Content-Range'] = f"bytes */{length}"
+        del headers['Content-Disposition']
+        return Response(status=416, headers=headers)
+
+    if ranges and len(ranges) > 1:
+        content_type = headers['Content-Type']
+        boundary = secrets.token_hex(16)
+        headers['Content-Type'] = f"multipart/byteranges; boundary={boundary}"
+        headers['Content-Length'] = str(
+            _multipart_length(ranges, length, content_type, boundary)
+        )
+        body = _multipart_body(filepath, ranges, length, content_type, boundary)
+        return Response(body, status=206, headers=headers, direct_passthrough=True)
+
+    # Full file or a single range. The WSGI file wrapper lets gunicorn
+    # sendfile() Content-Length bytes from the current file offset.
+    f = open(filepath, 'rb')
+    if ranges:
+        start, stop = ranges[0]
+        f.seek(start)
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{length}"
+        headers['Content-Length'] = str(stop - start)
+        status = 206
+        body = _LimitedFile(f, stop - start)
+    else:
+        headers['Content-Length'] = str(length)
+        status = 200
+        body = f
+
+    return Response(
+        wrap_file(environ, body, CHUNK_SIZE), status=status,
+        headers=headers, direct_passthrough=True
+    )
+
+
+def serve_decoded(environ, stored, size, st, download_name):
+    """
+    Stream the original bytes of a compressed file to a client that did
+    not accept its encoding. `stored` is the open decoded file, `size` the
+    original size and `st` the stat of the compressed file. Ranges are
+    not offered, since seeking means decompressing everything before.
+    """
+    etag = make_etag(st)
+    headers = _base_headers(download_name, st, etag)
+    headers['Accept-Ranges'] = 'none'
+    headers['Vary'] = 'Accept-Encoding'
+
+    if not is_resource_modified(environ, etag=etag, last_modified=http_date(st.st_mtime)):
+        stored.close()
+        del headers['Content-Type'], headers['Content-Disposition']
+        return Response(status=304, headers=headers)
+
+    headers['Content-Length'] = str(size)
+    return Response(
+        wrap_file(environ, stored, CHUNK_SIZE), status=200,
+        headers=headers, direct_passthrough=True
+    )
+
+
+class _LimitedFile:
+    """
+    File proxy that stops reading after `remaining` bytes.
+
+    Exposes fileno() so sendfile-capable servers still take the zero-copy
+    path (they honour Content-Length); plain iteration stops at the range
+    end.
+    """
+
+    def __init__(self, f, remaining):
+        self._f = f
+        self._remaining = remaining
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def tell(self):
+        return self._f.tell()
+
+    def seek(self, *args):
+        return self._f.seek(*args)
+
+    def close(self):
+        self._f.close()
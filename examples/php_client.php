@@ -13,6 +13,7 @@
 // Configuration
 define('API_BASE_URL', 'https://yourserver.yourdomain.edu/android');
 define('STUDENT_TOKEN', 'your_token_here'); // Replace with actual student token
+define('BATCH_SIZE', 20); // Files per batch upload request (server max_batch_files)
 
 /**
  * Make API request
@@ -32,7 +33,14 @@ function apiRequest($endpoint, $method = 'GET', $data = null, $file = null) {
     if ($method === 'POST') {
         curl_setopt($ch, CURLOPT_POST, true);
         
-        if ($file) {
+        if (is_array($file)) {
+            // Batch upload: files[0], files[1], ...
+            $postData = [];
+            foreach (array_values($file) as $i => $path) {
+                $postData["files[$i]"] = new CURLFile($path, mime_content_type($path), basename($path));
+            }
+            curl_setopt($ch, CURLOPT_POSTFIELDS, $postData);
+        } elseif ($file) {
             // File upload
             $postData = [
                 'file' => new CURLFile($file, mime_content_type($file), basename($file))
@@ -253,16 +261,27 @@ echo "\n";
  */
 function batchUpload($directory) {
     echo "=== Batch Upload from Directory ===\n";
-    $files = glob($directory . '/*');
+    $files = array_values(array_filter(glob($directory . '/*'), 'is_file'));
     $uploaded = 0;
     $failed = 0;
     
-    foreach ($files as $file) {
-        if (is_file($file)) {
-            echo "Uploading: " . basename($file) . "... ";
-            if (uploadFile($file)) {
+    // One request per BATCH_SIZE files instead of one per file
+    foreach (array_chunk($files, BATCH_SIZE) as $batch) {
+        echo "Uploading " . count($batch) . " files... ";
+        $result = apiRequest('/upload/batch', 'POST', null, $batch);
+        
+        if ($result['http_code'] !== 201 && $result['http_code'] !== 207) {
+            echo "[FAIL] HTTP " . $result['http_code'] . ": " . $result['raw'] . "\n";
+            $failed += count($batch);
+            continue;
+        }
+        echo "done\n";
+        
+        foreach ($result['data']['files'] as $entry) {
+            if ($entry['status'] === 201) {
                 $uploaded++;
             } else {
+                echo "  [FAIL] " . $entry['filename'] . ": " . $entry['error'] . "\n";
                 $failed++;
             }
         }
@@ -284,25 +303,25 @@ function backupAllFiles($backupDir) {
         mkdir($backupDir, 0755, true);
     }
     
-    $result = apiRequest('/list');
-    if ($result['http_code'] !== 200) {
-        echo "[FAIL] Failed to list files\n";
-        return;
-    }
+    // One request: the server streams every file as a single ZIP
+    $savePath = $backupDir . '/backup-' . date('Ymd-His') . '.zip';
+    $fp = fopen($savePath, 'w');
     
-    $files = $result['data']['files'];
-    echo "Found " . count($files) . " files to backup\n";
+    $ch = curl_init(API_BASE_URL . '/archive?compression=store');
+    curl_setopt($ch, CURLOPT_HTTPHEADER, ['X-Auth-Token: ' . STUDENT_TOKEN]);
+    curl_setopt($ch, CURLOPT_FILE, $fp);
+    curl_exec($ch);
+    $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+    curl_close($ch);
+    fclose($fp);
     
-    foreach ($files as $file) {
-        $savePath = $backupDir . '/' . $file['name'];
-        echo "Downloading: " . $file['name'] . "... ";
-        if (downloadFile($file['name'], $savePath)) {
-            echo "[OK]\n";
-        } else {
-            echo "[FAIL]\n";
-        }
+    if ($httpCode !== 200) {
+        unlink($savePath);
+        echo "[FAIL] Backup failed (HTTP $httpCode)\n\n";
+        return;
     }
     
+    echo "[OK] Saved " . filesize($savePath) . " bytes to $savePath\n";
     echo "Backup complete!\n\n";
 }
 
@@ -0,0 +1,14 @@
+"""
+gunicorn settings, read from the working directory (android-api.service)
+Command-line options given in ExecStart override these.
+"""
+
+# Build the app (token index, quota ledger, caches) once in the master;
+# workers fork from it instead of each importing app.py
+preload_app = True
+
+
+def post_worker_init(worker):
+    # Each worker resets SIGHUP to its default after the fork; re-arm the
+    # config.toml reload that `systemctl reload` triggers
+    worker.wsgi.extensions['android_api'].install_reload_signal()
@@ -0,0 +1,143 @@
+"""
+Per-student directory listing cache for /android/list
+A cached listing is reused until the student's directory mtime changes,
+which happens on every create/rename/unlink from any worker, so checking
+freshness costs a single stat()
+"""
+
+import base64
+import binascii
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from name_index import is_placeholder
+
+
+class Listing:
+    """Files of one student directory, newest first"""
+
+    def __init__(self, signature, entries):
+        self.signature = signature
+        # entries: list of (-mtime_ns, name, size, modified_iso)
+        self.entries = entries
+        self.keys = [(e[0], e[1]) for e in entries]
+
+    def etag_base(self):
+        ino, mtime_ns = self.signature
+        return f"{ino:x}-{mtime_ns:x}-{len(self.entries):x}"
+
+    def page(self, cursor_key=None, since_ns=None, limit=None):
+        """Return (entries, next_cursor_key) for one page"""
+        start = 0
+        if cursor_key is not None:
+            start = bisect.bisect_right(self.keys, cursor_key)
+
+        end = len(self.entries)
+        if since_ns is not None:
+            # Newest first, so "modified after since" is a prefix
+            end = bisect.bisect_left(self.keys, (-since_ns, ''))
+
+        if limit is not None and start + limit < end:
+            selected = self.entries[start:start + limit]
+            last = selected[-1]
+            return selected, (last[0], last[1])
+        return self.entries[start:end], None
+
+
+class ListingCache:
+    """LRU of Listing objects keyed by NetID, validated by directory stat"""
+
+    def __init__(self, max_students=512, skip=None, upload_times=None, size_of=None):
+        self.max_students = max_students
+        self.skip = skip
+        # Optional netid -> {filename: mtime_ns} overriding the file mtime
+        # (deduplicated files share one inode, hence one mtime)
+        self.upload_times = upload_times
+        # Optional (DirEntry, stat) -> size overriding st_size (files
+        # stored compressed are listed with their original size)
+        self.size_of = size_of
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, netid, student_dir):
+        st = os.stat(student_dir)
+        signature = (st.st_ino, st.st_mtime_ns)
+
+        with self._lock:
+            listing = self._listings.get(netid)
+            if listing is not None and listing.signature == signature:
+                self._listings.move_to_end(netid)
+                return listing
+
+        listing = Listing(signature, self._scan(netid, student_dir))
+
+        with self._lock:
+            self._listings[netid] = listing
+            self._listings.move_to_end(netid)
+            while len(self._listings) > self.max_students:
+                self._listings.popitem(last=False)
+        return listing
+
+    def invalidate(self, netid):
+        with self._lock:
+            self._listings.pop(netid, None)
+
+    def _scan(self, netid, student_dir):
+        overrides = self.upload_times(netid) if self.upload_times else {}
+        entries = []
+        for entry in os.scandir(student_dir):
+            if not entry.is_file() or (self.skip and self.skip(entry.name)):
+                continue
+            stat = entry.stat()
+            if is_placeholder(stat):
+                continue    # reserved for an upload that isn't in place yet
+            mtime_ns = overrides.get(entry.name, stat.st_mtime_ns)
+            entries.append((
+                -mtime_ns,
+                entry.name,
+                self.size_of(entry, stat) if self.size_of else stat.st_size,
+                datetime.fromtimestamp(mtime_ns / 1e9).isoformat()
+            ))
+        entries.sort()
+        return entries
+
+
+def encode_cursor(key):
+    neg_mtime_ns, name = key
+    raw = f"{-neg_mtime_ns}:{name}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a bad cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        mtime_ns, name = raw.split(':', 1)
+        return (-int(mtime_ns), name)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_since(value):
+    """
+    `since` as epoch seconds or an ISO timestamp (as returned in
+    `modified`), returned in ns. Compared at microsecond resolution, so
+    passing back a file's own `modified` value excludes that file.
+    """
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    try:
+        if seconds is None:
+            dt = datetime.fromisoformat(value)
+        else:
+            dt = datetime.fromtimestamp(seconds)
+        micros = round(dt.timestamp() * 1_000_000)
+    except (OverflowError, OSError) as e:
+        # inf, nan, or too far out for the platform's time functions
+        raise ValueError(f'since out of range: {value}') from e
+    return micros * 1000 + 999
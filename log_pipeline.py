@@ -0,0 +1,222 @@
+"""
+Non-blocking JSON-lines logging
+Request threads only put records on a queue; a background thread formats
+them as JSON lines and appends them to the log file in batches. Appends
+use O_APPEND with one write() per batch and rotation is coordinated with
+an flock, so several gunicorn workers can share one log file.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+# Structured fields copied from `extra=` onto the JSON record when present
+STRUCTURED_FIELDS = ('netid', 'endpoint', 'method', 'status', 'bytes', 'latency_ms', 'remote_addr')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, separators=(',', ':'))
+
+
+class BatchFileWriter:
+    """
+    Appends batches of formatted lines to a file shared between processes,
+    rotating it (path -> path.1 -> ... path.N) once it exceeds max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock_path = path + '.lock'
+        self._fd = None
+        self._ino = None
+        self._open()
+
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._ino = os.fstat(self._fd).st_ino
+
+    def write(self, lines):
+        data = ('\n'.join(lines) + '\n').encode('utf-8', 'backslashreplace')
+
+        # Another process may have rotated the file under us
+        try:
+            if os.stat(self.path).st_ino != self._ino:
+                self._open()
+        except FileNotFoundError:
+            self._open()
+
+        size = os.fstat(self._fd).st_size
+        if self.max_bytes and size and size + len(data) > self.max_bytes:
+            self._rotate(len(data))
+        os.write(self._fd, data)
+
+    def _rotate(self, incoming):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Re-check: another worker may have rotated while we waited
+                size = os.stat(self.path).st_size
+                if size and size + incoming > self.max_bytes:
+                    for i in range(self.backup_count - 1, 0, -1):
+                        src = f"{self.path}.{i}"
+                        if os.path.exists(src):
+                            os.replace(src, f"{self.path}.{i + 1}")
+                    if self.backup_count > 0:
+                        os.replace(self.path, f"{self.path}.1")
+                    else:
+                        os.truncate(self.path, 0)
+            except FileNotFoundError:
+                pass
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._open()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class BatchingQueueListener(threading.Thread):
+    """
+    Drains the log queue, writing up to `batch_size` records at once to
+    the file and passing each record to any extra handlers (console).
+    Flushes at least every `flush_interval` seconds.
+    """
+
+    _STOP = object()
+
+    def __init__(self, log_queue, writer, formatter, handlers=(),
+                 batch_size=100, flush_interval=0.5):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = log_queue
+        self.writer = writer
+        self.formatter = formatter
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while not stopping:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                record = self.queue.get(timeout=timeout)
+                if record is self._STOP:
+                    stopping = True
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+
+            if batch and (stopping or len(batch) >= self.batch_size
+                          or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                continue
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        try:
+            self.writer.write(lines)
+        except OSError:
+            # Never let logging take the API down
+            pass
+
+    def stop(self):
+        if self.is_alive():
+            self.queue.put(self._STOP)
+            self.join(timeout=5)
+        self.writer.close()
+
+    def respawn(self, log_queue):
+        """Started copy of this listener draining `log_queue` (after a fork)"""
+        listener = BatchingQueueListener(
+            log_queue, self.writer, self.formatter, self.handlers,
+            batch_size=self.batch_size, flush_interval=self.flush_interval
+        )
+        listener.start()
+        return listener
+
+
+def setup_json_logging(log_file, level, console_format, batch_size=100,
+                       flush_interval_ms=500, max_bytes_mb=50, backup_count=5):
+    """
+    Route the root logger through a queue to a batched JSON-lines writer.
+    Returns the started listener (stopped automatically at exit). A
+    forked child (gunicorn --preload worker) gets a listener of its own.
+    """
+    log_queue = queue.SimpleQueue()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(console_format))
+    # Per-request access records go to the file only
+    console.addFilter(lambda record: not record.name.endswith('.access'))
+
+    listener = BatchingQueueListener(
+        log_queue,
+        BatchFileWriter(log_file, max_bytes_mb * 1024 * 1024, backup_count),
+        JsonFormatter(),
+        handlers=[console],
+        batch_size=batch_size,
+        flush_interval=flush_interval_ms / 1000.0
+    )
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    def after_fork():
+        # Threads don't survive fork(): start a writer for this process,
+        # on a fresh queue so records the parent had queued aren't repeated
+        child_queue = queue.SimpleQueue()
+        queue_handler.queue = child_queue
+        atexit.register(listener.respawn(child_queue).stop)
+
+    os.register_at_fork(after_in_child=after_fork)
+    return listener
@@ -0,0 +1,270 @@
+"""
+Prometheus-style metrics shared across gunicorn workers
+Each worker counts in memory and periodically snapshots its totals to
+`<state_dir>/metrics/<pid>.json`. A scrape (served by any worker) sums
+every snapshot, so the numbers cover all workers. Snapshots of workers
+that have exited are folded into `retired.json` so counters never go
+backwards while the file count stays bounded.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+
+# Request latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+RETIRED = 'retired.json'
+
+HELP = {
+    'android_api_requests_total': ('counter', 'Requests by endpoint, method and status'),
+    'android_api_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'android_api_bytes_received_total': ('counter', 'Request body bytes by endpoint'),
+    'android_api_bytes_sent_total': ('counter', 'Response body bytes by endpoint'),
+    'android_api_rate_limit_rejections_total': ('counter', 'Requests rejected by the upload rate limit'),
+    'android_api_quota_rejections_total': ('counter', 'Uploads rejected for exceeding the student quota'),
+    'android_api_token_lookups_total': ('counter', 'Token validations by result'),
+    'android_api_token_index_reloads_total': ('counter', 'Times the token index was reloaded'),
+    'android_api_config_reloads_total': ('counter', 'Times config.toml was reloaded'),
+    'android_api_thumbnails_total': ('counter', 'Thumbnails served from the cache and previews generated'),
+    'android_api_row_index_builds_total': ('counter', 'Row-offset indexes built for /android/read'),
+}
+
+
+def _key(name, labels):
+    return f"{name}|{json.dumps(sorted(labels.items()))}" if labels else name
+
+
+def _split(key):
+    name, _, labels = key.partition('|')
+    return name, dict(json.loads(labels)) if labels else {}
+
+
+def _merge(into, snapshot):
+    for key, value in snapshot.get('counters', {}).items():
+        into['counters'][key] = into['counters'].get(key, 0) + value
+    for key, hist in snapshot.get('histograms', {}).items():
+        mine = into['histograms'].get(key)
+        if mine is None or len(mine['buckets']) != len(hist['buckets']):
+            into['histograms'][key] = {
+                'buckets': list(hist['buckets']), 'sum': hist['sum'], 'count': hist['count']
+            }
+        else:
+            mine['buckets'] = [a + b for a, b in zip(mine['buckets'], hist['buckets'])]
+            mine['sum'] += hist['sum']
+            mine['count'] += hist['count']
+
+
+def _empty():
+    return {'counters': {}, 'histograms': {}}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Per-worker counters and histograms with cross-worker aggregation"""
+
+    def __init__(self, state_dir, flush_interval=1.0, buckets=DEFAULT_BUCKETS):
+        self.dir = state_dir
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._data = _empty()
+        self._pid = os.getpid()
+        self._next_flush = 0.0
+        self._collectors = []
+        os.makedirs(state_dir, exist_ok=True)
+
+    def add_collector(self, collect):
+        """
+        Register `collect()` -> iterable of (name, labels, value) for
+        counters kept elsewhere in this process; polled at every flush.
+        """
+        self._collectors.append(collect)
+
+    def inc(self, name, labels=None, value=1):
+        key = _key(name, labels)
+        with self._lock:
+            counters = self._data['counters']
+            counters[key] = counters.get(key, 0) + value
+
+    def set_total(self, name, value, labels=None):
+        """Record a counter maintained elsewhere in this process (absolute value)"""
+        with self._lock:
+            self._data['counters'][_key(name, labels)] = value
+
+    def observe(self, name, value, labels=None):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._data['histograms'].get(key)
+            if hist is None:
+                hist = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._data['histograms'][key] = hist
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def observe_request(self, endpoint, method, status, seconds, bytes_in, bytes_out):
+        """Instrumentation for one finished request"""
+        endpoint = endpoint or 'unknown'
+        self.inc('android_api_requests_total',
+                 {'endpoint': endpoint, 'method': method, 'status': str(status)})
+        self.observe('android_api_request_duration_seconds', seconds, {'endpoint': endpoint})
+        if bytes_in:
+            self.inc('android_api_bytes_received_total', {'endpoint': endpoint}, bytes_in)
+        if bytes_out:
+            self.inc('android_api_bytes_sent_total', {'endpoint': endpoint}, bytes_out)
+        if status == 429:
+            self.inc('android_api_rate_limit_rejections_total')
+        elif status == 507:
+            self.inc('android_api_quota_rejections_total')
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        # Skip rather than queue up behind a flush already in progress
+        if time.monotonic() >= self._next_flush and self._flush_lock.acquire(blocking=False):
+            try:
+                self._flush()
+            finally:
+                self._flush_lock.release()
+
+    def flush(self):
+        """Write this worker's snapshot for other workers to read"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            # Forked after counting started: the parent's numbers are not ours
+            with self._lock:
+                self._data = _empty()
+            self._pid = pid
+
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                self.set_total(name, value, labels)
+
+        with self._lock:
+            data = json.dumps(self._data)
+        path = os.path.join(self.dir, f"{pid}.json")
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    def collect(self):
+        """Sum the snapshots of every worker, past and present"""
+        self.flush()
+        total = _empty()
+
+        lock_path = os.path.join(self.dir, '.lock')
+        with open(lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                retired_path = os.path.join(self.dir, RETIRED)
+                retired = self._read(retired_path) or _empty()
+                retired_changed = False
+
+                for entry in os.scandir(self.dir):
+                    stem, ext = os.path.splitext(entry.name)
+                    if ext != '.json' or not stem.isdigit():
+                        continue
+                    snapshot = self._read(entry.path)
+                    if snapshot is None:
+                        continue
+                    if _pid_alive(int(stem)):
+                        _merge(total, snapshot)
+                    else:
+                        _merge(retired, snapshot)
+                        os.remove(entry.path)
+                        retired_changed = True
+
+                if retired_changed:
+                    tmp = retired_path + '.tmp'
+                    with open(tmp, 'w') as f:
+                        json.dump(retired, f)
+                    os.replace(tmp, retired_path)
+                _merge(total, retired)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return total
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def render(self, gauges=()):
+        """
+        Prometheus text exposition of all workers' metrics plus `gauges`,
+        an iterable of (name, help, labels, value) computed at scrape time.
+        """
+        data = self.collect()
+        families = {}
+
+        for key, value in sorted(data['counters'].items()):
+            name, labels = _split(key)
+            families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for key, hist in sorted(data['histograms'].items()):
+            name, labels = _split(key)
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {hist['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+
+        out = []
+        for name in sorted(families):
+            kind, text = HELP.get(name, ('untyped', name))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(families[name])
+
+        gauge_lines = {}
+        for name, text, labels, value in gauges:
+            if name not in gauge_lines:
+                gauge_lines[name] = [f"# HELP {name} {text}", f"# TYPE {name} gauge"]
+            gauge_lines[name].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name in sorted(gauge_lines):
+            out.extend(gauge_lines[name])
+
+        return '\n'.join(out) + '\n'
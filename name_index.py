@@ -0,0 +1,139 @@
+"""
+Per-student filename counters
+Hands out the next free `name_N.ext` for an upload whose name is taken
+without probing name_1, name_2, ... on disk, and reserves it with an
+O_EXCL create so two workers can never pick the same name. The
+placeholder has no permission bits, which no stored upload has, so
+listings and downloads skip it until the upload replaces it.
+"""
+
+import os
+import re
+import sqlite3
+import stat
+import threading
+
+PLACEHOLDER_MODE = 0o000
+
+
+def create_exclusive(path):
+    """Create an empty placeholder at `path`; False if it already exists"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, PLACEHOLDER_MODE)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+
+def is_placeholder(st):
+    """True if stat result `st` is a name reserved for an upload still being staged"""
+    return st.st_size == 0 and stat.S_IMODE(st.st_mode) == PLACEHOLDER_MODE
+
+
+def highest_suffix(student_dir, filename):
+    """Largest N among existing `base_N.ext` files (0 if none)"""
+    base, ext = os.path.splitext(filename)
+    pattern = re.compile(re.escape(base) + r'_(\d+)' + re.escape(ext) + '$')
+    highest = 0
+    for entry in os.scandir(student_dir):
+        match = pattern.match(entry.name)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+class NameIndex:
+    """
+    Counters keyed by (NetID, kind, name), shared by every gunicorn worker.
+
+    A counter is seeded once by `start()` (e.g. a directory scan for the
+    highest suffix in use) and from then on each call is one UPDATE.
+    Numbers are never reused, even after the file that had one is deleted.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                " netid TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " next INTEGER NOT NULL,"
+                " PRIMARY KEY (netid, kind, name))"
+            )
+
+    def _connect(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def next_number(self, netid, kind, name, start):
+        """
+        Return the next number for (netid, kind, name). `start()` gives the
+        highest number already in use and is only called for a new counter.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT 1 FROM counters WHERE netid = ? AND kind = ? AND name = ?",
+            (netid, kind, name)
+        ).fetchone()
+        # Seed outside the write lock; the scan may be slow
+        seed = start() + 1 if row is None else None
+
+        # IMMEDIATE takes the write lock up front so two workers can't both
+        # read the same value
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if seed is not None:
+                conn.execute(
+                    "INSERT OR IGNORE INTO counters (netid, kind, name, next) VALUES (?, ?, ?, ?)",
+                    (netid, kind, name, seed)
+                )
+            number = conn.execute(
+                "SELECT next FROM counters WHERE netid = ? AND kind = ? AND name = ?",
+                (netid, kind, name)
+            ).fetchone()[0]
+            conn.execute(
+                "UPDATE counters SET next = next + 1 WHERE netid = ? AND kind = ? AND name = ?",
+                (netid, kind, name)
+            )
+            conn.execute("COMMIT")
+            return number
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, netid, student_dir, filename):
+        """
+        Reserve `filename`, or the next free `base_N.ext` if it is taken,
+        by creating an empty placeholder that the caller must replace
+        (os.replace) or remove. Returns the reserved name.
+        """
+        if create_exclusive(os.path.join(student_dir, filename)):
+            return filename
+
+        base, ext = os.path.splitext(filename)
+        while True:
+            number = self.next_number(
+                netid, 'suffix', filename,
+                lambda: highest_suffix(student_dir, filename)
+            )
+            candidate = f"{base}_{number}{ext}"
+            # Only fails if a file was put there behind the counter's back
+            if create_exclusive(os.path.join(student_dir, candidate)):
+                return candidate
+
+    def forget(self, netid):
+        """Drop every counter of `netid` (directory removed or migrated)"""
+        self._connect().execute("DELETE FROM counters WHERE netid = ?", (netid,))
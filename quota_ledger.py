@@ -0,0 +1,132 @@
+"""
+Persistent per-student storage usage ledger
+Keeps a running byte count per NetID in SQLite so quota checks don't walk
+the student's directory on every request
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaLedger:
+    """
+    Per-NetID usage counters shared by every gunicorn worker.
+
+    Rows are created lazily by scanning the student's directory the first
+    time a NetID is seen, and re-scanned once they are older than
+    `reconcile_interval` seconds to correct any drift (files removed by
+    hand, crashed uploads, ...). Uploads and deletes adjust the counter in
+    a single UPDATE so concurrent workers never lose an update, and a
+    re-scan that sees the counter move while it walks the directory
+    scans again rather than overwrite that change.
+    """
+
+    def __init__(self, db_path, scan, reconcile_interval=3600):
+        self.db_path = db_path
+        self.scan = scan
+        self.reconcile_interval = reconcile_interval
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                " netid TEXT PRIMARY KEY,"
+                " bytes INTEGER NOT NULL,"
+                " scanned_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def usage(self, netid, student_dir):
+        """Return bytes used by `netid`, scanning the directory on a miss"""
+        row = self._connect().execute(
+            "SELECT bytes, scanned_at FROM usage WHERE netid = ?", (netid,)
+        ).fetchone()
+
+        if row is None or time.time() - row[1] > self.reconcile_interval:
+            return self.reconcile(netid, student_dir)
+        return row[0]
+
+    def reconcile(self, netid, student_dir, attempts=3):
+        """Re-scan `student_dir` and store the real usage for `netid`"""
+        conn = self._connect()
+        for attempt in range(attempts):
+            before = self._bytes(conn, netid)
+            actual = self.scan(student_dir)
+            # The check and the write are one transaction, so no add() can
+            # slip in between them
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = self._bytes(conn, netid)
+                if current != before and attempt < attempts - 1:
+                    # An upload or delete was counted while we scanned, and
+                    # the scan may or may not have seen its file: scan again
+                    conn.execute("ROLLBACK")
+                    continue
+                if current != before and before is not None and current is not None:
+                    # Still busy after every attempt: keep what was counted
+                    # meanwhile on top of the scan
+                    actual = max(actual + current - before, 0)
+                if current is not None and current != actual:
+                    logger.info("Quota ledger drift for %s: %s -> %s bytes", netid, current, actual)
+                conn.execute(
+                    "INSERT INTO usage (netid, bytes, scanned_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(netid) DO UPDATE SET bytes = excluded.bytes, "
+                    "scanned_at = excluded.scanned_at",
+                    (netid, actual, time.time())
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return actual
+
+    def _bytes(self, conn, netid):
+        row = conn.execute("SELECT bytes FROM usage WHERE netid = ?", (netid,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, netid, delta):
+        """Atomically adjust the usage of `netid` by `delta` bytes"""
+        conn = self._connect()
+        cur = conn.execute(
+            "UPDATE usage SET bytes = MAX(bytes + ?, 0) WHERE netid = ?",
+            (delta, netid)
+        )
+        # No row yet: the next usage() call scans the directory anyway
+        if cur.rowcount == 0:
+            return None
+        return conn.execute(
+            "SELECT bytes FROM usage WHERE netid = ?", (netid,)
+        ).fetchone()[0]
+
+    def totals(self, quota):
+        """(students, total bytes, students at >= 90% of `quota`)"""
+        students, used, near = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COALESCE(SUM(bytes >= ?), 0) FROM usage",
+            (quota * 0.9,)
+        ).fetchone()
+        return students, used, near
+
+    def snapshot(self):
+        """{netid: (bytes, scanned_at)} for every counter"""
+        rows = self._connect().execute("SELECT netid, bytes, scanned_at FROM usage")
+        return {netid: (used, scanned_at) for netid, used, scanned_at in rows}
+
+    def forget(self, netid):
+        """Drop the counter for `netid` so it is rebuilt on next use"""
+        self._connect().execute("DELETE FROM usage WHERE netid = ?", (netid,))
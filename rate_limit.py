@@ -0,0 +1,179 @@
+"""
+Upload rate limiters
+Both backends keep, per NetID, a ring of the last `limit` accepted
+timestamps: a new request is allowed only if the oldest slot is outside
+the window. That is an exact sliding window with O(1) work per request.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Interface: hit(key) records a request and returns False if over limit"""
+
+    def __init__(self, limit, window=60):
+        self.limit = limit
+        self.window = window
+
+    def hit(self, key):
+        raise NotImplementedError
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Per-process limiter. Only exact with a single worker; idle keys are
+    evicted once their newest timestamp leaves the window.
+    """
+
+    def __init__(self, limit, window=60):
+        super().__init__(limit, window)
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + window
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+            ring = self._rings.get(key)
+            if ring is None or ring.maxlen != self.limit:
+                ring = deque(ring or (), maxlen=self.limit)
+                self._rings[key] = ring
+
+            if len(ring) == self.limit and now - ring[0] < self.window:
+                return False
+            ring.append(now)
+            return True
+
+    def _sweep(self, now):
+        cutoff = now - self.window
+        for key in [k for k, ring in self._rings.items() if not ring or ring[-1] < cutoff]:
+            del self._rings[key]
+        self._next_sweep = now + self.window
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    Limiter shared by every gunicorn worker through a SQLite database in
+    WAL mode. Each hit is one short write transaction, so the limit holds
+    exactly across workers.
+    """
+
+    def __init__(self, db_path, limit, window=60):
+        super().__init__(limit, window)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._next_sweep = 0.0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_heads ("
+            " key TEXT PRIMARY KEY,"
+            " head INTEGER NOT NULL,"
+            " last_hit REAL NOT NULL,"
+            " size INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(rate_heads)")]
+        if 'size' not in columns:
+            # Rings written before sizes were stored get resized on their next hit
+            conn.execute("ALTER TABLE rate_heads ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_slots ("
+            " key TEXT NOT NULL,"
+            " slot INTEGER NOT NULL,"
+            " ts REAL NOT NULL,"
+            " PRIMARY KEY (key, slot))"
+        )
+
+    def _connect(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key):
+        now = time.time()
+        limit = self.limit    # apply_limits() may change it meanwhile
+        conn = self._connect()
+
+        if now >= self._next_sweep:
+            self._sweep(conn, now)
+
+        # IMMEDIATE takes the write lock up front so two workers can't both
+        # read the same free slot
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT head, size FROM rate_heads WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                head = 0
+            elif row[1] != limit:
+                head = self._resize(conn, key, limit)
+            else:
+                head = row[0]
+
+            oldest = conn.execute(
+                "SELECT ts FROM rate_slots WHERE key = ? AND slot = ?", (key, head)
+            ).fetchone()
+            if oldest is not None and now - oldest[0] < self.window:
+                conn.execute("ROLLBACK")
+                return False
+
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_slots (key, slot, ts) VALUES (?, ?, ?)",
+                (key, head, now)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_heads (key, head, last_hit, size) VALUES (?, ?, ?, ?)",
+                (key, (head + 1) % limit, now, limit)
+            )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _resize(self, conn, key, limit):
+        """
+        Rebuild `key`'s ring for a new limit, keeping its newest `limit`
+        timestamps oldest first; returns the new head
+        """
+        stamps = [ts for ts, in conn.execute(
+            "SELECT ts FROM rate_slots WHERE key = ? ORDER BY ts DESC LIMIT ?", (key, limit)
+        )]
+        stamps.reverse()
+        conn.execute("DELETE FROM rate_slots WHERE key = ?", (key,))
+        conn.executemany(
+            "INSERT INTO rate_slots (key, slot, ts) VALUES (?, ?, ?)",
+            [(key, slot, ts) for slot, ts in enumerate(stamps)]
+        )
+        return len(stamps) % limit
+
+    def _sweep(self, conn, now):
+        # Forget NetIDs that have been idle for a whole window
+        cutoff = now - self.window
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM rate_slots WHERE key IN "
+                "(SELECT key FROM rate_heads WHERE last_hit < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM rate_heads WHERE last_hit < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._next_sweep = now + self.window
@@ -0,0 +1,400 @@
+"""
+Row-level reads of CSV and JSON uploads
+/android/read/<filename> returns a range of rows (head, tail or offset +
+limit), selected columns, or the value at a JSON path, so an app showing
+the last 20 readings of a sensor log doesn't download the whole file.
+
+Rows are the records of a CSV file (after its header row), the lines of
+a JSON Lines file, or the elements of a JSON file whose top level is an
+array. Each file gets a row-offset index the first time it is read,
+rebuilt only when the file changes; a read is then a seek into the index
+and one bounded read of the rows' bytes. Files stored compressed (see
+compressed_store.py) can't be seeked into, so a read of one decodes the
+whole file, O(file) rather than O(rows); the decoded content of recently
+read ones is kept in memory (`cache_bytes`) for the reads that follow.
+Other JSON documents have no rows and are parsed whole for a ?path= read.
+
+An index is a fixed header (kind and the stored file's inode, mtime and
+size) followed by one little-endian uint64 per row start and a final end
+offset, in <index_dir>/<netid>/<filename>.idx.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+KIND_CSV = 'csv'
+KIND_LINES = 'lines'        # JSON Lines
+KIND_ARRAY = 'array'        # JSON, top-level array
+KIND_DOCUMENT = 'document'  # JSON, anything else (no rows)
+_KINDS = (KIND_CSV, KIND_LINES, KIND_ARRAY, KIND_DOCUMENT)
+
+# Extension -> kind (None: JSON, decided from the content)
+EXTENSIONS = {'csv': KIND_CSV, 'json': None, 'jsonl': KIND_LINES, 'ndjson': KIND_LINES}
+
+_HEADER = struct.Struct('<4sB3xQQQ')
+_MAGIC = b'RIX2'
+_OFFSET_SIZE = 8
+
+# Strings (skipped whole) and the characters that nest or separate values
+_JSON_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{},]')
+
+# ?path=a.b[0].c (a leading "$." is accepted)
+_PATH_STEP = re.compile(r'\[(\d+)\]|\.?([^.\[\]]+)')
+
+
+class NotReadable(ValueError):
+    """The file can't be split into rows / parsed (invalid JSON)"""
+
+
+class PathNotFound(LookupError):
+    """A JSON path names a key or index the value doesn't have"""
+
+
+def _open_file(path):
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    return f, st.st_size, st
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def readable(filename):
+    """True if files named like this can be read by rows / path"""
+    return _extension(filename) in EXTENSIONS
+
+
+def kind_for(filename):
+    """Row kind implied by the extension, None for JSON (decided on indexing)"""
+    return EXTENSIONS.get(_extension(filename))
+
+
+def _line_offsets(data, quoted):
+    """
+    Row starts and the end offset of a line-based file. With `quoted`
+    (CSV) a newline inside a quoted field doesn't end the row. Blank
+    lines belong to the row before them.
+    """
+    offsets = []
+    row_start = start = 0
+    in_quotes = False
+    while start < len(data):
+        newline = data.find(b'\n', start)
+        end = len(data) if newline < 0 else newline + 1
+        if quoted and data.count(b'"', start, end) & 1:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            if data[row_start:end].strip():
+                offsets.append(row_start)
+                row_start = end
+            elif not offsets:
+                row_start = end     # leading blank lines
+        start = end
+    offsets.append(len(data))
+    return offsets
+
+
+def _array_offsets(data):
+    """Element starts and end offset of a JSON document that is an array"""
+    offsets = []
+    depth = 0
+    element_start = None
+    for match in _JSON_TOKEN.finditer(data):
+        char = data[match.start()]
+        if char == 0x22:        # "
+            continue
+        if char in b'[{':
+            depth += 1
+            if depth == 1:
+                element_start = match.end()
+        elif char in b']}':
+            depth -= 1
+            if depth == 0:
+                if data[element_start:match.start()].strip():
+                    offsets.append(element_start)
+                offsets.append(match.end())
+                return offsets
+        elif depth == 1:        # , between elements
+            offsets.append(element_start)
+            element_start = match.end()
+    raise NotReadable("unterminated JSON array")
+
+
+def _detect_json(data):
+    """
+    KIND_ARRAY, KIND_LINES or KIND_DOCUMENT for the content of a .json
+    file. A single line holding an array is an array, not one row.
+    """
+    body = data.lstrip()
+    # JSON Lines: the first line is a whole value and more lines follow
+    # (checked first: its rows may be arrays, "[1, 2]\n[3, 4]\n")
+    first, _, rest = body.partition(b'\n')
+    if rest.strip():
+        try:
+            json.loads(first)
+            return KIND_LINES
+        except ValueError:
+            pass
+    if body.startswith(b'['):
+        return KIND_ARRAY
+    return KIND_DOCUMENT
+
+
+def parse_path(path):
+    """'a.b[0].c' -> ['a', 'b', 0, 'c']"""
+    if path.startswith('$'):
+        path = path[1:]
+    steps = []
+    position = 0
+    while position < len(path):
+        match = _PATH_STEP.match(path, position)
+        if not match:
+            raise ValueError(f"invalid path at {path[position:]!r}")
+        steps.append(int(match.group(1)) if match.group(1) else match.group(2))
+        position = match.end()
+    return steps
+
+
+def resolve_path(value, steps):
+    """Follow parse_path() steps into a parsed JSON value"""
+    for step in steps:
+        if isinstance(value, list):
+            try:
+                value = value[int(step)]
+                continue
+            except (ValueError, IndexError):
+                pass
+        elif isinstance(value, dict) and str(step) in value:
+            value = value[str(step)]
+            continue
+        raise PathNotFound(step)
+    return value
+
+
+class RowFile:
+    """
+    An up to date index and the open file it describes; read with
+    rows_between(). The file is held open, so one replaced meanwhile is
+    still read consistently (the old content).
+    """
+
+    def __init__(self, kind, index, entries, data, content=None, on_decode=None):
+        self.kind = kind
+        self._index = index
+        self._data = data
+        # Whole original content, when it's already in memory or the file
+        # is stored compressed (decoded once, then sliced)
+        self._content = content
+        self._on_decode = on_decode
+        self._seekable = isinstance(data, io.BufferedReader)
+        rows = max(entries - 1, 0)
+        # A CSV's first row is its header
+        self._first = 1 if kind == KIND_CSV and rows else 0
+        self.rows = rows - self._first
+
+    def close(self):
+        self._index.close()
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _offsets(self, start, stop):
+        """Offsets of physical rows start..stop (inclusive of the end offset)"""
+        count = stop - start + 1
+        self._index.seek(_HEADER.size + start * _OFFSET_SIZE)
+        return struct.unpack(f'<{count}Q', self._index.read(count * _OFFSET_SIZE))
+
+    def _read(self, start, stop):
+        if self._content is None and self._seekable:
+            self._data.seek(start)
+            return self._data.read(stop - start)
+        if self._content is None:
+            self._content = self._data.read()
+            if self._on_decode:
+                self._on_decode(self._content)
+        return self._content[start:stop]
+
+    def span(self, start, stop):
+        """Bytes rows start..stop-1 take up in the file"""
+        if start >= stop:
+            return 0
+        offsets = self._offsets(start + self._first, stop + self._first)
+        return offsets[-1] - offsets[0]
+
+    def columns(self):
+        """Header row of a CSV file ([] if it has none)"""
+        if self.kind != KIND_CSV or not self._first:
+            return []
+        return next(_csv_rows(self._read(*self._offsets(0, 1))), [])
+
+    def rows_between(self, start, stop):
+        """Parsed rows start..stop-1 (lists of strings for CSV, JSON values otherwise)"""
+        if start >= stop:
+            return []
+        offsets = self._offsets(start + self._first, stop + self._first)
+        chunk = self._read(offsets[0], offsets[-1])
+        if self.kind == KIND_CSV:
+            return list(_csv_rows(chunk))
+        base = offsets[0]
+        rows = []
+        try:
+            for begin, end in zip(offsets, offsets[1:]):
+                text = chunk[begin - base:end - base].strip()
+                if self.kind == KIND_ARRAY:
+                    text = text[:-1]    # the , or ] after the element
+                rows.append(json.loads(text))
+        except ValueError as e:
+            raise NotReadable(f"invalid JSON row: {e}")
+        return rows
+
+
+def _csv_rows(chunk):
+    text = chunk.decode('utf-8', errors='replace')
+    return (row for row in csv.reader(io.StringIO(text, newline='')) if row)
+
+
+class RowIndex:
+    """Row-offset indexes of every student's CSV/JSON files"""
+
+    def __init__(self, index_dir, open_file=None, cache_bytes=0):
+        self.index_dir = index_dir
+        # path -> (file object, size, stat result) giving the file's
+        # content as uploaded (see compressed_store.open_stored)
+        self.open_file = open_file or _open_file
+        # Decoded content of compressed files: path -> (stamp, content),
+        # least recently read first
+        self.cache_bytes = cache_bytes
+        self._decoded = OrderedDict()
+        self._decoded_bytes = 0
+        self._lock = threading.Lock()
+        # Counter for metrics (this process only)
+        self.builds = 0
+
+    def index_path(self, netid, name):
+        return os.path.join(self.index_dir, netid, name + '.idx')
+
+    def open(self, netid, path):
+        """
+        RowFile for a student's file, (re)building its index first if it
+        is missing or describes an older version. Raises NotReadable.
+        """
+        name = os.path.basename(path)
+        index_path = self.index_path(netid, name)
+        data, _, st = self.open_file(path)
+        try:
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            index = self._open_index(index_path, stamp)
+            if index is not None:
+                kind = _KINDS[_HEADER.unpack(index.read(_HEADER.size))[1]]
+                entries = (os.fstat(index.fileno()).st_size - _HEADER.size) // _OFFSET_SIZE
+                if isinstance(data, io.BufferedReader):
+                    return RowFile(kind, index, entries, data)
+                return RowFile(kind, index, entries, data, self._cached(path, stamp),
+                               on_decode=lambda content: self._remember(path, stamp, content))
+
+            content = data.read()
+            if not isinstance(data, io.BufferedReader):
+                self._remember(path, stamp, content)
+            kind, offsets = self._build(index_path, stamp, name, content)
+            index = io.BytesIO(_HEADER.pack(_MAGIC, _KINDS.index(kind), *stamp) + offsets)
+            return RowFile(kind, index, len(offsets) // _OFFSET_SIZE, data, content)
+        except BaseException:
+            data.close()
+            raise
+
+    def _cached(self, path, stamp):
+        """Decoded content of `path` if it was cached for this version"""
+        with self._lock:
+            entry = self._decoded.get(path)
+            if entry is None or entry[0] != stamp:
+                return None
+            self._decoded.move_to_end(path)
+            return entry[1]
+
+    def _remember(self, path, stamp, content):
+        if len(content) > self.cache_bytes:
+            return
+        with self._lock:
+            old = self._decoded.pop(path, None)
+            if old is not None:
+                self._decoded_bytes -= len(old[1])
+            self._decoded[path] = (stamp, content)
+            self._decoded_bytes += len(content)
+            while self._decoded_bytes > self.cache_bytes:
+                _, (_, dropped) = self._decoded.popitem(last=False)
+                self._decoded_bytes -= len(dropped)
+
+    def _open_index(self, index_path, stamp):
+        try:
+            index = open(index_path, 'rb')
+        except FileNotFoundError:
+            return None
+        header = index.read(_HEADER.size)
+        if len(header) == _HEADER.size:
+            magic, _, *indexed = _HEADER.unpack(header)
+            if magic == _MAGIC and tuple(indexed) == stamp:
+                index.seek(0)
+                return index
+        index.close()
+        return None
+
+    def _build(self, index_path, stamp, name, content):
+        """Index `content` and save it; returns (kind, packed offsets)"""
+        kind = kind_for(name) or _detect_json(content)
+        if kind == KIND_CSV:
+            offsets = _line_offsets(content, quoted=True)
+        elif kind == KIND_LINES:
+            offsets = _line_offsets(content, quoted=False)
+        elif kind == KIND_ARRAY:
+            offsets = _array_offsets(content)
+        else:
+            offsets = []
+        packed = struct.pack(f'<{len(offsets)}Q', *offsets)
+
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix='.idx-', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(_HEADER.pack(_MAGIC, _KINDS.index(kind), *stamp))
+                out.write(packed)
+            os.replace(temp_path, index_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.builds += 1
+        return kind, packed
+
+    def document(self, path, max_bytes):
+        """Parse a JSON document whole (at most `max_bytes` of original content)"""
+        f, size, _ = self.open_file(path)
+        with f:
+            if size > max_bytes:
+                raise NotReadable(f"document larger than {max_bytes // (1024 * 1024)} MB")
+            try:
+                return json.loads(f.read())
+            except ValueError as e:
+                raise NotReadable(f"invalid JSON: {e}")
+
+    def forget(self, netid, name):
+        """The file was deleted or replaced"""
+        try:
+            os.remove(self.index_path(netid, name))
+        except FileNotFoundError:
+            pass
+
+    def forget_student(self, netid):
+        shutil.rmtree(os.path.join(self.index_dir, netid), ignore_errors=True)
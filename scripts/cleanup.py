@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+End-of-semester cleanup: back up and remove all student data
+With --backup, every student directory is archived to its own
+<netid>.tar.gz in parallel worker processes (one core each), checksummed
+in manifest.jsonl and verified by reading the archive back before that
+student's files are deleted. Students are deleted one by one as their
+archives pass verification, so an interrupted run leaves a consistent
+state: running the command again resumes the unfinished backup run and
+skips students already done.
+
+Usage: cleanup.py [--dry-run] [--backup] [--force]
+  --dry-run : Show what would be deleted without actually deleting
+  --backup  : Create per-student archives before deleting
+  --force   : Skip confirmation prompt
+
+Restore a student with: tar -xzf <run>/<netid>.tar.gz -C <upload_dir>
+(archives hold <netid>/...; with a sharded upload directory, run
+scripts/migrate_layout.py afterwards to move restored students into place)
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import time
+import tomllib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from chunked_upload import ChunkedUploads  # noqa: E402
+from dedup_store import ObjectStore  # noqa: E402
+from name_index import NameIndex  # noqa: E402
+from quota_ledger import QuotaLedger  # noqa: E402
+from row_index import RowIndex  # noqa: E402
+from storage_report import format_size, scan_tree  # noqa: E402
+from student_dirs import iter_students  # noqa: E402
+from thumbnails import ThumbnailCache  # noqa: E402
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.toml')
+
+MANIFEST = 'manifest.jsonl'
+RUN_PREFIX = 'android_course_backup_'
+READ_SIZE = 1024 * 1024
+
+
+def load_settings(config_file):
+    """Paths and options from config.toml"""
+    with open(config_file, 'rb') as f:
+        config = tomllib.load(f)
+    upload_dir = config['paths']['upload_dir']
+    parent = os.path.dirname(os.path.normpath(upload_dir))
+    state_dir = config['paths'].get('state_dir', os.path.join(parent, 'state'))
+    return {
+        'upload_dir': upload_dir,
+        'state_dir': state_dir,
+        'backup_dir': config['paths'].get('backup_dir', os.path.join(parent, 'backups')),
+        'log_dir': config['paths']['log_dir'],
+        'dedup': config['storage'].get('dedup', False),
+        'thumbnail_dir': config.get('thumbnails', {}).get(
+            'cache_dir', os.path.join(state_dir, 'thumbnails')
+        ),
+    }
+
+
+class _HashingWriter:
+    """File wrapper computing the sha256 of everything written through it"""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def hash_archive(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_student(netid, student_dir, run_dir, level):
+    """
+    Worker process: write <run_dir>/<netid>.tar.gz. Returns the manifest
+    entry (archive checksum, file count and bytes archived).
+    """
+    archive = os.path.join(run_dir, f"{netid}.tar.gz")
+    part = archive + '.part'
+    files = 0
+    size = 0
+
+    with open(part, 'wb') as raw:
+        out = _HashingWriter(raw)
+        with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=level, mtime=0) as gz:
+            with tarfile.open(fileobj=gz, mode='w|') as tar:
+                for root, dirs, names in os.walk(student_dir):
+                    dirs.sort()
+                    for name in sorted(names):
+                        path = os.path.join(root, name)
+                        # Member names start with <netid>/; a second name
+                        # for an inode already archived becomes a hardlink
+                        info = tar.gettarinfo(path, os.path.relpath(path, os.path.dirname(student_dir)))
+                        if info.isreg():
+                            with open(path, 'rb') as f:
+                                tar.addfile(info, f)
+                            size += info.size
+                        else:
+                            tar.addfile(info)
+                        if info.isreg() or info.islnk():
+                            files += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(part, archive)
+
+    return {
+        'netid': netid,
+        'archive': os.path.basename(archive),
+        'sha256': out.sha256.hexdigest(),
+        'archive_bytes': os.path.getsize(archive),
+        'files': files,
+        'bytes': size,
+    }
+
+
+def verify_archive(run_dir, entry):
+    """
+    Worker process: re-read an archive and check its checksum and that it
+    decompresses to the recorded files. Returns an error string or None.
+    """
+    path = os.path.join(run_dir, entry['archive'])
+    try:
+        if hash_archive(path) != entry['sha256']:
+            return 'checksum mismatch'
+        files = 0
+        size = 0
+        with tarfile.open(path, 'r|gz') as tar:
+            for member in tar:
+                if member.isreg():
+                    f = tar.extractfile(member)
+                    while f.read(READ_SIZE):
+                        pass
+                    files += 1
+                    size += member.size
+                elif member.islnk():
+                    files += 1
+    except (OSError, tarfile.TarError, EOFError) as e:
+        return f"unreadable: {e}"
+    if (files, size) != (entry['files'], entry['bytes']):
+        return f"contents differ: {files} files / {size} bytes archived, expected {entry['files']} / {entry['bytes']}"
+    return None
+
+
+class Manifest:
+    """
+    Append-only progress log of a backup run. Each line is a JSON event;
+    the last event per NetID is that student's state.
+    """
+
+    def __init__(self, run_dir):
+        self.path = os.path.join(run_dir, MANIFEST)
+        self.students = {}
+        self.complete = False
+        if os.path.exists(self.path):
+            with open(self.path, 'rb+') as f:
+                good = 0
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Torn last line from an interrupted run
+                        f.truncate(good)
+                        break
+                    good += len(line)
+                    if event['status'] == 'complete':
+                        self.complete = True
+                    else:
+                        self.students[event['netid']] = event
+
+    def record(self, event):
+        event = {**event, 'at': datetime.now().isoformat(timespec='seconds')}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if event['status'] == 'complete':
+            self.complete = True
+        else:
+            self.students[event['netid']] = event
+
+    def status(self, netid):
+        event = self.students.get(netid)
+        return event['status'] if event else None
+
+    def write_checksums(self):
+        """SHA256SUMS for `sha256sum -c`"""
+        with open(os.path.join(os.path.dirname(self.path), 'SHA256SUMS'), 'w') as f:
+            for netid in sorted(self.students):
+                event = self.students[netid]
+                f.write(f"{event['sha256']}  {event['archive']}\n")
+
+
+def find_run(backup_dir):
+    """Most recent unfinished backup run, or None"""
+    try:
+        runs = sorted(
+            e.path for e in os.scandir(backup_dir)
+            if e.is_dir() and e.name.startswith(RUN_PREFIX)
+        )
+    except FileNotFoundError:
+        return None
+    for run_dir in reversed(runs):
+        if not Manifest(run_dir).complete:
+            return run_dir
+    return None
+
+
+class Cleanup:
+    """Deletes students and drops their API state"""
+
+    def __init__(self, settings):
+        state_dir = settings['state_dir']
+        self.upload_dir = settings['upload_dir']
+        self.ledger = self.names = self.objects = self.thumbnails = self.row_index = None
+        self.chunked = None
+        if os.path.exists(os.path.join(state_dir, 'quota.db')):
+            self.ledger = QuotaLedger(os.path.join(state_dir, 'quota.db'), scan=None)
+        if os.path.isdir(os.path.join(state_dir, 'chunked')):
+            self.chunked = ChunkedUploads(
+                os.path.join(state_dir, 'chunked'),
+                charge=self.ledger.add if self.ledger else None
+            )
+        if os.path.exists(os.path.join(state_dir, 'names.db')):
+            self.names = NameIndex(os.path.join(state_dir, 'names.db'))
+        if settings['dedup'] or os.path.exists(os.path.join(state_dir, 'objects.db')):
+            self.objects = ObjectStore(self.upload_dir, os.path.join(state_dir, 'objects.db'))
+        if os.path.isdir(os.path.join(state_dir, 'row_index')):
+            self.row_index = RowIndex(os.path.join(state_dir, 'row_index'))
+        if os.path.exists(os.path.join(state_dir, 'thumbnails.db')):
+            self.thumbnails = ThumbnailCache(
+                settings['thumbnail_dir'], os.path.join(state_dir, 'thumbnails.db')
+            )
+
+    def delete_student(self, netid, student_dir):
+        shutil.rmtree(student_dir, ignore_errors=True)
+        # Shard directories (sharded layout) that are now empty
+        parent = os.path.dirname(student_dir)
+        while os.path.normpath(parent) != os.path.normpath(self.upload_dir):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+        if self.ledger:
+            self.ledger.forget(netid)
+        if self.names:
+            self.names.forget(netid)
+        if self.objects:
+            self.objects.forget_student(netid)
+        if self.thumbnails:
+            self.thumbnails.forget_student(netid)
+        if self.row_index:
+            self.row_index.forget_student(netid)
+
+    def finish(self):
+        """
+        Free deduplicated blobs and previews no student uses anymore, and
+        drop the resumable upload sessions of deleted students
+        """
+        freed = self.objects.collect_garbage() if self.objects else 0
+        if self.thumbnails:
+            freed += self.thumbnails.collect_garbage()
+        if self.chunked:
+            # Their part files went with the student directories
+            self.chunked.collect_garbage(temp_age=0)
+        return freed
+
+
+def list_students(upload_dir):
+    """NetID -> student directory, in NetID order (flat or sharded layout)"""
+    return dict(sorted(iter_students(upload_dir)))
+
+
+def run_backup(settings, students, cleanup, workers, level):
+    """
+    Archive, verify and delete each student (`students` maps NetIDs to
+    their directories); returns (run_dir, failures)
+    """
+    backup_dir = settings['backup_dir']
+    run_dir = find_run(backup_dir)
+    if run_dir:
+        print(f"Resuming backup run: {run_dir}")
+    else:
+        run_dir = os.path.join(backup_dir, RUN_PREFIX + datetime.now().strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(run_dir)
+        print(f"Creating backup: {run_dir}")
+    manifest = Manifest(run_dir)
+    failures = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=workers) as deleter:
+        pending = {}
+        for netid in students:
+            status = manifest.status(netid)
+            if status in ('deleted', 'verified'):
+                continue
+            if status == 'archived':
+                pending[pool.submit(verify_archive, run_dir, manifest.students[netid])] = ('verify', netid)
+            else:
+                pending[pool.submit(
+                    archive_student, netid, students[netid], run_dir, level
+                )] = ('archive', netid)
+
+        deletions = {}
+        # Students verified in an earlier, interrupted run
+        for netid in students:
+            if manifest.status(netid) == 'verified':
+                deletions[deleter.submit(cleanup.delete_student, netid, students[netid])] = netid
+
+        done = 0
+        total = len(students)
+        while pending:
+            future = next(as_completed(pending))
+            step, netid = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append((netid, f"{step} failed: {e}"))
+                continue
+            if step == 'archive':
+                manifest.record({**result, 'status': 'archived'})
+                pending[pool.submit(verify_archive, run_dir, manifest.students[netid])] = ('verify', netid)
+            elif result is not None:
+                failures.append((netid, f"verification failed: {result}"))
+            else:
+                manifest.record({**manifest.students[netid], 'status': 'verified'})
+                deletions[deleter.submit(cleanup.delete_student, netid, students[netid])] = netid
+                done += 1
+                entry = manifest.students[netid]
+                print(f"  [{done}/{total}] {netid}: {entry['files']} files, "
+                      f"{format_size(entry['bytes'])} -> {format_size(entry['archive_bytes'])}")
+
+        for future in as_completed(deletions):
+            netid = deletions[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures.append((netid, f"delete failed: {e}"))
+                continue
+            manifest.record({**manifest.students[netid], 'status': 'deleted'})
+
+    if not failures:
+        manifest.write_checksums()
+        manifest.record({'status': 'complete'})
+    return run_dir, failures
+
+
+def rotate_log(log_dir):
+    log_file = os.path.join(log_dir, 'api.log')
+    if not os.path.isfile(log_file):
+        return None
+    archive = os.path.join(log_dir, f"api_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log.gz")
+    rotated = log_file + '.rotating'
+    os.replace(log_file, rotated)
+    open(log_file, 'a').close()
+    with open(rotated, 'rb') as src, gzip.open(archive, 'wb') as dest:
+        shutil.copyfileobj(src, dest, READ_SIZE)
+    os.remove(rotated)
+    return archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Path to config.toml')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Show what would be deleted without actually deleting')
+    parser.add_argument('--backup', action='store_true', help='Create per-student archives before deleting')
+    parser.add_argument('--force', action='store_true', help='Skip confirmation prompt')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Students archived in parallel (default: one per core)')
+    parser.add_argument('--level', type=int, default=6, help='gzip level for archives (default: 6)')
+    args = parser.parse_args()
+
+    settings = load_settings(args.config)
+    upload_dir = settings['upload_dir']
+    if not os.path.isdir(upload_dir):
+        print(f"Upload directory does not exist: {upload_dir}")
+        sys.exit(1)
+
+    students = list_students(upload_dir)
+    with ThreadPoolExecutor(max_workers=min(32, args.workers * 4)) as pool:
+        scans = list(pool.map(scan_tree, students.values()))
+    usage = {s: (used + sum(shared.values()), files) for s, (used, files, shared) in zip(students, scans)}
+    total_size = sum(used for used, _ in usage.values())
+    file_count = sum(files for _, files in usage.values())
+
+    print("==========================================")
+    print("Android Course API - Cleanup")
+    print("==========================================")
+    print()
+    print("Current Status:")
+    print(f"  Upload Directory: {upload_dir}")
+    print(f"  Total Size: {format_size(total_size)}")
+    print(f"  Students: {len(students)}")
+    print(f"  Files: {file_count}")
+    print()
+    if students:
+        print("Student Usage:")
+        for netid in students:
+            used, files = usage[netid]
+            print(f"  {netid}: {format_size(used)} ({files} files)")
+        print()
+
+    if args.dry_run:
+        print("[DRY RUN] Would delete:")
+        print(f"  - All files in {upload_dir}")
+        print(f"  - {file_count} files from {len(students)} students")
+        if args.backup:
+            print(f"  (after archiving each student to {settings['backup_dir']})")
+        print()
+        print("To actually delete, run without --dry-run")
+        return
+
+    if not args.force:
+        print("WARNING: This will permanently delete all student data!")
+        if input("Are you sure you want to continue? (yes/no): ") != 'yes':
+            print("Aborted.")
+            return
+
+    cleanup = Cleanup(settings)
+    started = time.monotonic()
+    run_dir = None
+    if args.backup and students:
+        run_dir, failures = run_backup(settings, students, cleanup, args.workers, args.level)
+        if failures:
+            print("\nERROR: some students were not backed up and have NOT been deleted:")
+            for netid, error in failures:
+                print(f"  {netid}: {error}")
+            print(f"\nFix the problem and run again to resume {run_dir}")
+            sys.exit(1)
+    else:
+        print("\nDeleting student data...")
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(cleanup.delete_student, students, students.values()))
+
+    freed_shared = cleanup.finish()
+    archived_log = rotate_log(settings['log_dir'])
+
+    print()
+    print(f"Cleanup complete in {time.monotonic() - started:.0f}s!")
+    print()
+    print("Summary:")
+    print(f"  Students removed: {len(students)}")
+    print(f"  Files deleted: {file_count}")
+    print(f"  Space freed: {format_size(total_size + freed_shared)}")
+    if archived_log:
+        print(f"  Log file archived to: {archived_log}")
+    if run_dir:
+        print(f"  Backup location: {run_dir} (see {MANIFEST}, SHA256SUMS)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 """
 Generate authentication tokens for Android course students
-Creates a JSON file mapping NetID to unique tokens
+Creates a JSON file mapping NetID to unique tokens, plus the hashed
+tokens.db index the API looks tokens up in (see token_store.py)
 """
 
-import json
+import os
 import secrets
 import sys
-from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import token_store  # noqa: E402
 
 TOKEN_FILE = '/scratch/android_course/tokens/tokens.json'
 TOKEN_LENGTH = 32  # 256-bit token
@@ -20,21 +24,21 @@ def generate_token():
 
 def load_tokens():
     """Load existing tokens"""
-    token_file = Path(TOKEN_FILE)
-    if token_file.exists():
-        with open(token_file, 'r') as f:
-            return json.load(f)
-    return {}
+    return token_store.load_tokens(TOKEN_FILE)
 
 
 def save_tokens(tokens):
-    """Save tokens to file"""
-    Path(TOKEN_FILE).parent.mkdir(parents=True, exist_ok=True)
-    with open(TOKEN_FILE, 'w') as f:
-        json.dump(tokens, f, indent=2)
+    """Save tokens to file (atomically) and rebuild the index"""
+    token_store.save_tokens(TOKEN_FILE, tokens)
     print(f"Tokens saved to {TOKEN_FILE}")
 
 
+def compile_index():
+    """Rebuild tokens.db after tokens.json was edited by hand"""
+    path = token_store.compile_index(TOKEN_FILE)
+    print(f"Index of {len(load_tokens())} tokens written to {path}")
+
+
 def add_student(netid):
     """Add a new student or regenerate token"""
     tokens = load_tokens()
@@ -123,6 +127,7 @@ def main():
         print("  python generate_tokens.py list                  - List all students")
         print("  python generate_tokens.py bulk <file>           - Import from file")
         print("  python generate_tokens.py export <output.csv>   - Export to CSV")
+        print("  python generate_tokens.py compile               - Rebuild tokens.db from tokens.json")
         sys.exit(1)
     
     command = sys.argv[1]
@@ -154,6 +159,9 @@ def main():
             sys.exit(1)
         export_tokens(sys.argv[2])
     
+    elif command == 'compile':
+        compile_index()
+    
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
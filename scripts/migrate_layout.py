@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Move student directories into the configured upload layout
+Finds every student directory under upload_dir, whatever layout it is
+in now, and renames it to where [storage] shard_levels / shard_width
+put it. Each moved directory leaves a symlink behind at its old path,
+so requests that were already under way when it moved (including
+resumable upload sessions, which remember their part file's path) still
+find their files. Safe to re-run; students already in place are skipped.
+
+The API can keep serving while this runs:
+  flat -> sharded: set shard_levels, restart the API, then run this.
+                   Students not moved yet are served from the flat path.
+  sharded -> flat: run this with --levels 0 first, then set
+                   shard_levels = 0 and restart the API.
+Once no upload session can still be open (see [uploads]
+session_ttl_hours), run again with --remove-links to drop the symlinks
+and any shard directories left empty.
+"""
+
+import argparse
+import errno
+import os
+import sys
+import tomllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from student_dirs import StudentDirs, iter_students  # noqa: E402
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.toml')
+
+
+def load_layout(config_file):
+    """Return (upload_dir, shard_levels, shard_width) from config.toml"""
+    with open(config_file, 'rb') as f:
+        config = tomllib.load(f)
+    storage = config.get('storage', {})
+    return (config['paths']['upload_dir'], storage.get('shard_levels', 0),
+            storage.get('shard_width', 2))
+
+
+def move_student(netid, path, target, dry_run=False):
+    """
+    Rename `path` to `target` and leave a symlink at `path`.
+    Returns "moved", or "conflict" if `target` already holds files.
+    """
+    if os.path.islink(target):
+        # Left behind by an earlier migration in the other direction
+        if not dry_run:
+            os.remove(target)
+    elif os.path.isdir(target) and os.listdir(target):
+        return 'conflict'
+    if dry_run:
+        return 'moved'
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        # rename() replaces an empty target directory atomically
+        os.rename(path, target)
+    except OSError as e:
+        if e.errno in (errno.ENOTEMPTY, errno.EEXIST):
+            return 'conflict'
+        raise
+    os.symlink(os.path.relpath(target, os.path.dirname(path)), path)
+    return 'moved'
+
+
+def remove_links(upload_dir, dry_run=False):
+    """
+    Remove the symlinks earlier moves left behind, then shard directories
+    that are empty. Returns (links, directories) removed.
+    """
+    students = {path for _, path in iter_students(upload_dir)}
+    base = os.path.realpath(upload_dir)
+    links = []
+    shards = []
+    for root, subdirs, names in os.walk(upload_dir):
+        if root != upload_dir:
+            shards.append(root)
+        for name in subdirs + names:
+            path = os.path.join(root, name)
+            # Only links to a directory inside upload_dir are ours
+            if (os.path.islink(path) and os.path.isdir(path)
+                    and os.path.realpath(path).startswith(base + os.sep)):
+                links.append(path)
+        # Don't descend into students or hidden directories (.objects)
+        subdirs[:] = [d for d in subdirs
+                      if not d.startswith('.') and os.path.join(root, d) not in students]
+    if dry_run:
+        return len(links), 0
+
+    for path in links:
+        os.remove(path)
+    removed = 0
+    for root in reversed(shards):   # deepest first
+        try:
+            os.rmdir(root)
+            removed += 1
+        except OSError:
+            pass
+    return len(links), removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Path to config.toml')
+    parser.add_argument('--levels', type=int,
+                        help='Target shard levels (default: [storage] shard_levels)')
+    parser.add_argument('--width', type=int,
+                        help='Target shard width (default: [storage] shard_width)')
+    parser.add_argument('--remove-links', action='store_true',
+                        help='Drop the symlinks left by earlier moves instead of moving')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    args = parser.parse_args()
+
+    upload_dir, levels, width = load_layout(args.config)
+    if not os.path.isdir(upload_dir):
+        print(f"Upload directory does not exist: {upload_dir}")
+        sys.exit(1)
+    prefix = "[DRY RUN] " if args.dry_run else ""
+
+    if args.remove_links:
+        links, dirs = remove_links(upload_dir, args.dry_run)
+        print(f"{prefix}Removed {links} symlinks and {dirs} empty shard directories")
+        return
+
+    try:
+        layout = StudentDirs(
+            upload_dir,
+            shard_levels=levels if args.levels is None else args.levels,
+            shard_width=width if args.width is None else args.width
+        )
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    moved = 0
+    in_place = 0
+    conflicts = []
+    # sorted() collects first: moving while walking would revisit students
+    for netid, path in sorted(iter_students(upload_dir)):
+        target = layout.path(netid)
+        if os.path.abspath(path) == os.path.abspath(target):
+            in_place += 1
+            continue
+        if move_student(netid, path, target, args.dry_run) == 'conflict':
+            conflicts.append(netid)
+            print(f"  {netid}: {target} already has files, not moved")
+            continue
+        moved += 1
+        print(f"  {prefix}{netid}: {os.path.relpath(path, upload_dir)} -> "
+              f"{os.path.relpath(target, upload_dir)}")
+
+    print(f"\n{prefix}Layout: {layout.shard_levels} levels of width {layout.shard_width}")
+    print(f"  - Moved: {moved}")
+    print(f"  - Already in place: {in_place}")
+    if conflicts:
+        print(f"  - Conflicts (merge by hand, then re-run): {len(conflicts)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
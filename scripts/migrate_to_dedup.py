@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Migrate existing per-NetID upload directories to deduplicated storage
+Hashes every stored file, links it into <upload_dir>/.objects and records
+it in the manifest. Files whose content is already stored are replaced by
+a hardlink to the existing blob. Safe to re-run; already-migrated files
+are skipped.
+
+Enable `dedup = true` in the [storage] section of config.toml first, then
+run this once (the API can keep serving while it runs).
+"""
+
+import argparse
+import os
+import sys
+import tomllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dedup_store import ObjectStore, hash_file  # noqa: E402
+from quota_ledger import QuotaLedger  # noqa: E402
+from streaming_upload import is_temp_file  # noqa: E402
+from student_dirs import iter_students  # noqa: E402
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.toml')
+
+
+def load_paths(config_file):
+    """Return (upload_dir, state_dir) from config.toml"""
+    with open(config_file, 'rb') as f:
+        config = tomllib.load(f)
+    upload_dir = config['paths']['upload_dir']
+    state_dir = config['paths'].get(
+        'state_dir',
+        os.path.join(os.path.dirname(os.path.normpath(upload_dir)), 'state')
+    )
+    return upload_dir, state_dir
+
+
+def migrate_student(store, netid, student_dir, dry_run=False, dry_run_seen=None):
+    """Migrate one student directory, returns (files, bytes_saved)"""
+    files = 0
+    saved = 0
+
+    for entry in os.scandir(student_dir):
+        if not entry.is_file(follow_symlinks=False) or is_temp_file(entry.name):
+            continue
+        if store.lookup(netid, entry.name) is not None:
+            continue
+
+        st = entry.stat()
+        sha256 = hash_file(entry.path)
+        obj = store.object_path(sha256)
+        files += 1
+
+        try:
+            obj_st = os.stat(obj)
+        except FileNotFoundError:
+            obj_st = None
+
+        if dry_run:
+            # Nothing is linked in a dry run, so remember what would be
+            if obj_st is not None and obj_st.st_ino != st.st_ino or sha256 in dry_run_seen:
+                saved += st.st_size
+            dry_run_seen.add(sha256)
+            continue
+
+        if obj_st is None:
+            # First copy of this content becomes the blob
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            try:
+                os.link(entry.path, obj)
+            except FileExistsError:
+                obj_st = os.stat(obj)
+
+        if obj_st is not None and obj_st.st_ino != st.st_ino:
+            # Replace the file with a link to the existing blob
+            tmp = os.path.join(student_dir, f".upload-migrate-{entry.name}.part")
+            os.link(obj, tmp)
+            os.replace(tmp, entry.path)
+            saved += st.st_size
+
+        store.record(netid, entry.name, sha256, st.st_size, uploaded_ns=st.st_mtime_ns)
+
+    return files, saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Path to config.toml')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only report how much space would be saved')
+    args = parser.parse_args()
+
+    upload_dir, state_dir = load_paths(args.config)
+    if not os.path.isdir(upload_dir):
+        print(f"Upload directory does not exist: {upload_dir}")
+        sys.exit(1)
+
+    store = ObjectStore(upload_dir, os.path.join(state_dir, 'objects.db'))
+    ledger = QuotaLedger(os.path.join(state_dir, 'quota.db'), scan=None)
+
+    total_files = 0
+    total_saved = 0
+    dry_run_seen = set()
+    for netid, student_dir in sorted(iter_students(upload_dir)):
+        files, saved = migrate_student(
+            store, netid, student_dir, args.dry_run, dry_run_seen
+        )
+        if files:
+            print(f"  {netid}: {files} files, {saved / (1024*1024):.1f} MB deduplicated")
+            if not args.dry_run:
+                # Usage changes once duplicates share an inode; rescan lazily
+                ledger.forget(netid)
+        total_files += files
+        total_saved += saved
+
+    prefix = "[DRY RUN] " if args.dry_run else ""
+    print(f"\n{prefix}Migration complete:")
+    print(f"  - Files processed: {total_files}")
+    print(f"  - Space saved: {total_saved / (1024*1024):.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -54,8 +54,22 @@ if [ ! -d "$UPLOAD_DIR" ]; then
     exit 0
 fi
 
-# Get list of students with data
-STUDENTS_WITH_DATA=$(find "$UPLOAD_DIR" -mindepth 1 -maxdepth 1 -type d -exec basename {} \;)
+# Students with data as "netid<TAB>directory" lines; student_dirs.py
+# knows both the flat and the sharded upload layout
+STUDENT_DIRS=$(python3 - "$(dirname "$0")/.." "$UPLOAD_DIR" <<'EOF'
+import sys
+sys.path.insert(0, sys.argv[1])
+from student_dirs import iter_students
+for netid, path in sorted(iter_students(sys.argv[2])):
+    print(f"{netid}\t{path}")
+EOF
+)
+STUDENTS_WITH_DATA=$(echo "$STUDENT_DIRS" | cut -f1)
+
+# Directory of a student
+student_dir() {
+    echo "$STUDENT_DIRS" | awk -F'\t' -v netid="$1" '$1 == netid { print $2 }'
+}
 
 if [ -z "$STUDENTS_WITH_DATA" ]; then
     echo "No student data found. Nothing to notify about."
@@ -64,8 +78,8 @@ fi
 
 echo "Students with data:"
 for student in $STUDENTS_WITH_DATA; do
-    size=$(du -sh "$UPLOAD_DIR/$student" 2>/dev/null | cut -f1)
-    files=$(find "$UPLOAD_DIR/$student" -type f | wc -l)
+    size=$(du -sh "$(student_dir "$student")" 2>/dev/null | cut -f1)
+    files=$(find "$(student_dir "$student")" -type f | wc -l)
     echo "  $student: $size ($files files)"
 done
 echo ""
@@ -127,8 +141,8 @@ if [ -f "$STUDENT_LIST" ]; then
             email="${student}@richmond.edu"
         fi
         
-        size=$(du -sh "$UPLOAD_DIR/$student" 2>/dev/null | cut -f1)
-        file_count=$(find "$UPLOAD_DIR/$student" -type f | wc -l)
+        size=$(du -sh "$(student_dir "$student")" 2>/dev/null | cut -f1)
+        file_count=$(find "$(student_dir "$student")" -type f | wc -l)
         
         send_notification "$student" "$email" "$size" "$file_count"
     done
@@ -139,8 +153,8 @@ else
     
     for student in $STUDENTS_WITH_DATA; do
         email="${student}@richmond.edu"
-        size=$(du -sh "$UPLOAD_DIR/$student" 2>/dev/null | cut -f1)
-        file_count=$(find "$UPLOAD_DIR/$student" -type f | wc -l)
+        size=$(du -sh "$(student_dir "$student")" 2>/dev/null | cut -f1)
+        file_count=$(find "$(student_dir "$student")" -type f | wc -l)
         
         send_notification "$student" "$email" "$size" "$file_count"
     done
@@ -160,7 +174,7 @@ Students Notified: $STUDENT_COUNT
 
 Students with data:
 $(for s in $STUDENTS_WITH_DATA; do
-    size=$(du -sh "$UPLOAD_DIR/$s" 2>/dev/null | cut -f1)
+    size=$(du -sh "$(student_dir "$s")" 2>/dev/null | cut -f1)
     echo "  - $s: $size"
 done)
 "
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Storage usage report for the course upload tree
+Computes course and per-student usage, file counts and threshold
+warnings in a single pass: student directories are scanned in parallel
+with os.scandir, or their byte totals are read from the API's quota
+ledger (state_dir/quota.db) when it exists. Replaces the du/find
+pipeline monitor.sh used to run.
+
+Usage: storage_report.py [--email] [--quiet] [--format text|json|csv]
+  --email  : Send email alert if thresholds exceeded
+  --quiet  : Only output if there are warnings
+
+Exits 1 when a threshold is exceeded, like monitor.sh, and 2 when an
+alert was due but could not be sent.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from streaming_upload import is_temp_file  # noqa: E402
+from student_dirs import iter_students  # noqa: E402
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.toml')
+
+# Who monitor.sh alerted before recipients were configurable
+DEFAULT_ALERT_EMAILS = ['jtonini@richmond.edu', 'sware@richmond.edu']
+
+
+def load_settings(config_file):
+    """Paths, quotas and thresholds from config.toml"""
+    with open(config_file, 'rb') as f:
+        config = tomllib.load(f)
+    upload_dir = config['paths']['upload_dir']
+    monitoring = config.get('monitoring', {})
+    return {
+        'upload_dir': upload_dir,
+        'state_dir': config['paths'].get(
+            'state_dir',
+            os.path.join(os.path.dirname(os.path.normpath(upload_dir)), 'state')
+        ),
+        'log_file': os.path.join(config['paths']['log_dir'], 'api.log'),
+        'student_quota': config['storage']['student_quota_mb'] * 1024 * 1024,
+        'course_quota': monitoring.get('course_quota_gb', 15) * 1024 ** 3,
+        'course_warn': monitoring.get('course_warn_percent', 80),
+        'student_warn': monitoring.get('student_warn_percent', 90),
+        'alert_emails': monitoring.get('alert_emails', DEFAULT_ALERT_EMAILS),
+    }
+
+
+def scan_tree(path):
+    """
+    Walk `path` once. Returns (bytes, files, shared) where `files` counts
+    the student's own top-level files and `shared` maps the inodes of
+    hardlinked files (deduplicated storage) to their size, so the course
+    total can count each of them once.
+    """
+    total = 0
+    files = 0
+    shared = {}
+    stack = [(path, True)]
+    while stack:
+        current, top = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except (FileNotFoundError, PermissionError):
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, False))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if top and not is_temp_file(entry.name):
+                files += 1
+            if st.st_nlink > 1:
+                shared[st.st_ino] = st.st_size
+            else:
+                total += st.st_size
+    return total, files, shared
+
+
+def read_ledger(path):
+    """
+    NetID -> bytes from the API's quota ledger, opened read-only so the
+    report never writes to the live database
+    """
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return {}
+    try:
+        return dict(conn.execute("SELECT netid, bytes FROM usage"))
+    except sqlite3.OperationalError:
+        return {}   # no usage table yet
+    finally:
+        conn.close()
+
+
+def count_files(path):
+    """Top-level files of a student directory (no stat calls)"""
+    try:
+        return sum(
+            1 for entry in os.scandir(path)
+            if entry.is_file(follow_symlinks=False) and not is_temp_file(entry.name)
+        )
+    except FileNotFoundError:
+        return 0
+
+
+def collect(settings, source, workers):
+    """
+    Per-student (netid, bytes, files) sorted by size, the course total and
+    the source actually used ("scan" or "ledger").
+    """
+    upload_dir = settings['upload_dir']
+    if not os.path.isdir(upload_dir):
+        return [], 0, source
+
+    top = list(os.scandir(upload_dir))
+    students = sorted(iter_students(upload_dir))
+
+    ledger_path = os.path.join(settings['state_dir'], 'quota.db')
+    if source == 'auto':
+        source = 'ledger' if os.path.exists(ledger_path) else 'scan'
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if source == 'ledger':
+            usage = read_ledger(ledger_path)
+            # Students the API hasn't charged yet are scanned instead
+            missing = [(netid, path) for netid, path in students if netid not in usage]
+            counts = pool.map(count_files, [path for _, path in students])
+            scans = dict(zip(
+                [netid for netid, _ in missing],
+                pool.map(scan_tree, [path for _, path in missing])
+            ))
+            rows = []
+            for (netid, _), files in zip(students, counts):
+                if netid in usage:
+                    rows.append((netid, usage[netid], files))
+                else:
+                    used, files, shared = scans[netid]
+                    rows.append((netid, used + sum(shared.values()), files))
+            course_total = sum(used for _, used, _ in rows)
+        else:
+            # Hidden top-level entries (.objects blobs) count towards the
+            # course total, not towards any student
+            hidden = [e.path for e in top if e.name.startswith('.') and e.is_dir(follow_symlinks=False)]
+            results = list(pool.map(scan_tree, [path for _, path in students] + hidden))
+            rows = []
+            shared = {}
+            course_total = sum(e.stat().st_size for e in top if e.is_file(follow_symlinks=False))
+            for i, (used, files, links) in enumerate(results):
+                if i < len(students):
+                    rows.append((students[i][0], used + sum(links.values()), files))
+                course_total += used
+                shared.update(links)
+            course_total += sum(shared.values())
+
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows, course_total, source
+
+
+def format_size(size):
+    for unit, scale in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)):
+        if size >= scale:
+            return f"{size / scale:.1f} {unit}"
+    return f"{size} B"
+
+
+def build_report(settings, rows, course_total, source):
+    """Report as a dict; warnings are plain strings"""
+    course_quota = settings['course_quota']
+    student_quota = settings['student_quota']
+    course_percent = course_total * 100 // course_quota if course_quota else 0
+
+    warnings = []
+    if course_percent >= settings['course_warn']:
+        warnings.append(
+            f"Course storage at {course_percent}% (threshold: {settings['course_warn']}%)"
+        )
+
+    students = []
+    for netid, used, files in rows:
+        percent = used * 100 // student_quota if student_quota else 0
+        if percent >= settings['student_warn']:
+            warnings.append(f"Student '{netid}' at {percent}% quota")
+        students.append({'netid': netid, 'bytes': used, 'files': files, 'percent': percent})
+
+    try:
+        log_size = os.path.getsize(settings['log_file'])
+    except OSError:
+        log_size = None
+
+    return {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'source': source,
+        'course': {
+            'bytes': course_total,
+            'quota_bytes': course_quota,
+            'percent': course_percent,
+            'students': len(rows),
+            'files': sum(files for _, _, files in rows),
+        },
+        'students': students,
+        'log_file': {'path': settings['log_file'], 'bytes': log_size},
+        'warnings': warnings,
+    }
+
+
+def render_text(report):
+    course = report['course']
+    lines = [
+        "Android Course API - Storage Report",
+        f"Generated: {report['generated']} (usage from {report['source']})",
+        "========================================",
+        "",
+        "Course Storage:",
+        f"  Total Used: {format_size(course['bytes'])} / "
+        f"{course['quota_bytes'] / 1024 ** 3:g} GB ({course['percent']}%)",
+        f"  Students: {course['students']}",
+        f"  Files: {course['files']}",
+        "",
+    ]
+    if report['students']:
+        lines += ["Per-Student Usage (sorted by size):", "----------------------------------------"]
+        for s in report['students']:
+            lines.append(
+                f"  {s['netid']}: {format_size(s['bytes'])} ({s['percent']}%) - {s['files']} files"
+            )
+    if report['log_file']['bytes'] is not None:
+        lines += [
+            "",
+            "Log File:",
+            f"  Size: {format_size(report['log_file']['bytes'])}",
+            f"  Location: {report['log_file']['path']}",
+        ]
+    if report['warnings']:
+        lines += ["", "========================================", "ALERTS:"]
+        lines += [f"WARNING: {w}" for w in report['warnings']]
+    return '\n'.join(lines) + '\n'
+
+
+def render_csv(report):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['netid', 'bytes', 'files', 'percent'])
+    for s in report['students']:
+        writer.writerow([s['netid'], s['bytes'], s['files'], s['percent']])
+    return out.getvalue()
+
+
+RENDERERS = {
+    'text': render_text,
+    'json': lambda report: json.dumps(report, indent=2) + '\n',
+    'csv': render_csv,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Path to config.toml')
+    parser.add_argument('--format', choices=sorted(RENDERERS), default='text')
+    parser.add_argument('--source', choices=('auto', 'ledger', 'scan'), default='auto',
+                        help='Where student usage comes from (default: the ledger if present)')
+    parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                        help='Directories scanned in parallel')
+    parser.add_argument('--email', action='store_true', help='Send email alert if thresholds exceeded')
+    parser.add_argument('--quiet', action='store_true', help='Only output if there are warnings')
+    args = parser.parse_args()
+
+    settings = load_settings(args.config)
+    rows, course_total, source = collect(settings, args.source, args.workers)
+    report = build_report(settings, rows, course_total, source)
+
+    if not args.quiet or report['warnings']:
+        sys.stdout.write(RENDERERS[args.format](report))
+
+    if args.email and report['warnings']:
+        recipients = settings['alert_emails']
+        if not recipients:
+            print("[monitoring] alert_emails is empty; alert not sent", file=sys.stderr)
+            sys.exit(2)
+        try:
+            subprocess.run(
+                ['mail', '-s', '[ALERT] Android Course API - Storage Warning', *recipients],
+                input=render_text(report), text=True, check=True
+            )
+            print(f"Alert email sent to {', '.join(recipients)}", file=sys.stderr)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Could not send alert email: {e}", file=sys.stderr)
+            sys.exit(2)
+
+    sys.exit(1 if report['warnings'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Streaming multipart upload receiver
+Parses the request body incrementally and writes the file part straight
+into a temp file in the destination directory, enforcing size limits as
+bytes arrive instead of after the whole body has been spooled
+"""
+
+import hashlib
+import os
+import tempfile
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import (
+    Data, Epilogue, Field, File, MultipartDecoder, NeedData
+)
+
+CHUNK_SIZE = 64 * 1024
+
+# Temp files live next to their final location so the rename is atomic.
+# secure_filename() strips leading dots, so no upload can collide with them.
+TEMP_PREFIX = '.upload-'
+TEMP_SUFFIX = '.part'
+
+
+class UploadError(Exception):
+    """Upload rejected; `status` is the HTTP status to answer with"""
+
+    def __init__(self, status, message, received=0, details=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.received = received
+        self.details = details or {}
+
+
+class FileTooLarge(UploadError):
+    def __init__(self, received):
+        super().__init__(413, 'File too large', received)
+
+
+class QuotaExceeded(UploadError):
+    def __init__(self, received):
+        super().__init__(507, 'Quota exceeded', received)
+
+
+def is_temp_file(name):
+    """True for in-progress upload files that must not be listed"""
+    return name.startswith(TEMP_PREFIX) and name.endswith(TEMP_SUFFIX)
+
+
+def get_boundary(content_type):
+    """Return the multipart boundary of a Content-Type header, or None"""
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data':
+        return None
+    boundary = options.get('boundary')
+    return boundary.encode('latin-1') if boundary else None
+
+
+def receive_file(stream, boundary, dest_dir, field_name, max_size, quota_remaining,
+                 check_filename=None, digest=None, chunk_size=CHUNK_SIZE):
+    """
+    Read a multipart body from `stream` and store its `field_name` part.
+
+    Returns (filename, temp_path, size). The caller owns temp_path and must
+    rename or remove it. `check_filename(name)` may raise UploadError to
+    reject the part before any of its bytes are written. If `digest` (a
+    hashlib object) is given it is fed the file bytes. Raises UploadError
+    (or a subclass) when the upload is rejected; no temp file is left
+    behind in that case.
+    """
+    decoder = MultipartDecoder(boundary)
+    filename = None
+    temp_path = None
+    out = None
+    size = 0
+    in_target = False
+    eof = False
+
+    try:
+        while True:
+            try:
+                event = decoder.next_event()
+            except ValueError as e:
+                raise UploadError(400, f'Malformed multipart body: {e}', size)
+
+            if isinstance(event, NeedData):
+                if eof:
+                    # Body ended without a closing boundary; only accept it
+                    # if the file part itself was complete
+                    if out is None or not out.closed:
+                        raise UploadError(400, 'Incomplete upload', size)
+                    break
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    eof = True
+                decoder.receive_data(chunk or None)
+
+            elif isinstance(event, File):
+                in_target = event.name == field_name and out is None
+                if in_target:
+                    if not event.filename:
+                        raise UploadError(400, 'Empty filename')
+                    if check_filename is not None:
+                        check_filename(event.filename)
+                    filename = event.filename
+                    fd, temp_path = tempfile.mkstemp(
+                        prefix=TEMP_PREFIX, suffix=TEMP_SUFFIX, dir=dest_dir
+                    )
+                    out = os.fdopen(fd, 'wb')
+
+            elif isinstance(event, Field):
+                in_target = False
+
+            elif isinstance(event, Data):
+                if in_target:
+                    size += len(event.data)
+                    if size > max_size:
+                        raise FileTooLarge(size)
+                    if size > quota_remaining:
+                        raise QuotaExceeded(size)
+                    out.write(event.data)
+                    if digest is not None:
+                        digest.update(event.data)
+                    if not event.more_data:
+                        in_target = False
+                        out.close()
+
+            elif isinstance(event, Epilogue):
+                break
+
+        if filename is None:
+            raise UploadError(400, 'No file provided')
+        if not out.closed:
+            raise UploadError(400, 'Incomplete upload', size)
+        return filename, temp_path, size
+
+    except BaseException:
+        if out is not None:
+            out.close()
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        raise
+
+
+class ReceivedFile:
+    """One file part of a batch upload; `error` is set if it was rejected"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.temp_path = None
+        self.size = 0
+        self.sha256 = None
+        self.error = None
+
+    def discard(self):
+        if self.temp_path is not None:
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+            self.temp_path = None
+
+
+def receive_files(stream, boundary, dest_dir, field_name, max_size, quota_remaining,
+                  max_files, check_filename=None, hash_files=False, stop_on_error=False,
+                  chunk_size=CHUNK_SIZE):
+    """
+    Read a multipart body from `stream` and store every file part named
+    `field_name` (or `field_name[...]`, as PHP and HTML forms send arrays).
+
+    Returns a list of ReceivedFile in body order. A part that breaks a
+    rule (check_filename, max_size, or the combined size of the accepted
+    parts exceeding quota_remaining) gets `error` set and no temp file;
+    the rest of the batch is still read. With `stop_on_error` the first
+    rejection is raised instead and no temp file is left behind. The
+    caller owns the temp files of the returned parts.
+    """
+    decoder = MultipartDecoder(boundary)
+    received = []
+    current = None
+    out = None
+    digest = None
+    accepted = 0
+    eof = False
+
+    def reject(part, error):
+        part.discard()
+        part.error = error
+        if stop_on_error:
+            error.details.setdefault('filename', part.filename)
+            raise error
+
+    try:
+        while True:
+            try:
+                event = decoder.next_event()
+            except ValueError as e:
+                raise UploadError(400, f'Malformed multipart body: {e}')
+
+            if isinstance(event, NeedData):
+                if eof:
+                    if out is not None and not out.closed:
+                        raise UploadError(400, 'Incomplete upload', current.size)
+                    break
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    eof = True
+                decoder.receive_data(chunk or None)
+
+            elif isinstance(event, File):
+                current = None
+                if event.name != field_name and not event.name.startswith(field_name + '['):
+                    continue
+                if len(received) >= max_files:
+                    raise UploadError(400, f'Too many files. Maximum {max_files} per batch')
+                current = ReceivedFile(event.filename)
+                received.append(current)
+                try:
+                    if not event.filename:
+                        raise UploadError(400, 'Empty filename')
+                    if check_filename is not None:
+                        check_filename(event.filename)
+                except UploadError as e:
+                    reject(current, e)
+                    current = None
+                    continue
+                fd, current.temp_path = tempfile.mkstemp(
+                    prefix=TEMP_PREFIX, suffix=TEMP_SUFFIX, dir=dest_dir
+                )
+                out = os.fdopen(fd, 'wb')
+                digest = hashlib.sha256() if hash_files else None
+
+            elif isinstance(event, Field):
+                current = None
+
+            elif isinstance(event, Data):
+                if current is None:
+                    continue
+                current.size += len(event.data)
+                error = None
+                if current.size > max_size:
+                    error = FileTooLarge(current.size)
+                elif accepted + current.size > quota_remaining:
+                    error = QuotaExceeded(current.size)
+                if error is not None:
+                    out.close()
+                    reject(current, error)
+                    current = None
+                    continue
+                out.write(event.data)
+                if digest is not None:
+                    digest.update(event.data)
+                if not event.more_data:
+                    out.close()
+                    accepted += current.size
+                    if digest is not None:
+                        current.sha256 = digest.hexdigest()
+                    current = None
+
+            elif isinstance(event, Epilogue):
+                break
+
+        if out is not None and not out.closed:
+            raise UploadError(400, 'Incomplete upload', current.size if current else 0)
+        if not received:
+            raise UploadError(400, 'No file provided')
+        return received
+
+    except BaseException:
+        if out is not None:
+            out.close()
+        for part in received:
+            part.discard()
+        raise
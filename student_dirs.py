@@ -0,0 +1,130 @@
+"""
+Where each student's upload directory lives
+The flat layout keeps every student directly under the upload
+directory (<upload_dir>/<netid>). The sharded layout fans them out by
+the SHA-256 of the NetID (<upload_dir>/3f/a2/<netid> for two levels of
+width 2), so no single directory grows to thousands of entries when
+one volume serves many sections and terms.
+
+scripts/migrate_layout.py moves existing students between layouts while
+the API keeps running; until a student has been moved, lookups fall
+back to the flat location.
+"""
+
+import hashlib
+import os
+import time
+
+# Shard directory names are short lowercase hex strings
+_HEX = frozenset('0123456789abcdef')
+MAX_SHARD_WIDTH = 8
+
+
+def shard_parts(netid, levels, width):
+    """Shard directory names of `netid`, outermost first"""
+    digest = hashlib.sha256(netid.encode('utf-8')).hexdigest()
+    return [digest[i * width:(i + 1) * width] for i in range(levels)]
+
+
+def _is_shard_name(name):
+    return 0 < len(name) <= MAX_SHARD_WIDTH and set(name) <= _HEX
+
+
+def _has_files(path):
+    try:
+        with os.scandir(path) as entries:
+            return any(e.is_file(follow_symlinks=False) for e in entries)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+
+def _subdirs(path):
+    try:
+        with os.scandir(path) as entries:
+            return [e for e in entries
+                    if not e.name.startswith('.') and e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def iter_students(base_dir):
+    """
+    Yield (netid, path) for every student directory under `base_dir`,
+    whatever layout (or mix of layouts) it was stored in. A directory
+    below a shard is a student only if the hash of its name matches the
+    shards it sits in; a hex-named top-level directory holding files is
+    a flat student whose NetID happens to look like a shard.
+    """
+    for entry in _subdirs(base_dir):
+        if _is_shard_name(entry.name) and not _has_files(entry.path):
+            yield from _walk_shard(entry.path, [entry.name])
+        else:
+            yield entry.name, entry.path
+
+
+def _walk_shard(path, parts):
+    width = len(parts[0])
+    for entry in _subdirs(path):
+        if shard_parts(entry.name, len(parts), width) == parts:
+            yield entry.name, entry.path
+        elif len(entry.name) == width and _is_shard_name(entry.name):
+            yield from _walk_shard(entry.path, parts + [entry.name])
+
+
+class StudentDirs:
+    """
+    Maps NetIDs to upload directories and remembers which ones are known
+    to exist, so a request only pays for os.makedirs() (and the search
+    for an unmigrated flat directory) the first time a worker sees a
+    student, and again every `cache_seconds`. A cached directory is still
+    stat()ed, so one removed behind the worker's back (e.g. by cleanup)
+    is created again on the next request.
+    """
+
+    def __init__(self, base_dir, shard_levels=0, shard_width=2, cache_seconds=300):
+        if shard_levels < 0 or not 1 <= shard_width <= MAX_SHARD_WIDTH:
+            raise ValueError(
+                f"shard_levels must be >= 0 and shard_width between 1 and {MAX_SHARD_WIDTH}"
+            )
+        if shard_levels * shard_width > 64:
+            raise ValueError("shard_levels * shard_width cannot exceed 64 hex digits")
+        self.base_dir = base_dir
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+        self.cache_seconds = cache_seconds
+        self._known = {}    # netid -> monotonic time the entry expires
+
+    def path(self, netid):
+        """Canonical directory of `netid` in the configured layout"""
+        return os.path.join(
+            self.base_dir, *shard_parts(netid, self.shard_levels, self.shard_width), netid
+        )
+
+    def flat_path(self, netid):
+        return os.path.join(self.base_dir, netid)
+
+    def get(self, netid):
+        """Directory of `netid`, created if needed"""
+        path = self.path(netid)
+        now = time.monotonic()
+        if self._known.get(netid, 0) > now:
+            if os.path.isdir(path):
+                return path
+            self.forget(netid)
+
+        if self.shard_levels and not os.path.isdir(path):
+            legacy = self.flat_path(netid)
+            if os.path.isdir(legacy):
+                # Not migrated yet; not cached, so the move is seen at once
+                return legacy
+
+        os.makedirs(path, exist_ok=True)
+        self._known[netid] = now + self.cache_seconds
+        return path
+
+    def forget(self, netid):
+        """Drop the cached entry (the directory was moved or removed)"""
+        self._known.pop(netid, None)
+
+    def __iter__(self):
+        return iter_students(self.base_dir)
@@ -0,0 +1,125 @@
+"""
+Fixtures for the API tests: an app built with create_app() from
+config.toml.example, with every directory under pytest's tmp_path and
+two students (alice, bob). Limits are small (1 MB files, 2 MB quota) so
+tests can cross them with little data.
+"""
+
+import hashlib
+import importlib.util
+import io
+import os
+import sys
+import tomllib
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import android_api  # noqa: E402
+from token_store import save_tokens  # noqa: E402
+
+TOKENS = {'alice': 'tok-alice', 'bob': 'tok-bob'}
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def make_config(root, **sections):
+    """config.toml.example pointed at `root`, with `sections` merged in"""
+    with open(os.path.join(REPO_DIR, 'config.toml.example'), 'rb') as f:
+        config = tomllib.load(f)
+    config['paths'].update(
+        upload_dir=os.path.join(root, 'uploads'),
+        token_dir=os.path.join(root, 'tokens'),
+        log_dir=os.path.join(root, 'logs'),
+        state_dir=os.path.join(root, 'state'),
+    )
+    config['storage'].update(max_file_size_mb=1, student_quota_mb=2)
+    config['security']['enable_rate_limiting'] = False
+    for section, values in sections.items():
+        config.setdefault(section, {}).update(values)
+    return config
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """make_app(**sections) -> Flask app with `sections` overriding the defaults"""
+    def make(**sections):
+        config = make_config(str(tmp_path), **sections)
+        os.makedirs(config['paths']['upload_dir'], exist_ok=True)
+        save_tokens(os.path.join(config['paths']['token_dir'], 'tokens.json'), TOKENS)
+        return android_api.create_app(config)
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def auth(netid='alice', **headers):
+    return {'X-Auth-Token': TOKENS[netid], **headers}
+
+
+def payload(size, seed=b'x'):
+    """`size` bytes that don't compress to nothing"""
+    block = hashlib.sha256(seed).digest()
+    data = bytearray()
+    while len(data) < size:
+        block = hashlib.sha256(block).digest()
+        data += block
+    return bytes(data[:size])
+
+
+def upload(client, name, data, netid='alice'):
+    return client.post(
+        '/android/upload', headers=auth(netid),
+        data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data'
+    )
+
+
+def usage(app, netid='alice'):
+    """Bytes charged to the student in the quota ledger"""
+    state = app.extensions['android_api']
+    return state.quota_ledger.usage(netid, state.get_student_dir(netid))
+
+
+def student_dir(app, netid='alice'):
+    return app.extensions['android_api'].get_student_dir(netid)
+
+
+def init_chunked(client, name, size, **params):
+    return client.post('/android/upload/init', headers=auth(),
+                       json={'filename': name, 'size': size, **params})
+
+
+def put_chunks(client, session, data, indexes=None):
+    """PUT chunks `indexes` (default: all) of `data`"""
+    if indexes is None:
+        indexes = range(session['total_chunks'])
+    for index in indexes:
+        chunk = data[index * session['chunk_size']:(index + 1) * session['chunk_size']]
+        response = client.put(
+            f"/android/upload/{session['upload_id']}/chunk/{index}", data=chunk,
+            headers=auth(**{'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()})
+        )
+        assert response.status_code == 200
+
+
+def load_script(name):
+    """scripts/<name>.py as a module (scripts/ isn't a package)"""
+    # Run as a script, it would find its sibling scripts on sys.path
+    scripts_dir = os.path.join(REPO_DIR, 'scripts')
+    if scripts_dir not in sys.path:
+        sys.path.append(scripts_dir)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_DIR, 'scripts', f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
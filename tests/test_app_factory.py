@@ -0,0 +1,84 @@
+"""create_app() and the app.py / app_with_config.py entry points"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import android_api
+from config_watch import ConfigError
+from conftest import REPO_DIR, TOKENS, auth, make_config, upload
+from token_store import save_tokens
+
+
+def python(code, cwd, **env):
+    return subprocess.run(
+        [sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': REPO_DIR, **env}
+    )
+
+
+def write_config(root):
+    """config.toml.example with its paths under `root`"""
+    with open(os.path.join(REPO_DIR, 'config.toml.example')) as f:
+        text = f.read()
+    for name in ('uploads', 'tokens', 'logs'):
+        text = text.replace(f'/path/to/{name}', os.path.join(root, name))
+    config_file = os.path.join(root, 'config.toml')
+    with open(config_file, 'w') as f:
+        f.write(text)
+    save_tokens(os.path.join(root, 'tokens', 'tokens.json'), TOKENS)
+    return config_file
+
+
+def test_import_has_no_side_effects(tmp_path):
+    result = python(
+        "import logging, android_api; print(len(logging.getLogger().handlers))",
+        cwd=str(tmp_path), ANDROID_API_CONFIG=str(tmp_path / 'missing.toml')
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '0'
+    assert os.listdir(tmp_path) == []
+
+
+def test_apps_are_independent(tmp_path):
+    apps = []
+    for name in ('one', 'two'):
+        config = make_config(str(tmp_path / name))
+        os.makedirs(config['paths']['upload_dir'])
+        save_tokens(os.path.join(config['paths']['token_dir'], 'tokens.json'), TOKENS)
+        apps.append(android_api.create_app(config))
+    one, two = (app.test_client() for app in apps)
+
+    assert upload(one, 'a.csv', b'one').status_code == 201
+    assert [f['filename'] for f in one.get('/android/list', headers=auth()).get_json()['files']] == ['a.csv']
+    assert two.get('/android/list', headers=auth()).get_json()['files'] == []
+    assert apps[0].extensions['android_api'] is not apps[1].extensions['android_api']
+
+
+def test_invalid_config_is_refused(tmp_path):
+    config = make_config(str(tmp_path))
+    config['storage']['max_file_size_mb'] = 0
+    with pytest.raises(ConfigError):
+        android_api.create_app(config)
+
+
+@pytest.mark.parametrize('module', ['app', 'app_with_config'])
+def test_entry_points(tmp_path, module):
+    config_file = write_config(str(tmp_path))
+    result = python(
+        f"import {module}; state = {module}.app.extensions['android_api']; "
+        "print(state.upload_dir); print(state.config_watcher.path)",
+        cwd=str(tmp_path), ANDROID_API_CONFIG=config_file
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == [str(tmp_path / 'uploads'), config_file]
+
+
+@pytest.mark.parametrize('module', ['app', 'app_with_config'])
+def test_entry_points_report_a_missing_config(tmp_path, module):
+    result = python(f"import {module}", cwd=str(tmp_path),
+                    ANDROID_API_CONFIG=str(tmp_path / 'missing.toml'))
+    assert result.returncode == 1
+    assert 'config.toml not found' in result.stdout
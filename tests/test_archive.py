@@ -0,0 +1,93 @@
+"""Streamed ZIP archives of a student's files"""
+
+import io
+import os
+import zipfile
+
+import pytest
+
+from conftest import KB, auth, payload, student_dir, upload
+from zip_stream import stream_zip
+
+FILES = {
+    'a.csv': b'timestamp,reading\n' * 2000,
+    'b.csv': payload(20 * KB, b'b'),
+    'photo.jpg': payload(50 * KB, b'p'),
+}
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    for name, data in FILES.items():
+        assert upload(client, name, data).status_code == 201
+    return client
+
+
+def archive(client, **params):
+    return client.get('/android/archive', headers=auth(), query_string=params)
+
+
+def contents(response):
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+def test_whole_archive(client):
+    response = archive(client)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="alice-files.zip"'
+    assert contents(response) == FILES
+
+
+@pytest.mark.parametrize('compression, compress_type', [
+    ('store', zipfile.ZIP_STORED), ('deflate', zipfile.ZIP_DEFLATED)
+])
+def test_compression(client, compression, compress_type):
+    response = archive(client, compression=compression)
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert {info.compress_type for info in zf.infolist()} == {compress_type}
+    assert contents(response) == FILES
+
+
+def test_filters(app, client):
+    assert set(contents(archive(client, files='a.csv,photo.jpg'))) == {'a.csv', 'photo.jpg'}
+    assert set(contents(archive(client, pattern='*.csv'))) == {'a.csv', 'b.csv'}
+    assert set(contents(archive(client, files='a.csv,photo.jpg', pattern='*.csv'))) == {'a.csv'}
+
+    response = archive(client, files='a.csv,nope.csv')
+    assert response.status_code == 404
+    assert response.get_json()['missing'] == ['nope.csv']
+    assert archive(client, pattern='*.txt').status_code == 404
+    assert archive(client, compression='bzip2').status_code == 400
+
+
+def test_since(make_app):
+    app = make_app()
+    client = app.test_client()
+    for name, data in FILES.items():
+        assert upload(client, name, data).status_code == 201
+    os.utime(os.path.join(student_dir(app), 'a.csv'), (1_000_000, 1_000_000))
+    os.utime(os.path.join(student_dir(app), 'b.csv'), (3_000_000, 3_000_000))
+    os.utime(os.path.join(student_dir(app), 'photo.jpg'), (3_000_000, 3_000_000))
+    assert set(contents(archive(client, since='2000000'))) == {'b.csv', 'photo.jpg'}
+
+
+def test_compressed_files_are_archived_decoded(make_app):
+    app = make_app(compression={'enabled': True})
+    client = app.test_client()
+    assert upload(client, 'a.csv', FILES['a.csv']).status_code == 201
+    assert contents(archive(client)) == {'a.csv': FILES['a.csv']}
+
+
+def test_stream_zip_skips_vanished_files(tmp_path):
+    (tmp_path / 'a.txt').write_bytes(b'a' * 1000)
+    files = [('a.txt', str(tmp_path / 'a.txt')), ('gone.txt', str(tmp_path / 'gone.txt'))]
+    # Small chunks: the archive comes out in many pieces
+    chunks = list(stream_zip(files, 'store', chunk_size=100))
+    assert len(chunks) > 10
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert zf.namelist() == ['a.txt']
+        assert zf.read('a.txt') == b'a' * 1000
+        assert zf.testzip() is None
@@ -0,0 +1,84 @@
+"""The ASGI adapter (asgi.py) driven with hand-made ASGI messages"""
+
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+from conftest import REPO_DIR, TOKENS, payload
+from token_store import save_tokens
+
+BOUNDARY = 'asgi-test-boundary'
+
+
+@pytest.fixture(scope='module')
+def asgi(tmp_path_factory):
+    """asgi.py imported against a config.toml written for this module"""
+    root = str(tmp_path_factory.mktemp('asgi'))
+    with open(os.path.join(REPO_DIR, 'config.toml.example')) as f:
+        text = f.read()
+    for name in ('uploads', 'tokens', 'logs'):
+        os.makedirs(os.path.join(root, name))
+        text = text.replace(f'/path/to/{name}', os.path.join(root, name))
+    config_file = os.path.join(root, 'config.toml')
+    with open(config_file, 'w') as f:
+        f.write(text)
+    save_tokens(os.path.join(root, 'tokens', 'tokens.json'), TOKENS)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('ANDROID_API_CONFIG', config_file)
+        yield importlib.import_module('asgi')
+
+
+def call(app, method, path, headers=(), body_parts=(b'',)):
+    """Run one request through `app`; returns (status, headers, body)"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'http_version': '1.1', 'scheme': 'http',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+    incoming = [
+        {'type': 'http.request', 'body': part, 'more_body': i < len(body_parts) - 1}
+        for i, part in enumerate(body_parts)
+    ]
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.Event().wait()    # client stays connected
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), body
+
+
+def test_chunked_transfer_encoding_upload(asgi):
+    data = payload(200 * 1024)
+    body = (
+        f'--{BOUNDARY}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="notes.txt"\r\n'
+        'Content-Type: text/plain\r\n\r\n'
+    ).encode() + data + f'\r\n--{BOUNDARY}--\r\n'.encode()
+    # No Content-Length: the body arrives in pieces until more_body is false
+    parts = [body[i:i + 16 * 1024] for i in range(0, len(body), 16 * 1024)]
+
+    status, _, response = call(asgi.app, 'POST', '/android/upload', headers=[
+        ('X-Auth-Token', TOKENS['alice']),
+        ('Content-Type', f'multipart/form-data; boundary={BOUNDARY}'),
+        ('Transfer-Encoding', 'chunked'),
+    ], body_parts=parts)
+    assert status == 201, response
+    assert json.loads(response)['size_bytes'] == len(data)
+
+    status, headers, response = call(asgi.app, 'GET', '/android/download/notes.txt',
+                                     headers=[('X-Auth-Token', TOKENS['alice'])])
+    assert status == 200
+    assert headers['content-length'] == str(len(data))
+    assert response == data
@@ -0,0 +1,109 @@
+"""Batch uploads: all-or-nothing with ?atomic=1, per-file results without"""
+
+import io
+import os
+
+import pytest
+
+import compressed_store
+from conftest import KB, auth, payload, student_dir, upload, usage
+
+OLD = payload(100 * KB, b'old')
+NEW = payload(100 * KB, b'new')
+
+
+def batch(client, files, atomic=True):
+    return client.post(
+        '/android/upload/batch' + ('?atomic=1' if atomic else ''), headers=auth(),
+        data={'files': [(io.BytesIO(data), name) for name, data in files]},
+        content_type='multipart/form-data'
+    )
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(storage={'duplicate_policy': 'overwrite'})
+
+
+def test_batch_counts_the_whole_batch(app, client):
+    response = batch(client, [
+        ('one.pdf', payload(900 * KB, b'1')),
+        ('two.pdf', payload(900 * KB, b'2')),
+        ('three.pdf', payload(900 * KB, b'3')),
+    ], atomic=False)
+    assert response.status_code == 207
+    statuses = [f['status'] for f in response.get_json()['files']]
+    assert statuses == [201, 201, 507]
+    assert usage(app) == 1800 * KB
+
+
+def test_atomic_batch_over_quota_stores_nothing(app, client):
+    response = batch(client, [
+        ('one.pdf', payload(900 * KB, b'1')),
+        ('two.pdf', payload(900 * KB, b'2')),
+        ('three.pdf', payload(900 * KB, b'3')),
+    ])
+    assert response.status_code == 507
+    assert usage(app) == 0
+    assert client.get('/android/list', headers=auth()).get_json()['files'] == []
+
+
+def test_atomic_batch_refused_while_staging(app, client):
+    assert upload(client, 'a.txt', OLD).status_code == 201
+    forged = compressed_store._gzip_header(1) + NEW
+
+    response = batch(client, [('a.txt', NEW), ('b.txt', forged)])
+    assert response.status_code == 415
+    assert response.get_json()['filename'] == 'b.txt'
+    assert client.get('/android/download/a.txt', headers=auth()).data == OLD
+    assert os.listdir(student_dir(app)) == ['a.txt']
+    assert usage(app) == len(OLD)
+
+
+def test_atomic_batch_rolls_back_published_files(app, client, monkeypatch):
+    assert upload(client, 'a.txt', OLD).status_code == 201
+
+    # a.txt is published, then publishing b.txt fails
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if os.path.basename(dst) == 'b.txt':
+            raise OSError(28, 'No space left on device')
+        return real_replace(src, dst)
+    monkeypatch.setattr(os, 'replace', replace)
+    assert batch(client, [('a.txt', NEW), ('b.txt', NEW)]).status_code == 500
+    monkeypatch.undo()
+
+    assert client.get('/android/download/a.txt', headers=auth()).data == OLD
+    assert os.listdir(student_dir(app)) == ['a.txt']
+    assert usage(app) == len(OLD)
+
+
+def test_atomic_batch_with_repeated_name(client):
+    response = batch(client, [('a.txt', OLD), ('a.txt', NEW)])
+    assert response.status_code == 400
+    assert client.get('/android/download/a.txt', headers=auth()).status_code == 404
+
+
+def test_atomic_batch_under_version_policy(make_app):
+    app = make_app(storage={'duplicate_policy': 'version'})
+    client = app.test_client()
+    assert upload(client, 'a.txt', OLD).status_code == 201
+
+    response = batch(client, [('a.txt', NEW), ('b.txt', NEW)])
+    assert response.status_code == 201
+    assert [f['stored_as'] for f in response.get_json()['files']] == ['a.txt', 'b.txt']
+    assert client.get('/android/versions/a.txt/1', headers=auth()).data == OLD
+
+
+def test_quota_rejections_in_a_batch_are_counted(make_app):
+    client = make_app(metrics={'enabled': True, 'token': 'secret'}).test_client()
+    response = batch(client, [
+        ('one.pdf', payload(900 * KB, b'1')),
+        ('two.pdf', payload(900 * KB, b'2')),
+        ('three.pdf', payload(900 * KB, b'3')),
+    ], atomic=False)
+    assert [f['status'] for f in response.get_json()['files']] == [201, 201, 507]
+
+    metrics = client.get('/android/metrics', headers={'Authorization': 'Bearer secret'})
+    assert b'android_api_quota_rejections_total 1' in metrics.data
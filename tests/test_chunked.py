@@ -0,0 +1,229 @@
+"""Resumable chunked uploads: resume, complete, abort, expiry and quota"""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from config_watch import Limits
+from conftest import KB, auth, init_chunked, payload, put_chunks, student_dir, upload, usage
+
+DATA = payload(150 * KB)
+
+
+@pytest.fixture
+def app(make_app):
+    # 64 KB chunks: DATA is 3 chunks, the last one short
+    return make_app(uploads={'chunk_size_kb': 64})
+
+
+def status(client, session):
+    return client.get(f"/android/upload/{session['upload_id']}", headers=auth())
+
+
+def complete(client, session):
+    return client.post(f"/android/upload/{session['upload_id']}/complete", headers=auth())
+
+
+def test_resume_and_complete(app, client):
+    session = init_chunked(client, 'log.pdf', len(DATA), sha256=hashlib.sha256(DATA).hexdigest()).get_json()
+    assert session['total_chunks'] == 3
+
+    # Out of order, and interrupted
+    put_chunks(client, session, DATA, [2, 0])
+    progress = status(client, session).get_json()
+    assert progress['received_chunks'] == [0, 2]
+    assert progress['missing_chunks'] == [1]
+
+    assert complete(client, session).status_code == 409
+
+    # Resumed
+    put_chunks(client, session, DATA, [1])
+    response = complete(client, session)
+    assert response.status_code == 201
+    assert response.get_json()['filename'] == 'log.pdf'
+
+    assert client.get('/android/download/log.pdf', headers=auth()).data == DATA
+    assert status(client, session).status_code == 404
+    assert sorted(os.listdir(student_dir(app))) == ['log.pdf']
+
+
+def test_chunk_checks(client):
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    url = f"/android/upload/{session['upload_id']}/chunk/0"
+    chunk = DATA[:64 * KB]
+
+    response = client.put(url, data=chunk, headers=auth(**{'X-Chunk-SHA256': '0' * 64}))
+    assert response.status_code == 422
+    response = client.put(url, data=chunk[:-1], headers=auth(
+        **{'X-Chunk-SHA256': hashlib.sha256(chunk[:-1]).hexdigest()}))
+    assert response.status_code == 400
+    response = client.put(f"/android/upload/{session['upload_id']}/chunk/3", data=chunk,
+                          headers=auth(**{'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()}))
+    assert response.status_code == 416
+
+
+def test_whole_file_checksum(client):
+    session = init_chunked(client, 'log.pdf', len(DATA), sha256='0' * 64).get_json()
+    put_chunks(client, session, DATA)
+    assert complete(client, session).status_code == 422
+    # Still open, so the client can re-send the chunks
+    assert status(client, session).status_code == 200
+
+
+def test_concurrent_completes(app, client):
+    uploads = app.extensions['android_api'].chunked_uploads
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    put_chunks(client, session, DATA)
+
+    # Another request has claimed the session and is publishing it
+    claimed = uploads.get(session['upload_id'], 'alice')
+    uploads.finalize(claimed)
+    assert complete(client, session).status_code == 409
+    assert usage(app) == len(DATA)
+
+    # Its publish failed: the session is open again
+    uploads.release(claimed)
+    assert complete(client, session).status_code == 201
+    assert complete(client, session).status_code == 404
+    assert usage(app) == len(DATA)
+
+
+def test_chunk_for_vanished_part_file(app, client):
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    os.remove(os.path.join(student_dir(app), f".upload-{session['upload_id']}.part"))
+    chunk = DATA[:64 * KB]
+    response = client.put(f"/android/upload/{session['upload_id']}/chunk/0", data=chunk,
+                          headers=auth(**{'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()}))
+    assert response.status_code == 404
+
+
+def test_sessions_are_private(client):
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    response = client.get(f"/android/upload/{session['upload_id']}", headers=auth('bob'))
+    assert response.status_code == 404
+
+
+def test_abort(app, client):
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    put_chunks(client, session, DATA, [0])
+
+    response = client.delete(f"/android/upload/{session['upload_id']}", headers=auth())
+    assert response.status_code == 200
+    assert status(client, session).status_code == 404
+    assert os.listdir(student_dir(app)) == []
+    assert usage(app) == 0
+
+
+def test_abandoned_sessions_expire(app, client):
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    put_chunks(client, session, DATA, [0])
+    assert usage(app) == len(DATA)
+
+    uploads = app.extensions['android_api'].chunked_uploads
+    assert uploads.collect_garbage() == 0
+
+    # Last activity a day and a bit ago
+    stale = time.time() - uploads.session_ttl - 60
+    for name in os.listdir(uploads.state_dir):
+        os.utime(os.path.join(uploads.state_dir, name), (stale, stale))
+    assert uploads.collect_garbage() == 1
+
+    assert status(client, session).status_code == 404
+    assert os.listdir(student_dir(app)) == []
+    assert os.listdir(uploads.state_dir) == []
+    # The reservation went with it
+    assert usage(app) == 0
+
+
+def test_crash_leftovers_and_orphans_are_collected(app, client):
+    uploads = app.extensions['android_api'].chunked_uploads
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    # The student directory was removed under the session
+    os.remove(os.path.join(student_dir(app), f".upload-{session['upload_id']}.part"))
+    # A create() that died before publishing its metadata
+    leftover = os.path.join(uploads.state_dir, 'x' * 22 + '.json.tmp')
+    open(leftover, 'w').close()
+    assert uploads.collect_garbage() == 0
+
+    stale = time.time() - 7200
+    for name in os.listdir(uploads.state_dir):
+        os.utime(os.path.join(uploads.state_dir, name), (stale, stale))
+    assert uploads.collect_garbage() == 1
+    assert os.listdir(uploads.state_dir) == []
+    assert usage(app) == 0
+
+    # A complete that died after claiming its session
+    session = init_chunked(client, 'log.pdf', len(DATA)).get_json()
+    put_chunks(client, session, DATA)
+    uploads.finalize(uploads.get(session['upload_id'], 'alice'))
+    assert uploads.collect_garbage() == 0
+    uploads.session_ttl = -60
+    assert uploads.collect_garbage() == 1
+    assert os.listdir(uploads.state_dir) == []
+    assert usage(app) == 0
+
+
+def test_open_sessions_are_capped(make_app):
+    app = make_app(uploads={'chunk_size_kb': 64, 'max_sessions_per_student': 2})
+    client = app.test_client()
+    first = init_chunked(client, 'a.pdf', 10).get_json()
+    assert init_chunked(client, 'b.pdf', 10).status_code == 201
+    assert init_chunked(client, 'c.pdf', 10).status_code == 429
+
+    client.delete(f"/android/upload/{first['upload_id']}", headers=auth())
+    assert init_chunked(client, 'c.pdf', 10).status_code == 201
+
+
+def test_chunked_init_over_quota_is_refused(app, client):
+    assert upload(client, 'one.pdf', payload(900 * KB, b'1')).status_code == 201
+    assert upload(client, 'two.pdf', payload(900 * KB, b'2')).status_code == 201
+    assert init_chunked(client, 'three.pdf', 900 * KB).status_code == 507
+
+
+def test_chunked_init_reserves_quota(app, client):
+    data = payload(900 * KB, b'3')
+    session = init_chunked(client, 'three.pdf', len(data)).get_json()
+    assert usage(app) == 900 * KB
+
+    # The reservation counts against other uploads
+    assert upload(client, 'one.pdf', payload(900 * KB, b'1')).status_code == 201
+    assert upload(client, 'two.pdf', payload(900 * KB, b'2')).status_code == 507
+
+    put_chunks(client, session, data)
+    response = complete(client, session)
+    assert response.status_code == 201
+    assert usage(app) == 1800 * KB
+
+
+def test_chunked_reservation_survives_reconcile(app, client):
+    init_chunked(client, 'three.pdf', 900 * KB)
+    state = app.extensions['android_api']
+    assert state.quota_ledger.reconcile('alice', student_dir(app)) == 900 * KB
+
+
+def test_chunked_complete_rechecks_quota(app, client):
+    data = payload(900 * KB, b'3')
+    session = init_chunked(client, 'three.pdf', len(data)).get_json()
+    put_chunks(client, session, data)
+    assert upload(client, 'one.pdf', payload(900 * KB, b'1')).status_code == 201
+
+    # Quota lowered since init
+    state = app.extensions['android_api']
+    state.config_watcher.limits = Limits(
+        dict(state.config, storage=dict(state.config['storage'], student_quota_mb=1))
+    )
+    response = complete(client, session)
+    assert response.status_code == 507
+    assert usage(app) == 900 * KB
+
+
+def test_chunked_upload_is_charged_on_complete(app, client):
+    data = payload(700 * KB)
+    session = init_chunked(client, 'seven.pdf', len(data)).get_json()
+    put_chunks(client, session, data)
+
+    response = complete(client, session)
+    assert response.status_code == 201
+    assert usage(app) == 700 * KB
@@ -0,0 +1,128 @@
+"""scripts/cleanup.py: per-student backups, verification, resume and deletion"""
+
+import gzip
+import os
+import sys
+import tarfile
+
+import pytest
+
+from conftest import KB, load_script, payload, student_dir, upload, usage
+
+cleanup = load_script('cleanup')
+
+
+@pytest.fixture(autouse=True)
+def importable(monkeypatch):
+    # Worker processes look the archive/verify functions up by module name
+    monkeypatch.setitem(sys.modules, 'cleanup', cleanup)
+
+
+@pytest.fixture
+def settings(app, client, tmp_path):
+    assert upload(client, 'one.pdf', payload(300 * KB, b'1')).status_code == 201
+    assert upload(client, 'two.pdf', payload(200 * KB, b'2')).status_code == 201
+    assert upload(client, 'one.pdf', payload(100 * KB, b'3'), netid='bob').status_code == 201
+    state = app.extensions['android_api']
+    return {
+        'upload_dir': state.upload_dir,
+        'state_dir': state.state_dir,
+        'backup_dir': str(tmp_path / 'backups'),
+        'log_dir': state.config['paths']['log_dir'],
+        'dedup': False,
+        'thumbnail_dir': str(tmp_path / 'thumbnails'),
+    }
+
+
+def backup(settings):
+    students = cleanup.list_students(settings['upload_dir'])
+    return cleanup.run_backup(settings, students, cleanup.Cleanup(settings), workers=2, level=1)
+
+
+def members(path):
+    with tarfile.open(path, 'r:gz') as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar if m.isreg()}
+
+
+def test_backup_verifies_then_deletes(app, settings):
+    alice_dir = student_dir(app)
+    originals = {f"alice/{name}": open(os.path.join(alice_dir, name), 'rb').read()
+                 for name in os.listdir(alice_dir)}
+
+    run_dir, failures = backup(settings)
+    assert failures == []
+    assert cleanup.list_students(settings['upload_dir']) == {}
+    assert members(os.path.join(run_dir, 'alice.tar.gz')) == originals
+    assert set(members(os.path.join(run_dir, 'bob.tar.gz'))) == {'bob/one.pdf'}
+
+    manifest = cleanup.Manifest(run_dir)
+    assert manifest.complete
+    assert {netid: event['status'] for netid, event in manifest.students.items()} == {
+        'alice': 'deleted', 'bob': 'deleted'
+    }
+    with open(os.path.join(run_dir, 'SHA256SUMS')) as f:
+        sums = dict(line.split()[::-1] for line in f)
+    assert sums['alice.tar.gz'] == cleanup.hash_archive(os.path.join(run_dir, 'alice.tar.gz'))
+    # The next run starts afresh
+    assert cleanup.find_run(settings['backup_dir']) is None
+
+
+def test_interrupted_run_is_resumed(app, settings):
+    students = cleanup.list_students(settings['upload_dir'])
+    run_dir = os.path.join(settings['backup_dir'], cleanup.RUN_PREFIX + '20260101_000000')
+    os.makedirs(run_dir)
+    manifest = cleanup.Manifest(run_dir)
+    # alice was archived (and verified, but not deleted) before the crash
+    entry = cleanup.archive_student('alice', students['alice'], run_dir, 1)
+    manifest.record({**entry, 'status': 'archived'})
+    manifest.record({**entry, 'status': 'verified'})
+    archived = os.stat(os.path.join(run_dir, 'alice.tar.gz')).st_mtime_ns
+    with open(manifest.path, 'a') as f:
+        f.write('{"netid": "bob", "sta')      # torn last line
+
+    assert cleanup.find_run(settings['backup_dir']) == run_dir
+    assert backup(settings) == (run_dir, [])
+    # alice's archive was kept, not rewritten
+    assert os.stat(os.path.join(run_dir, 'alice.tar.gz')).st_mtime_ns == archived
+    assert cleanup.list_students(settings['upload_dir']) == {}
+    assert cleanup.Manifest(run_dir).complete
+
+
+def test_damaged_archive_keeps_the_student(app, settings):
+    students = cleanup.list_students(settings['upload_dir'])
+    run_dir = os.path.join(settings['backup_dir'], cleanup.RUN_PREFIX + '20260101_000000')
+    os.makedirs(run_dir)
+    entry = cleanup.archive_student('alice', students['alice'], run_dir, 1)
+    assert cleanup.verify_archive(run_dir, entry) is None
+    assert cleanup.verify_archive(run_dir, {**entry, 'files': 3}).startswith('contents differ')
+
+    cleanup.Manifest(run_dir).record({**entry, 'status': 'archived'})
+    with open(os.path.join(run_dir, 'alice.tar.gz'), 'r+b') as f:
+        f.seek(100)
+        f.write(b'\0' * 16)
+    assert cleanup.verify_archive(run_dir, entry) == 'checksum mismatch'
+
+    run, failures = backup(settings)
+    assert failures == [('alice', 'verification failed: checksum mismatch')]
+    # Not deleted, and the run stays open to be resumed
+    assert list(cleanup.list_students(settings['upload_dir'])) == ['alice']
+    assert cleanup.find_run(settings['backup_dir']) == run_dir
+
+
+def test_deleted_students_lose_their_state(app, settings):
+    assert usage(app) > 0
+    alice_dir = student_dir(app)
+    cleanup_state = cleanup.Cleanup(settings)
+    cleanup_state.delete_student('alice', alice_dir)
+    cleanup_state.finish()
+    assert not os.path.exists(alice_dir)
+    # The ledger rescans (an empty directory) instead of keeping the old total
+    assert 'alice' not in app.extensions['android_api'].quota_ledger.snapshot()
+
+
+def test_rotate_log(tmp_path):
+    (tmp_path / 'api.log').write_text('line\n')
+    archive = cleanup.rotate_log(str(tmp_path))
+    assert (tmp_path / 'api.log').read_text() == ''
+    with gzip.open(archive) as f:
+        assert f.read() == b'line\n'
@@ -0,0 +1,55 @@
+"""At-rest compression and its stream marker"""
+
+import gzip
+import io
+
+import pytest
+
+import compressed_store
+from conftest import KB, auth, payload, upload, usage
+
+TEXT = b'timestamp,reading\n' + b''.join(b'%d,%d\n' % (i, i % 97) for i in range(20000))
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(compression={'enabled': True})
+
+
+def test_compressed_round_trip(app, client):
+    assert upload(client, 'log.csv', TEXT).status_code == 201
+    # Charged as uploaded ("logical"), listed with the original size
+    assert usage(app) == len(TEXT)
+    listing = client.get('/android/list', headers=auth()).get_json()
+    assert listing['files'][0]['size_bytes'] == len(TEXT)
+
+    response = client.get('/android/download/log.csv', headers=auth(**{'Accept-Encoding': 'gzip'}))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == TEXT
+
+    response = client.get('/android/download/log.csv', headers=auth(**{'Accept-Encoding': 'identity'}))
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == TEXT
+
+
+@pytest.mark.parametrize('enabled', [True, False])
+def test_forged_marker_is_refused(make_app, enabled):
+    app = make_app(compression={'enabled': enabled})
+    client = app.test_client()
+    # Claims to be a 1-byte file stored compressed
+    forged = compressed_store._gzip_header(1) + payload(200 * KB)
+
+    response = upload(client, 'forged.txt', forged)
+    assert response.status_code == 415
+    assert usage(app) == 0
+    assert client.get('/android/download/forged.txt', headers=auth()).status_code == 404
+
+    response = client.post(
+        '/android/upload/batch', headers=auth(), content_type='multipart/form-data',
+        data={'files': [(io.BytesIO(forged), 'forged.txt'), (io.BytesIO(TEXT), 'log.csv')]}
+    )
+    assert [f['status'] for f in response.get_json()['files']] == [415, 201]
+    assert usage(app) == len(TEXT)
+
+    response = client.get('/android/download/log.csv', headers=auth(**{'Accept-Encoding': 'gzip'}))
+    assert response.headers.get('Content-Encoding') == ('gzip' if enabled else None)
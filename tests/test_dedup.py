@@ -0,0 +1,92 @@
+"""Deduplicated storage: shared blobs, charging and migration"""
+
+import os
+
+import pytest
+
+from conftest import KB, auth, load_script, payload, student_dir, upload, usage
+from dedup_store import ObjectStore
+from student_dirs import iter_students
+
+DATA = payload(100 * KB)
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(storage={'dedup': True})
+
+
+def blobs(app):
+    objects_dir = app.extensions['android_api'].object_store.objects_dir
+    return [name for _, _, files in os.walk(objects_dir) for name in files]
+
+
+def test_identical_uploads_share_one_blob(app, client):
+    assert upload(client, 'a.csv', DATA).status_code == 201
+    assert upload(client, 'b.csv', DATA, netid='bob').status_code == 201
+
+    a = os.stat(os.path.join(student_dir(app), 'a.csv'))
+    b = os.stat(os.path.join(student_dir(app, 'bob'), 'b.csv'))
+    assert a.st_ino == b.st_ino
+    assert len(blobs(app)) == 1
+    # Each student is charged for their own copy
+    assert usage(app) == usage(app, 'bob') == len(DATA)
+
+    response = client.get('/android/download/b.csv', headers=auth('bob'))
+    assert response.data == DATA
+
+
+def test_a_second_copy_is_free(app, client):
+    assert upload(client, 'a.csv', DATA).status_code == 201
+    assert upload(client, 'b.csv', DATA).status_code == 201
+    assert upload(client, 'c.csv', payload(10 * KB, b'c')).status_code == 201
+    assert usage(app) == len(DATA) + 10 * KB
+    # A rescan of the directory agrees
+    state = app.extensions['android_api']
+    assert state.quota_ledger.reconcile('alice', student_dir(app)) == len(DATA) + 10 * KB
+
+    assert client.delete('/android/delete/a.csv', headers=auth()).status_code == 200
+    assert usage(app) == len(DATA) + 10 * KB
+    assert len(blobs(app)) == 2
+
+    assert client.delete('/android/delete/b.csv', headers=auth()).status_code == 200
+    assert usage(app) == 10 * KB
+    # The last link went with it
+    assert len(blobs(app)) == 1
+
+
+def test_overwrite_releases_the_old_blob(make_app):
+    app = make_app(storage={'dedup': True, 'duplicate_policy': 'overwrite'})
+    client = app.test_client()
+    assert upload(client, 'a.csv', DATA).status_code == 201
+    assert upload(client, 'a.csv', payload(10 * KB, b'c')).status_code == 201
+    assert usage(app) == 10 * KB
+    assert len(blobs(app)) == 1
+
+
+def test_migrate_to_dedup(make_app):
+    # Uploaded before dedup was enabled
+    app = make_app()
+    client = app.test_client()
+    for name, netid in (('a.csv', 'alice'), ('b.csv', 'alice'), ('a.csv', 'bob')):
+        assert upload(client, name, DATA, netid=netid).status_code == 201
+    upload_dir = app.extensions['android_api'].upload_dir
+    store = ObjectStore(upload_dir, os.path.join(app.extensions['android_api'].state_dir, 'objects.db'))
+
+    script = load_script('migrate_to_dedup')
+    seen = set()
+    dry_run = [script.migrate_student(store, netid, path, dry_run=True, dry_run_seen=seen)
+               for netid, path in sorted(iter_students(upload_dir))]
+    assert dry_run == [(2, len(DATA)), (1, len(DATA))]
+    assert os.listdir(store.objects_dir) == []
+
+    migrated = [script.migrate_student(store, netid, path)
+                for netid, path in sorted(iter_students(upload_dir))]
+    assert migrated == dry_run
+    inodes = {os.stat(os.path.join(student_dir(app, netid), name)).st_ino
+              for name, netid in (('a.csv', 'alice'), ('b.csv', 'alice'), ('a.csv', 'bob'))}
+    assert len(inodes) == 1
+    assert store.holds('bob', store.lookup('alice', 'b.csv')[0])
+
+    # Re-running skips what is already migrated
+    assert script.migrate_student(store, 'alice', student_dir(app)) == (0, 0)
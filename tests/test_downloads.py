@@ -0,0 +1,84 @@
+"""Range and conditional downloads"""
+
+import pytest
+
+from conftest import KB, auth, payload, upload
+
+DATA = payload(100 * KB)
+
+
+@pytest.fixture
+def stored(client):
+    assert upload(client, 'data.pdf', DATA).status_code == 201
+    return client
+
+
+def download(client, **headers):
+    return client.get('/android/download/data.pdf', headers=auth(**headers))
+
+
+def test_full_download(stored):
+    response = download(stored)
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag']
+
+
+def test_missing_file(client):
+    assert client.get('/android/download/none.pdf', headers=auth()).status_code == 404
+
+
+def test_other_students_files_are_invisible(stored):
+    assert stored.get('/android/download/data.pdf', headers=auth('bob')).status_code == 404
+
+
+def test_if_none_match(stored):
+    etag = download(stored).headers['ETag']
+    response = download(stored, **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    assert download(stored, **{'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_if_modified_since(stored):
+    last_modified = download(stored).headers['Last-Modified']
+    assert download(stored, **{'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_single_range(stored):
+    response = download(stored, Range='bytes=10-19')
+    assert response.status_code == 206
+    assert response.data == DATA[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(DATA)}'
+
+
+def test_open_and_suffix_ranges(stored):
+    assert download(stored, Range='bytes=102000-').data == DATA[102000:]
+    assert download(stored, Range='bytes=-100').data == DATA[-100:]
+
+
+def test_unsatisfiable_range(stored):
+    response = download(stored, Range=f'bytes={len(DATA)}-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_multiple_ranges(stored):
+    response = download(stored, Range='bytes=0-9,100-109')
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert DATA[0:10] in response.data and DATA[100:110] in response.data
+    assert f'Content-Range: bytes 100-109/{len(DATA)}'.encode() in response.data
+
+
+def test_if_range(stored):
+    etag = download(stored).headers['ETag']
+    response = download(stored, Range='bytes=0-9', **{'If-Range': etag})
+    assert response.status_code == 206
+
+    # The file changed since: the whole (new) file is sent
+    response = download(stored, Range='bytes=0-9', **{'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == DATA
@@ -0,0 +1,24 @@
+"""/android/list and its `since` filter"""
+
+import pytest
+
+from conftest import auth, upload
+
+
+def test_since_filters_the_listing(client):
+    assert upload(client, 'notes.txt', b'notes').status_code == 201
+    listing = client.get('/android/list', headers=auth()).get_json()
+    modified = listing['files'][0]['modified']
+
+    assert client.get('/android/list?since=0', headers=auth()).get_json()['files']
+    # A file's own `modified` value excludes it
+    response = client.get('/android/list', query_string={'since': modified}, headers=auth())
+    assert response.get_json()['files'] == []
+
+
+@pytest.mark.parametrize('since', ['inf', '-inf', 'nan', '1e300', '1e20', '0001-01-01', 'soon'])
+@pytest.mark.parametrize('path', ['/android/list', '/android/archive'])
+def test_bad_since_is_a_bad_request(client, path, since):
+    response = client.get(path, query_string={'since': since}, headers=auth())
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Invalid query parameter')
@@ -0,0 +1,90 @@
+"""JSON-lines logging: formatting, batched writes, rotation and access records"""
+
+import json
+import logging
+import os
+import queue
+
+import android_api
+from conftest import auth, payload, upload
+from log_pipeline import BatchFileWriter, BatchingQueueListener, JsonFormatter
+
+
+def make_record(message, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord('android_api', level, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter():
+    line = JsonFormatter().format(make_record('Upload of %s', 'a.csv', netid='alice', status=201))
+    data = json.loads(line)
+    assert data['message'] == 'Upload of a.csv'
+    assert data['level'] == 'INFO'
+    assert data['netid'] == 'alice'
+    assert data['status'] == 201
+    # Fields that weren't given are left out
+    assert 'latency_ms' not in data
+
+
+def test_listener_writes_batches(tmp_path):
+    path = str(tmp_path / 'api.log')
+    console = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            console.append(record.getMessage())
+    handler = ListHandler(level=logging.WARNING)
+
+    log_queue = queue.SimpleQueue()
+    listener = BatchingQueueListener(log_queue, BatchFileWriter(path), JsonFormatter(),
+                                     handlers=[handler], batch_size=10, flush_interval=60)
+    listener.start()
+    for i in range(25):
+        log_queue.put(make_record('record %s', i, level=logging.WARNING if i == 3 else logging.INFO))
+    # stop() flushes what is still queued
+    listener.stop()
+
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line['message'] for line in lines] == [f'record {i}' for i in range(25)]
+    assert console == ['record 3']
+
+
+def test_rotation(tmp_path):
+    path = str(tmp_path / 'api.log')
+    writer = BatchFileWriter(path, max_bytes=100, backup_count=2)
+    for i in range(5):
+        writer.write(['x' * 59])
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == ['api.log', 'api.log.1', 'api.log.2', 'api.log.lock']
+    for name in ('api.log', 'api.log.1', 'api.log.2'):
+        assert os.path.getsize(tmp_path / name) == 60
+
+
+def test_writer_follows_a_rotation_by_another_process(tmp_path):
+    path = str(tmp_path / 'api.log')
+    writer = BatchFileWriter(path)
+    writer.write(['one'])
+    os.rename(path, path + '.1')
+    writer.write(['two'])
+    writer.close()
+    assert open(path).read() == 'two\n'
+
+
+def test_access_records(make_app, monkeypatch, caplog):
+    # Keep the test run's own logging set-up
+    monkeypatch.setattr(android_api, '_logging_configured', 'tests')
+    app = make_app(logging={'mode': 'json'})
+    client = app.test_client()
+
+    with caplog.at_level(logging.INFO, logger='android_api.access'):
+        # Access records are written once the response is closed
+        for response in (upload(client, 'a.csv', payload(1000)),
+                         client.get('/android/list', headers=auth())):
+            response.close()
+
+    records = [r for r in caplog.records if r.name == 'android_api.access']
+    assert [(r.method, r.status, r.netid) for r in records] == [('POST', 201, 'alice'), ('GET', 200, 'alice')]
+    assert records[0].bytes >= 1000
+    assert records[0].latency_ms >= 0
@@ -0,0 +1,61 @@
+"""/android/metrics access"""
+
+import threading
+
+import pytest
+
+from config_watch import ConfigError
+from metrics import Metrics
+
+
+def scrape(client, **kwargs):
+    return client.get('/android/metrics', **kwargs)
+
+
+def test_disabled_by_default(client):
+    assert scrape(client).status_code == 404
+
+
+def test_enabling_needs_a_token_or_local_only(make_app):
+    with pytest.raises(ConfigError):
+        make_app(metrics={'enabled': True})
+
+
+def test_token(make_app):
+    client = make_app(metrics={'enabled': True, 'token': 'secret'}).test_client()
+    assert scrape(client).status_code == 401
+    assert scrape(client, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = scrape(client, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert b'android_api_student_quota_bytes' in response.data
+
+
+def test_local_only(make_app):
+    client = make_app(metrics={'enabled': True, 'local_only': True}).test_client()
+    assert scrape(client).status_code == 200
+    # Through the reverse proxy, or from another host
+    assert scrape(client, headers={'X-Forwarded-For': '203.0.113.9'}).status_code == 403
+    assert scrape(client, environ_base={'REMOTE_ADDR': '203.0.113.9'}).status_code == 403
+
+
+def test_concurrent_flushes(tmp_path):
+    metrics = Metrics(str(tmp_path))
+    errors = []
+
+    def flush():
+        try:
+            for _ in range(200):
+                metrics.inc('android_api_requests_total')
+                metrics.flush()
+        except OSError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=flush) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Threads of one worker share its snapshot file
+    assert errors == []
+    assert 'android_api_requests_total 1600' in metrics.render()
@@ -0,0 +1,72 @@
+"""Duplicate names: suffix counters, claims and their placeholders"""
+
+import os
+import threading
+
+from conftest import auth, student_dir, upload
+
+
+def listed(client):
+    return [f['filename'] for f in client.get('/android/list', headers=auth()).get_json()['files']]
+
+
+def test_claimed_name_is_hidden_until_published(app, client):
+    state = app.extensions['android_api']
+    # An upload claimed notes.txt and is still compressing / hashing
+    assert state.name_index.claim('alice', student_dir(app), 'notes.txt') == 'notes.txt'
+
+    assert listed(client) == []
+    assert client.get('/android/download/notes.txt', headers=auth()).status_code == 404
+    assert client.delete('/android/delete/notes.txt', headers=auth()).status_code == 404
+    assert client.get('/android/archive', headers=auth()).status_code == 404
+
+    # The name stays taken
+    assert upload(client, 'notes.txt', b'second').get_json()['filename'] == 'notes_1.txt'
+    assert listed(client) == ['notes_1.txt']
+
+
+def test_empty_uploads_are_listed(app, client):
+    assert upload(client, 'empty.txt', b'').status_code == 201
+    assert listed(client) == ['empty.txt']
+    response = client.get('/android/download/empty.txt', headers=auth())
+    assert response.status_code == 200
+    assert response.data == b''
+    assert os.stat(os.path.join(student_dir(app), 'empty.txt')).st_mode & 0o777
+
+
+def test_suffixes_count_up_and_are_never_reused(app, client):
+    names = [upload(client, 'notes.txt', b'v%d' % i).get_json()['filename'] for i in range(3)]
+    assert names == ['notes.txt', 'notes_1.txt', 'notes_2.txt']
+
+    assert client.delete('/android/delete/notes_2.txt', headers=auth()).status_code == 200
+    assert upload(client, 'notes.txt', b'v3').get_json()['filename'] == 'notes_3.txt'
+    # Counters are per student
+    assert upload(client, 'notes.txt', b'bob', netid='bob').get_json()['filename'] == 'notes.txt'
+
+
+def test_counter_starts_after_existing_suffixes(app, client):
+    # Files from before the counter existed (or copied in by hand)
+    for name in ('notes.txt', 'notes_7.txt', 'notes_x.txt'):
+        with open(os.path.join(student_dir(app), name), 'wb') as f:
+            f.write(b'old')
+    assert upload(client, 'notes.txt', b'new').get_json()['filename'] == 'notes_8.txt'
+
+    # A file put in the counter's way is skipped
+    with open(os.path.join(student_dir(app), 'notes_9.txt'), 'wb') as f:
+        f.write(b'old')
+    assert upload(client, 'notes.txt', b'new').get_json()['filename'] == 'notes_10.txt'
+
+
+def test_concurrent_claims_get_distinct_names(app):
+    state = app.extensions['android_api']
+    directory = student_dir(app)
+    names = []
+
+    def claim():
+        names.append(state.name_index.claim('alice', directory, 'notes.txt'))
+    threads = [threading.Thread(target=claim) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(names) == sorted(['notes.txt'] + [f'notes_{n}.txt' for n in range(1, 20)])
@@ -0,0 +1,36 @@
+"""Size and quota limits on streamed uploads (2 MB quota, 1 MB files)"""
+
+import os
+
+from conftest import KB, MB, auth, payload, student_dir, upload, usage
+
+
+def test_upload_charges_and_delete_refunds(app, client):
+    assert upload(client, 'notes.txt', payload(300 * KB)).status_code == 201
+    assert usage(app) == 300 * KB
+
+    assert client.delete('/android/delete/notes.txt', headers=auth()).status_code == 200
+    assert usage(app) == 0
+
+
+def test_upload_over_quota_is_refused(app, client):
+    assert upload(client, 'one.pdf', payload(900 * KB, b'1')).status_code == 201
+    assert upload(client, 'two.pdf', payload(900 * KB, b'2')).status_code == 201
+
+    response = upload(client, 'three.pdf', payload(900 * KB, b'3'))
+    assert response.status_code == 507
+    assert usage(app) == 1800 * KB
+    # Nothing left behind, not even the partial temp file
+    assert sorted(os.listdir(student_dir(app))) == ['one.pdf', 'two.pdf']
+
+
+def test_upload_over_file_size_is_refused(app, client):
+    assert upload(client, 'big.pdf', payload(MB + 1)).status_code == 413
+    assert usage(app) == 0
+
+
+def test_quotas_are_per_student(app, client):
+    assert upload(client, 'one.pdf', payload(900 * KB, b'1')).status_code == 201
+    assert upload(client, 'two.pdf', payload(900 * KB, b'2')).status_code == 201
+    assert upload(client, 'one.pdf', payload(900 * KB, b'1'), netid='bob').status_code == 201
+    assert usage(app, 'bob') == 900 * KB
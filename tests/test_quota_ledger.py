@@ -0,0 +1,62 @@
+"""QuotaLedger counters and reconcile scans"""
+
+import os
+
+from quota_ledger import QuotaLedger
+
+
+class Scan:
+    """Directory scan returning `sizes` in turn, running `during` first"""
+
+    def __init__(self, *sizes, during=None):
+        self.sizes = list(sizes)
+        self.during = during
+        self.calls = 0
+
+    def __call__(self, student_dir):
+        self.calls += 1
+        if self.during:
+            self.during()
+        return self.sizes.pop(0) if len(self.sizes) > 1 else self.sizes[0]
+
+
+def ledger_with(tmp_path, scan):
+    return QuotaLedger(os.path.join(str(tmp_path), 'state', 'quota.db'), scan)
+
+
+def test_usage_scans_once_then_counts(tmp_path):
+    scan = Scan(100)
+    ledger = ledger_with(tmp_path, scan)
+    assert ledger.usage('alice', 'unused') == 100
+    assert ledger.add('alice', 50) == 150
+    assert ledger.add('alice', -500) == 0
+    assert ledger.usage('alice', 'unused') == 0
+    assert scan.calls == 1
+    assert ledger.add('bob', 10) is None
+
+
+def test_reconcile_rescans_after_a_concurrent_add(tmp_path):
+    ledger = ledger_with(tmp_path, Scan(100))
+    ledger.usage('alice', 'unused')
+
+    # An upload is counted while the first scan runs, which missed its
+    # file; the second scan sees it
+    added = []
+
+    def upload():
+        if not added:
+            added.append(ledger.add('alice', 50))
+    ledger.scan = Scan(100, 150, during=upload)
+    assert ledger.reconcile('alice', 'unused') == 150
+    assert ledger.usage('alice', 'unused') == 150
+    assert ledger.scan.calls == 2
+
+
+def test_reconcile_keeps_adds_when_always_busy(tmp_path):
+    ledger = ledger_with(tmp_path, Scan(100))
+    ledger.usage('alice', 'unused')
+
+    # Every scan races with an upload it doesn't see
+    ledger.scan = Scan(100, during=lambda: ledger.add('alice', 10))
+    assert ledger.reconcile('alice', 'unused') == 110
+    assert ledger.scan.calls == 3
@@ -0,0 +1,44 @@
+"""Rate limiters, including a limit changed by a config reload"""
+
+import os
+
+import pytest
+
+from rate_limit import MemoryRateLimiter, SQLiteRateLimiter
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def limiter(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryRateLimiter(3)
+    return SQLiteRateLimiter(os.path.join(str(tmp_path), 'state', 'rate.db'), 3)
+
+
+def hits(limiter, count, key='alice'):
+    return [limiter.hit(key) for _ in range(count)]
+
+
+def test_limit(limiter):
+    assert hits(limiter, 4) == [True, True, True, False]
+    assert hits(limiter, 1, 'bob') == [True]
+
+
+def test_raised_limit(limiter):
+    assert hits(limiter, 3) == [True, True, True]
+    # The full ring of 3 is now 3 of 5 slots
+    limiter.limit = 5
+    assert hits(limiter, 3) == [True, True, False]
+
+
+def test_lowered_limit(limiter):
+    assert hits(limiter, 2) == [True, True]
+    limiter.limit = 2
+    assert hits(limiter, 1) == [False]
+    limiter.limit = 4
+    assert hits(limiter, 3) == [True, True, False]
+
+
+def test_sqlite_limiter_is_shared(tmp_path):
+    db_path = os.path.join(str(tmp_path), 'rate.db')
+    first, second = SQLiteRateLimiter(db_path, 3), SQLiteRateLimiter(db_path, 3)
+    assert hits(first, 2) + hits(second, 2) == [True, True, True, False]
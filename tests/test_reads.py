@@ -0,0 +1,61 @@
+"""/android/read row reads of CSV and JSON files"""
+
+import pytest
+
+from conftest import auth, upload
+
+CSV = b'timestamp,reading\n' + b''.join(b'%d,%d\n' % (i, i % 97) for i in range(20000))
+
+
+def read(client, name, **params):
+    return client.get(f'/android/read/{name}', query_string=params, headers=auth())
+
+
+@pytest.mark.parametrize('content, rows', [
+    (b'[1, 2]\n[3, 4]\n[5, 6]\n', [[1, 2], [3, 4], [5, 6]]),
+    (b'{"a": 1}\n{"a": 2}\n', [{'a': 1}, {'a': 2}]),
+    (b'[[1, 2],\n [3, 4]]\n', [[1, 2], [3, 4]]),
+    (b'[\n  {"a": 1},\n  {"a": 2}\n]\n', [{'a': 1}, {'a': 2}]),
+    (b'[1, 2, 3]\n', [1, 2, 3]),
+])
+def test_json_rows(client, content, rows):
+    assert upload(client, 'data.json', content).status_code == 201
+    response = read(client, 'data.json')
+    assert response.status_code == 200
+    assert response.get_json()['rows'] == rows
+
+
+class NoReads:
+    """A stored file that must not be decoded again"""
+
+    def __init__(self, f):
+        self._f = f
+
+    def read(self, *args):
+        raise AssertionError('decoded again')
+
+    def close(self):
+        self._f.close()
+
+
+def test_compressed_file_is_decoded_once(make_app, monkeypatch):
+    app = make_app(compression={'enabled': True}, storage={'duplicate_policy': 'overwrite'})
+    client = app.test_client()
+    assert upload(client, 'log.csv', CSV).status_code == 201
+    assert read(client, 'log.csv', tail=1).get_json()['rows'] == [['19999', '17']]
+
+    # Later reads of the unchanged file slice the cached content
+    row_index = app.extensions['android_api'].row_index
+    open_file = row_index.open_file
+
+    def no_reads(path):
+        f, size, st = open_file(path)
+        return NoReads(f), size, st
+    monkeypatch.setattr(row_index, 'open_file', no_reads)
+    assert read(client, 'log.csv', head=1).get_json()['rows'] == [['0', '0']]
+    assert read(client, 'log.csv', offset=97, limit=1).get_json()['rows'] == [['97', '0']]
+    monkeypatch.undo()
+
+    # A new version isn't served from the cache
+    assert upload(client, 'log.csv', CSV + b'20000,18\n').status_code == 201
+    assert read(client, 'log.csv', tail=1).get_json()['rows'] == [['20000', '18']]
@@ -0,0 +1,99 @@
+"""scripts/storage_report.py: usage totals, alerts and the ledger"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conftest import KB, load_script, payload, upload
+
+report = load_script('storage_report')
+
+
+def settings_for(app, **overrides):
+    state = app.extensions['android_api']
+    settings = {
+        'upload_dir': state.upload_dir,
+        'state_dir': state.state_dir,
+        'log_file': os.path.join(state.config['paths']['log_dir'], 'api.log'),
+        'student_quota': 2 * 1024 * 1024,
+        'course_quota': 10 * 1024 * 1024,
+        'course_warn': 80,
+        'student_warn': 90,
+        'alert_emails': report.DEFAULT_ALERT_EMAILS,
+    }
+    settings.update(overrides)
+    return settings
+
+
+@pytest.fixture
+def uploaded(app, client):
+    assert upload(client, 'one.pdf', payload(300 * KB, b'1')).status_code == 201
+    assert upload(client, 'two.pdf', payload(200 * KB, b'2')).status_code == 201
+    assert upload(client, 'one.pdf', payload(100 * KB, b'3'), netid='bob').status_code == 201
+    return app
+
+
+@pytest.mark.parametrize('source', ['scan', 'ledger'])
+def test_per_student_usage(uploaded, source):
+    rows, course_total, used = report.collect(settings_for(uploaded), source, workers=4)
+    assert used == source
+    assert rows == [('alice', 500 * KB, 2), ('bob', 100 * KB, 1)]
+    assert course_total == 600 * KB
+
+
+def test_ledger_is_opened_read_only(tmp_path):
+    upload_dir = os.path.join(str(tmp_path), 'uploads')
+    os.makedirs(os.path.join(upload_dir, 'alice'))
+    state_dir = os.path.join(str(tmp_path), 'state')
+    os.makedirs(state_dir)
+    ledger = os.path.join(state_dir, 'quota.db')
+    conn = sqlite3.connect(ledger)
+    conn.execute("CREATE TABLE usage (netid TEXT PRIMARY KEY, bytes INTEGER NOT NULL, scanned_at REAL NOT NULL)")
+    conn.execute("INSERT INTO usage VALUES ('alice', 1234, 0)")
+    conn.commit()
+    conn.close()
+    before = os.stat(ledger).st_mtime_ns
+
+    settings = {'upload_dir': upload_dir, 'state_dir': state_dir}
+    rows, _, source = report.collect(settings, 'auto', workers=1)
+    assert (source, rows) == ('ledger', [('alice', 1234, 0)])
+    # Not switched to WAL, nothing written
+    conn = sqlite3.connect(ledger)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
+    conn.close()
+    assert os.stat(ledger).st_mtime_ns == before
+    assert sorted(os.listdir(state_dir)) == ['quota.db']
+
+
+def run_report(monkeypatch, app, extra_toml=''):
+    """main() --email against `app`'s tree with a tiny course quota"""
+    state = app.extensions['android_api']
+    config_file = os.path.join(state.state_dir, 'report.toml')
+    with open(config_file, 'w') as f:
+        f.write(
+            f'[paths]\nupload_dir = "{state.upload_dir}"\nstate_dir = "{state.state_dir}"\n'
+            f'log_dir = "{state.state_dir}"\n[storage]\nstudent_quota_mb = 2\n'
+            f'[monitoring]\ncourse_quota_gb = 0.0001\n{extra_toml}'
+        )
+    sent = []
+    monkeypatch.setattr(subprocess, 'run', lambda args, **kwargs: sent.append(args))
+    monkeypatch.setattr(sys, 'argv', ['storage_report.py', '--config', config_file, '--email', '--quiet'])
+    with pytest.raises(SystemExit) as exit:
+        report.main()
+    return exit.value.code, sent
+
+
+def test_alerts_go_to_the_old_recipients_by_default(uploaded, monkeypatch, capsys):
+    status, sent = run_report(monkeypatch, uploaded)
+    assert status == 1
+    assert sent[0][-2:] == report.DEFAULT_ALERT_EMAILS
+    assert 'Course storage at' in capsys.readouterr().out
+
+
+def test_alert_without_recipients_fails(uploaded, monkeypatch):
+    status, sent = run_report(monkeypatch, uploaded, 'alert_emails = []\n')
+    assert status == 2
+    assert sent == []
@@ -0,0 +1,25 @@
+"""Student directory lookup and its cache"""
+
+import os
+import shutil
+
+from conftest import auth, student_dir, upload
+from student_dirs import StudentDirs
+
+
+def test_removed_directory_is_recreated(tmp_path):
+    dirs = StudentDirs(str(tmp_path), shard_levels=2)
+    path = dirs.get('alice')
+    assert os.path.isdir(path)
+
+    shutil.rmtree(path)
+    assert dirs.get('alice') == path
+    assert os.path.isdir(path)
+
+
+def test_upload_after_directory_removed(app, client):
+    assert upload(client, 'one.txt', b'one').status_code == 201
+    shutil.rmtree(student_dir(app))
+
+    assert upload(client, 'two.txt', b'two').status_code == 201
+    assert client.get('/android/download/two.txt', headers=auth()).data == b'two'
@@ -0,0 +1,107 @@
+"""/android/thumbnail previews and their cache"""
+
+import io
+import os
+
+import pytest
+
+from conftest import auth, payload, upload
+from thumbnails import HAVE_PILLOW
+
+pytestmark = pytest.mark.skipif(not HAVE_PILLOW, reason='needs Pillow')
+
+if HAVE_PILLOW:
+    from PIL import Image
+
+
+def image_bytes(size, fmt='JPEG', mode='RGB', color=(200, 30, 30)):
+    out = io.BytesIO()
+    Image.new(mode, size, color).save(out, format=fmt)
+    return out.getvalue()
+
+
+PHOTO = image_bytes((800, 400)) if HAVE_PILLOW else b''
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(thumbnails={'enabled': True})
+
+
+def thumbnail(client, name, netid='alice', **params):
+    return client.get(f'/android/thumbnail/{name}', headers=auth(netid), query_string=params)
+
+
+def previews(app):
+    cache_dir = app.extensions['android_api'].thumbnails.cache_dir
+    return sorted(name for _, _, names in os.walk(cache_dir) for name in names)
+
+
+def test_preview_sizes(app, client):
+    assert upload(client, 'photo.jpg', PHOTO).status_code == 201
+
+    response = thumbnail(client, 'photo.jpg', size=200)
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].startswith('inline')
+    with Image.open(io.BytesIO(response.data)) as image:
+        # The smallest configured size covering 200 pixels
+        assert (image.format, image.size) == ('JPEG', (256, 128))
+
+    with Image.open(io.BytesIO(thumbnail(client, 'photo.jpg').data)) as image:
+        assert image.size == (128, 64)
+    with Image.open(io.BytesIO(thumbnail(client, 'photo.jpg', size=5000).data)) as image:
+        assert image.size == (512, 256)
+
+
+def test_transparent_images_get_png_previews(app, client):
+    data = image_bytes((300, 300), fmt='PNG', mode='RGBA', color=(0, 0, 0, 0))
+    assert upload(client, 'icon.png', data).status_code == 201
+    with Image.open(io.BytesIO(thumbnail(client, 'icon.png').data)) as image:
+        assert (image.format, image.mode) == ('PNG', 'RGBA')
+
+
+def test_previews_are_cached_and_shared(app, client):
+    cache = app.extensions['android_api'].thumbnails
+    assert upload(client, 'photo.jpg', PHOTO).status_code == 201
+    assert upload(client, 'same.jpg', PHOTO, netid='bob').status_code == 201
+
+    assert thumbnail(client, 'photo.jpg').status_code == 200
+    assert thumbnail(client, 'same.jpg', netid='bob').status_code == 200
+    assert thumbnail(client, 'photo.jpg').status_code == 200
+    assert (cache.generated, cache.hits) == (1, 2)
+    assert len(previews(app)) == 1
+
+    # Still used by bob's copy
+    assert client.delete('/android/delete/photo.jpg', headers=auth()).status_code == 200
+    assert len(previews(app)) == 1
+    assert client.delete('/android/delete/same.jpg', headers=auth('bob')).status_code == 200
+    assert previews(app) == []
+
+
+def test_replaced_image_gets_a_new_preview(make_app):
+    app = make_app(thumbnails={'enabled': True}, storage={'duplicate_policy': 'overwrite'})
+    client = app.test_client()
+    assert upload(client, 'photo.jpg', PHOTO).status_code == 201
+    assert thumbnail(client, 'photo.jpg').status_code == 200
+
+    assert upload(client, 'photo.jpg', image_bytes((400, 800))).status_code == 201
+    with Image.open(io.BytesIO(thumbnail(client, 'photo.jpg').data)) as image:
+        assert image.size == (64, 128)
+    assert len(previews(app)) == 1
+
+
+def test_refusals(client):
+    assert upload(client, 'broken.png', payload(1000)).status_code == 201
+    assert upload(client, 'notes.txt', b'text').status_code == 201
+
+    assert thumbnail(client, 'broken.png').status_code == 415
+    assert thumbnail(client, 'notes.txt').status_code == 415
+    assert thumbnail(client, 'missing.jpg').status_code == 404
+    assert thumbnail(client, 'broken.png', size='big').status_code == 400
+    assert client.get('/android/thumbnail/broken.png').status_code == 401
+
+
+def test_disabled(make_app):
+    client = make_app().test_client()
+    assert upload(client, 'photo.jpg', PHOTO).status_code == 201
+    assert thumbnail(client, 'photo.jpg').status_code == 404
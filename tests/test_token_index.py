@@ -0,0 +1,106 @@
+"""TokenIndex lookups, reloads and token validation"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import token_index
+from conftest import TOKENS
+from token_index import TokenIndex
+from token_store import save_tokens
+
+
+@pytest.fixture
+def token_file(tmp_path):
+    path = os.path.join(str(tmp_path), 'tokens', 'tokens.json')
+    save_tokens(path, TOKENS)
+    return path
+
+
+def test_lookups_wait_for_the_first_load(token_file, monkeypatch):
+    index = TokenIndex(token_file)
+    open_index = token_index.open_index
+
+    def slow_open_index(path):
+        time.sleep(0.2)
+        return open_index(path)
+    monkeypatch.setattr(token_index, 'open_index', slow_open_index)
+
+    first = threading.Thread(target=index.lookup, args=('tok-bob',))
+    first.start()
+    time.sleep(0.05)
+    # Arrives while the first lookup is still loading the index
+    assert index.lookup('tok-alice') == 'alice'
+    first.join()
+
+
+def lookup_in_thread(index, token):
+    """Lookup from a thread without a cached tokens.db connection"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(index.lookup(token)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+@pytest.mark.parametrize('damage', ['delete', 'truncate'])
+def test_unreadable_index_falls_back_to_tokens_json(token_file, damage):
+    index = TokenIndex(token_file, check_interval_ms=60000)
+    assert index.lookup('tok-alice') == 'alice'
+
+    index_file = index.index_file
+    if damage == 'delete':
+        os.remove(index_file)
+    else:
+        # Rewritten in place by something other than save_tokens()
+        with open(index_file, 'wb') as f:
+            f.write(b'not a database')
+    assert lookup_in_thread(index, 'tok-alice') == 'alice'
+    assert lookup_in_thread(index, 'tok-bob') == 'bob'
+    assert lookup_in_thread(index, 'tok-nobody') is None
+
+    # Back to the index once it is rebuilt
+    save_tokens(token_file, dict(TOKENS, carol='tok-carol'))
+    index.invalidate()
+    assert lookup_in_thread(index, 'tok-carol') == 'carol'
+
+
+def test_new_tokens_are_picked_up(token_file):
+    index = TokenIndex(token_file, check_interval_ms=0)
+    assert len(index) == 2
+    assert index.lookup('tok-carol') is None
+
+    save_tokens(token_file, dict(TOKENS, carol='tok-carol'))
+    assert index.lookup('tok-carol') == 'carol'
+    assert len(index) == 3
+    assert index.reloads == 2
+
+    # Removed students are locked out
+    save_tokens(token_file, {'carol': 'tok-carol'})
+    assert index.lookup('tok-alice') is None
+
+
+def test_checks_are_rate_limited(token_file):
+    index = TokenIndex(token_file, check_interval_ms=60000)
+    assert index.lookup('tok-alice') == 'alice'
+    save_tokens(token_file, dict(TOKENS, carol='tok-carol'))
+    # Not stat'ed again until the interval is over
+    assert index.lookup('tok-carol') is None
+    index.invalidate()
+    assert index.lookup('tok-carol') == 'carol'
+
+
+def test_missing_token_file(tmp_path):
+    index = TokenIndex(os.path.join(str(tmp_path), 'tokens.json'))
+    assert index.lookup('tok-alice') is None
+    assert index.lookup('') is None
+    assert len(index) == 0
+
+
+def test_validate_token(client):
+    response = client.get('/android/list', headers={'X-Auth-Token': 'tok-nobody'})
+    assert response.status_code == 401
+    response = client.get('/android/list', headers={'X-Auth-Token': TOKENS['bob']})
+    assert response.status_code == 200
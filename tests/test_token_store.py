@@ -0,0 +1,102 @@
+"""tokens.json / tokens.db and scripts/generate_tokens.py"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+from conftest import TOKENS, load_script
+from token_store import compile_index, hash_token, index_path, load_tokens, open_index, save_tokens
+
+
+@pytest.fixture
+def token_file(tmp_path):
+    return os.path.join(str(tmp_path), 'tokens', 'tokens.json')
+
+
+def test_save_writes_json_and_index(token_file):
+    save_tokens(token_file, TOKENS)
+    assert load_tokens(token_file) == TOKENS
+    # Nothing but the two files is left behind
+    assert sorted(os.listdir(os.path.dirname(token_file))) == ['tokens.db', 'tokens.json']
+
+    conn = open_index(token_file)
+    rows = dict(conn.execute("SELECT hash, netid FROM tokens"))
+    conn.close()
+    assert rows == {hash_token(token): netid for netid, token in TOKENS.items()}
+    # Only hashes are stored
+    with open(index_path(token_file), 'rb') as f:
+        assert b'tok-alice' not in f.read()
+    assert os.stat(index_path(token_file)).st_mode & 0o777 == 0o600
+
+
+def test_hand_edited_json_makes_the_index_stale(token_file):
+    save_tokens(token_file, TOKENS)
+    with open(token_file, 'w') as f:
+        json.dump(dict(TOKENS, carol='tok-carol'), f)
+    assert open_index(token_file) is None
+
+    compile_index(token_file)
+    conn = open_index(token_file)
+    assert conn.execute("SELECT netid FROM tokens WHERE hash = ?",
+                        (hash_token('tok-carol'),)).fetchone() == ('carol',)
+    conn.close()
+
+
+def test_unusable_index(token_file):
+    assert load_tokens(token_file) == {}
+    assert open_index(token_file) is None
+
+    save_tokens(token_file, TOKENS)
+    with open(index_path(token_file), 'wb') as f:
+        f.write(b'not a database')
+    assert open_index(token_file) is None
+
+
+def test_failed_save_keeps_the_old_file(token_file):
+    save_tokens(token_file, TOKENS)
+    with pytest.raises(TypeError):
+        save_tokens(token_file, {'alice': object()})
+    assert load_tokens(token_file) == TOKENS
+    assert sorted(os.listdir(os.path.dirname(token_file))) == ['tokens.db', 'tokens.json']
+
+
+def test_generate_tokens_script(token_file, tmp_path, monkeypatch, capsys):
+    script = load_script('generate_tokens')
+    monkeypatch.setattr(script, 'TOKEN_FILE', token_file)
+
+    script.add_student('alice')
+    token = load_tokens(token_file)['alice']
+    assert token in capsys.readouterr().out
+
+    roster = tmp_path / 'roster.txt'
+    roster.write_text('alice\nbob\n\ncarol\n')
+    script.bulk_import(str(roster))
+    tokens = load_tokens(token_file)
+    assert sorted(tokens) == ['alice', 'bob', 'carol']
+    assert tokens['alice'] == token
+
+    script.remove_student('bob')
+    conn = open_index(token_file)
+    assert conn is not None
+    assert sorted(netid for (netid,) in conn.execute("SELECT netid FROM tokens")) == ['alice', 'carol']
+    conn.close()
+
+    # A hand edit, then `generate_tokens.py compile`
+    tokens = load_tokens(token_file)
+    del tokens['carol']
+    with open(token_file, 'w') as f:
+        json.dump(tokens, f)
+    script.compile_index()
+    conn = open_index(token_file)
+    assert conn.execute("SELECT COUNT(*) FROM tokens").fetchone() == (1,)
+    conn.close()
+
+
+def test_index_is_read_only(token_file):
+    save_tokens(token_file, TOKENS)
+    conn = open_index(token_file)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM tokens")
+    conn.close()
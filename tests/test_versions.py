@@ -0,0 +1,112 @@
+"""Version history under duplicate_policy = "version" """
+
+import os
+
+import pytest
+
+from conftest import KB, auth, payload, student_dir, upload, usage
+
+V1 = payload(50 * KB, b'v1')
+V2 = V1[:20 * KB] + b'changed in v2' + V1[20 * KB:]
+V3 = V2 + b'appended in v3'
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(storage={'duplicate_policy': 'version'})
+
+
+@pytest.fixture
+def versioned(client):
+    for data in (V1, V2, V3):
+        assert upload(client, 'notes.txt', data).status_code == 201
+    return client
+
+
+def test_overwrite_keeps_versions(versioned):
+    assert versioned.get('/android/download/notes.txt', headers=auth()).data == V3
+
+    listing = versioned.get('/android/versions/notes.txt', headers=auth()).get_json()
+    assert listing['current']['size_bytes'] == len(V3)
+    assert [(v['version'], v['size_bytes']) for v in listing['versions']] == [
+        (2, len(V2)), (1, len(V1))
+    ]
+
+
+def test_old_versions_round_trip(versioned):
+    for number, data in ((1, V1), (2, V2)):
+        response = versioned.get(f'/android/versions/notes.txt/{number}', headers=auth())
+        assert response.status_code == 200
+        assert response.data == data
+        assert f'notes.v{number}.txt' in response.headers['Content-Disposition']
+
+    assert versioned.get('/android/versions/notes.txt/3', headers=auth()).status_code == 404
+
+
+def test_versions_are_charged_and_refunded(app, versioned):
+    listing = versioned.get('/android/versions/notes.txt', headers=auth()).get_json()
+    history = sum(v['stored_bytes'] for v in listing['versions'])
+    assert usage(app) == len(V3) + history
+
+    assert versioned.delete('/android/delete/notes.txt', headers=auth()).status_code == 200
+    assert usage(app) == 0
+    assert versioned.get('/android/versions/notes.txt', headers=auth()).status_code == 404
+
+
+def test_max_versions(make_app):
+    client = make_app(storage={'duplicate_policy': 'version'}, versions={'max_versions': 2}).test_client()
+    for number in range(5):
+        assert upload(client, 'notes.txt', V1 + bytes([number])).status_code == 201
+
+    listing = client.get('/android/versions/notes.txt', headers=auth()).get_json()
+    assert [v['version'] for v in listing['versions']] == [4, 3]
+    assert client.get('/android/versions/notes.txt/4', headers=auth()).data == V1 + bytes([3])
+
+
+def test_failed_replace_leaves_no_version(app, client, monkeypatch):
+    assert upload(client, 'notes.txt', V1).status_code == 201
+    before = usage(app)
+
+    # The version is written, then replacing the file itself fails
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if os.path.basename(dst) == 'notes.txt':
+            raise OSError(28, 'No space left on device')
+        return real_replace(src, dst)
+    monkeypatch.setattr(os, 'replace', replace)
+    assert upload(client, 'notes.txt', V2).status_code == 500
+    monkeypatch.undo()
+
+    assert client.get('/android/download/notes.txt', headers=auth()).data == V1
+    assert client.get('/android/versions/notes.txt', headers=auth()).get_json()['versions'] == []
+    assert usage(app) == before
+
+
+@pytest.mark.parametrize('policy', ['suffix', 'overwrite', 'reject'])
+def test_no_history_without_version_policy(make_app, policy):
+    app = make_app(storage={'duplicate_policy': policy})
+    client = app.test_client()
+    for data in (V1, V2):
+        upload(client, 'notes.txt', data)
+    assert client.get('/android/versions/notes.txt/1', headers=auth()).status_code == 404
+    assert client.delete('/android/delete/notes.txt', headers=auth()).status_code == 200
+    assert not os.path.exists(os.path.join(student_dir(app), '.versions'))
+
+
+def test_history_removed_with_the_file(app, versioned):
+    assert versioned.delete('/android/delete/notes.txt', headers=auth()).status_code == 200
+    assert not os.path.exists(os.path.join(student_dir(app), '.versions'))
+
+
+def test_switch_to_overwrite_drops_the_history(make_app, versioned):
+    # Restarted with versioning turned off
+    app = make_app(storage={'duplicate_policy': 'overwrite'})
+    client = app.test_client()
+    assert upload(client, 'notes.txt', V1).status_code == 201
+
+    # The old deltas led back from V3; they're gone rather than applied to V1
+    assert client.get('/android/versions/notes.txt/1', headers=auth()).status_code == 404
+    assert not os.path.exists(os.path.join(student_dir(app), '.versions'))
+    assert usage(app) == len(V1)
+    assert client.get('/android/download/notes.txt', headers=auth()).data == V1
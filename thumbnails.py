@@ -0,0 +1,314 @@
+"""
+Resized previews of uploaded images
+/android/thumbnail/<filename> answers with a preview no larger than the
+requested size, so a gallery doesn't have to download every full-size
+photo. Previews are generated on first request (or right after upload,
+in a small background pool) and cached outside the student directories,
+where they never count against a quota, under the SHA-256 of the image
+and the preview size: identical images share their previews.
+
+An index in SQLite remembers the hash of each student file along with
+its mtime and size, so serving a cached preview costs a stat() and one
+lookup. Deleting or replacing a file drops the previews no other file
+still uses.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:     # optional, only needed for [thumbnails] enabled = true
+    Image = None
+
+# Previews can be generated (cleanup only needs the index and the cache)
+HAVE_PILLOW = Image is not None
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK = 1024 * 1024
+
+# Previews of JPEG photos are JPEG; everything else (transparency, GIFs)
+# becomes PNG
+JPEG_EXTENSIONS = ('jpg', 'jpeg')
+
+
+class NotAnImage(ValueError):
+    """The file can't be decoded as an image (or is too large to preview)"""
+
+
+def _open_file(path):
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    return f, st.st_size, st
+
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+class ThumbnailCache:
+    """
+    Previews under `cache_dir` (<sha256[:2]>/<sha256>-<size>.<jpg|png>)
+    and the per-student filename -> hash index in `db_path`.
+
+    `workers` > 0 starts that many threads per process (created on first
+    use, so after a gunicorn fork) to pre-generate every size of a new
+    upload; 0 generates previews only when they are requested.
+    """
+
+    def __init__(self, cache_dir, db_path, sizes=(128, 256, 512),
+                 extensions=('png', 'jpg', 'jpeg', 'gif'), quality=80,
+                 max_pixels=50 * 1000 * 1000, workers=0, open_file=None):
+        if not sizes or any(isinstance(s, bool) or not isinstance(s, int) or s < 1 for s in sizes):
+            raise ValueError("sizes must be a list of positive pixel sizes")
+        if not 1 <= quality <= 95:
+            raise ValueError("quality must be between 1 and 95")
+        self.cache_dir = cache_dir
+        self.db_path = db_path
+        self.sizes = sorted(set(sizes))
+        self.extensions = frozenset(ext.strip().lower() for ext in extensions if ext.strip())
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self.workers = workers
+        # path -> (file object, size, stat result) giving the file's
+        # content as uploaded (see compressed_store.open_stored)
+        self.open_file = open_file or _open_file
+        self._local = threading.local()
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        # Counters for metrics (this process only)
+        self.hits = 0
+        self.generated = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                " netid TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " PRIMARY KEY (netid, name))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sources_sha256 ON sources (sha256)")
+
+    def _connect(self):
+        # sqlite3 connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def handles(self, filename):
+        """True if files named like this get previews"""
+        return _extension(filename) in self.extensions
+
+    def pick_size(self, requested=None):
+        """Smallest configured size covering `requested` (default: the smallest)"""
+        if requested is None:
+            return self.sizes[0]
+        for size in self.sizes:
+            if size >= requested:
+                return size
+        return self.sizes[-1]
+
+    def cache_path(self, sha256, size, filename):
+        ext = 'jpg' if _extension(filename) in JPEG_EXTENSIONS else 'png'
+        return os.path.join(self.cache_dir, sha256[:2], f"{sha256}-{size}.{ext}")
+
+    def content_hash(self, netid, path):
+        """SHA-256 of a student's file, re-hashed only if it changed"""
+        name = os.path.basename(path)
+        st = os.stat(path)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT sha256, mtime_ns, size FROM sources WHERE netid = ? AND name = ?",
+            (netid, name)
+        ).fetchone()
+        if row and row[1] == st.st_mtime_ns and row[2] == st.st_size:
+            return row[0]
+
+        # Content is identified by its uncompressed bytes
+        digest = hashlib.sha256()
+        with self.open_file(path)[0] as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        conn.execute(
+            "INSERT OR REPLACE INTO sources (netid, name, mtime_ns, size, sha256) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (netid, name, st.st_mtime_ns, st.st_size, sha256)
+        )
+        if row and row[0] != sha256:
+            # Replaced behind our back (not through forget())
+            self._release(row[0])
+        return sha256
+
+    def get(self, netid, path, size):
+        """
+        Path of the cached `size` preview of a student's file, generated
+        if needed. Raises NotAnImage if the file can't be previewed.
+        """
+        sha256 = self.content_hash(netid, path)
+        target = self.cache_path(sha256, size, path)
+        if os.path.exists(target):
+            self.hits += 1
+            return target
+        self._render(path, sha256, [size])
+        return target
+
+    def _render(self, path, sha256, sizes):
+        """Write the previews of `path` at each of `sizes` into the cache"""
+        if not HAVE_PILLOW:
+            raise RuntimeError("thumbnails need the Pillow package")
+        f, _, _ = self.open_file(path)
+        with f:
+            if not isinstance(f, io.BufferedReader):
+                # Decoded on the fly (compressed at rest); Pillow needs to seek
+                f = io.BytesIO(f.read())
+            try:
+                with Image.open(f) as image:
+                    if image.width * image.height > self.max_pixels:
+                        raise NotAnImage(f"{image.width}x{image.height} is too large to preview")
+                    # JPEG only: decode at a reduced scale, much faster for photos
+                    image.draft('RGB', (max(sizes), max(sizes)))
+                    # Phone photos are often stored sideways with an EXIF rotation
+                    image = ImageOps.exif_transpose(image)
+                    jpeg = _extension(path) in JPEG_EXTENSIONS
+                    if jpeg and image.mode not in ('RGB', 'L'):
+                        image = image.convert('RGB')
+                    elif not jpeg and image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                        image = image.convert('RGBA')
+                    # Largest first; each smaller size is scaled from the last one
+                    previews = []
+                    for size in sorted(sizes, reverse=True):
+                        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+                        previews.append((size, image.copy()))
+            except NotAnImage:
+                raise
+            except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+                raise NotAnImage(str(e)) from e
+
+        for size, preview in previews:
+            self._save(preview, self.cache_path(sha256, size, path), jpeg)
+
+    def _save(self, image, target, jpeg):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.thumb-', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if jpeg:
+                    image.save(out, format='JPEG', quality=self.quality)
+                else:
+                    image.save(out, format='PNG')
+            # Concurrent generators of the same preview write identical bytes
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.generated += 1
+
+    def schedule(self, netid, path):
+        """Pre-generate every size of a new upload in the background"""
+        if not self.workers or not self.handles(path):
+            return
+        with self._pool_lock:
+            # Threads don't survive a fork: each worker process starts its own pool
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='thumbnails'
+                )
+                self._pool_pid = os.getpid()
+            self._pool.submit(self._pregenerate, netid, path)
+
+    def _pregenerate(self, netid, path):
+        try:
+            sha256 = self.content_hash(netid, path)
+            missing = [size for size in self.sizes
+                       if not os.path.exists(self.cache_path(sha256, size, path))]
+            if missing:
+                self._render(path, sha256, missing)
+        except FileNotFoundError:
+            pass    # deleted or replaced before we got to it
+        except NotAnImage as e:
+            logger.debug("No thumbnails for %s: %s", path, e)
+        except Exception as e:
+            logger.warning("Thumbnail pre-generation failed for %s: %s", path, e)
+
+    def forget(self, netid, name):
+        """A student's file was deleted or replaced; drop previews nothing else uses"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT sha256 FROM sources WHERE netid = ? AND name = ?", (netid, name)
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute("DELETE FROM sources WHERE netid = ? AND name = ?", (netid, name))
+        self._release(row[0])
+
+    def forget_student(self, netid):
+        """
+        Drop every index entry of `netid` (directory removed); their
+        previews are freed by the next collect_garbage()
+        """
+        self._connect().execute("DELETE FROM sources WHERE netid = ?", (netid,))
+
+    def _release(self, sha256):
+        """Remove the previews of `sha256` once no indexed file has that content"""
+        if self._connect().execute(
+            "SELECT 1 FROM sources WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone():
+            return
+        shard = os.path.join(self.cache_dir, sha256[:2])
+        try:
+            entries = list(os.scandir(shard))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith(sha256 + '-'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def collect_garbage(self, temp_age=3600):
+        """
+        Remove previews whose content no indexed file has, and temp files
+        older than `temp_age` seconds; returns bytes freed
+        """
+        conn = self._connect()
+        referenced = {sha256 for (sha256,) in conn.execute("SELECT DISTINCT sha256 FROM sources")}
+        cutoff = time.time() - temp_age
+        freed = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    if name.startswith('.thumb-'):
+                        # Being written by a worker unless it's old
+                        if st.st_mtime >= cutoff:
+                            continue
+                    elif name.split('-', 1)[0] in referenced:
+                        continue
+                    os.remove(path)
+                    freed += st.st_size
+                except FileNotFoundError:
+                    pass
+        return freed
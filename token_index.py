@@ -0,0 +1,166 @@
+"""
+Process-wide token -> NetID index
+Looks tokens up in the compiled tokens.db (see token_store.py), falling
+back to parsing tokens.json when the index is missing or stale. Either
+way only token hashes are held in memory.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from token_store import file_signature, hash_token, index_path, load_tokens, open_index
+
+logger = logging.getLogger(__name__)
+
+
+class TokenIndex:
+    """
+    Token -> NetID lookups keyed by token hash.
+
+    The token files are stat'ed at most once every `check_interval_ms`.
+    While tokens.db is current for tokens.json a lookup is one indexed
+    query on a per-thread read-only connection; if tokens.json was
+    changed without recompiling the index, or tokens.db can't be read,
+    it is re-parsed into a hash -> NetID dict instead.
+    """
+
+    def __init__(self, token_file, check_interval_ms=1000):
+        self.token_file = token_file
+        self.index_file = index_path(token_file)
+        self.check_interval = check_interval_ms / 1000.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._use_index = False
+        self._generation = 0        # bumped whenever tokens.db is swapped
+        self._by_hash = {}          # fallback when there is no current index
+        self._count = 0
+        self._signature = None
+        self._next_check = 0.0
+        # Counters for metrics (this process only)
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def lookup(self, token):
+        """Return the NetID owning `token`, or None"""
+        if not token:
+            return None
+        self._maybe_reload()
+        key = hash_token(token)
+        netid = None
+        if self._use_index:
+            try:
+                row = self._connect().execute(
+                    "SELECT netid FROM tokens WHERE hash = ?", (key,)
+                ).fetchone()
+                netid = row[0] if row else None
+            except sqlite3.Error as e:
+                # Removed, or rewritten in place, since the last check
+                self._fall_back(e)
+        if not self._use_index:
+            netid = self._by_hash.get(key)
+        if netid is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return netid
+
+    def __len__(self):
+        self._maybe_reload()
+        return self._count
+
+    def invalidate(self):
+        """Force the next lookup to re-check the file"""
+        with self._lock:
+            self._next_check = 0.0
+            self._signature = None
+
+    def _connect(self):
+        # sqlite3 connections must not cross threads or a fork, and are
+        # reopened after tokens.db has been replaced
+        conn = getattr(self._local, 'conn', None)
+        key = (os.getpid(), self._generation)
+        if conn is None or self._local.key != key:
+            conn = sqlite3.connect(f"file:{self.index_file}?mode=ro", uri=True)
+            self._local.conn = conn
+            self._local.key = key
+        return conn
+
+    def _fall_back(self, error):
+        """Serve tokens.json from memory until tokens.db is readable again"""
+        with self._lock:
+            if not self._use_index:
+                return      # another thread got here first
+            logger.warning("Token index %s unreadable (%s); reading %s instead",
+                           self.index_file, error, self.token_file)
+            try:
+                tokens = load_tokens(self.token_file)
+            except (json.JSONDecodeError, OSError) as e:
+                logger.error("Could not load token file %s: %s", self.token_file, e)
+                return
+            self._by_hash = {hash_token(token): netid for netid, token in tokens.items()}
+            self._count = len(self._by_hash)
+            self._use_index = False
+            # The next check switches back to tokens.db once it's current again
+            self._signature = None
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+
+        with self._lock:
+            # Another thread may have reloaded while we waited
+            if now < self._next_check:
+                return
+            try:
+                self._reload()
+            finally:
+                # Only now, so other threads wait for the first load
+                # instead of seeing an empty index
+                self._next_check = now + self.check_interval
+
+    def _reload(self):
+        """Switch to the current token files if they changed (caller holds the lock)"""
+        source = file_signature(self.token_file)
+        if source is None:
+            if self._signature != 'missing':
+                logger.warning("Token file not found: %s", self.token_file)
+                self._use_index = False
+                self._by_hash = {}
+                self._count = 0
+                self._signature = 'missing'
+            return
+
+        signature = (source, file_signature(self.index_file))
+        if signature == self._signature:
+            return
+
+        conn = open_index(self.token_file)
+        if conn is not None:
+            self._count = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+            conn.close()
+            self._generation += 1
+            self._use_index = True
+            self._by_hash = {}
+            origin = 'tokens.db'
+        else:
+            try:
+                tokens = load_tokens(self.token_file)
+            except (json.JSONDecodeError, OSError) as e:
+                # Keep serving the previous index; a writer may be mid-save.
+                # Leave the signature untouched so the next check retries.
+                logger.error("Could not load token file %s: %s", self.token_file, e)
+                return
+            self._by_hash = {hash_token(token): netid for netid, token in tokens.items()}
+            self._count = len(self._by_hash)
+            self._use_index = False
+            origin = 'tokens.json, index missing or stale'
+
+        self._signature = signature
+        self.reloads += 1
+        logger.info("Token index loaded: %s students (%s)", self._count, origin)
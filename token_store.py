@@ -0,0 +1,130 @@
+"""
+Token storage shared by scripts/generate_tokens.py and the API
+tokens.json (NetID -> token) is only ever replaced atomically, and every
+save also compiles tokens.db: an SQLite index keyed by the SHA-256 of
+each token. The server looks tokens up in the index, one B-tree probe
+per request, and never holds plaintext tokens in memory.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+
+
+def hash_token(token):
+    """Index key of a token (tokens are random, so no salt is needed)"""
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def index_path(token_file):
+    """tokens.json -> tokens.db"""
+    return os.path.splitext(token_file)[0] + '.db'
+
+
+def file_signature(path):
+    """(inode, mtime_ns, size) of `path`, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def load_tokens(token_file):
+    """NetID -> token from tokens.json ({} if there is none yet)"""
+    try:
+        with open(token_file, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _replace_atomically(path, write):
+    """Write a temp file next to `path` with `write(fileobj)`, then rename"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def save_tokens(token_file, tokens):
+    """Replace tokens.json atomically and recompile the index"""
+    data = json.dumps(tokens, indent=2).encode('utf-8')
+    _replace_atomically(token_file, lambda f: f.write(data))
+    compile_index(token_file, tokens)
+
+
+def compile_index(token_file, tokens=None):
+    """
+    Build tokens.db from `tokens` (default: the current tokens.json). The
+    index records the signature of the tokens.json it was built from, so
+    readers can tell when the JSON was edited by hand since.
+    """
+    if tokens is None:
+        tokens = load_tokens(token_file)
+    source = file_signature(token_file)
+    path = index_path(token_file)
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix='.' + os.path.basename(path) + '.')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("BEGIN")
+            conn.execute(
+                "CREATE TABLE tokens (hash BLOB PRIMARY KEY, netid TEXT NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.executemany(
+                "INSERT OR REPLACE INTO tokens (hash, netid) VALUES (?, ?)",
+                ((hash_token(token), netid) for netid, token in tokens.items())
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('source', ?)",
+                (json.dumps(source),)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+def open_index(token_file):
+    """
+    Read-only connection to tokens.db if it is current for tokens.json,
+    else None (missing, or the JSON changed after it was compiled).
+    """
+    path = index_path(token_file)
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+    except sqlite3.DatabaseError:
+        conn.close()
+        return None
+    source = json.loads(row[0]) if row else None
+    if source is None or tuple(source) != file_signature(token_file):
+        conn.close()
+        return None
+    return conn
@@ -0,0 +1,314 @@
+"""
+Per-file version history stored as compressed reverse deltas
+When a file is replaced under the "version" duplicate policy, its old
+content is saved as a binary delta against the new content (zlib
+compressed), or as the whole file compressed when that is smaller.
+Each version is therefore a delta against the next newer one and is
+rebuilt by walking back from the current file.
+
+Layout: <student_dir>/.versions/<filename>/<n>.v, newest n is highest.
+"""
+
+import contextlib
+import fcntl
+import os
+import shutil
+import struct
+import zlib
+
+DIRNAME = '.versions'
+
+# magic, kind, original size, original mtime_ns
+HEADER = struct.Struct('>4scQQ')
+MAGIC = b'AVH1'
+KIND_DELTA = b'D'       # zlib(delta ops) against version n+1
+KIND_FULL = b'F'        # zlib(content)
+
+# Delta ops
+OP_COPY = 0             # varint offset, varint length (from the base)
+OP_INSERT = 1           # varint length, literal bytes
+
+BLOCK = 16
+# Give up on a delta after this many bytes in a row match nothing
+MAX_UNMATCHED = 256 * 1024
+COMPARE_CHUNK = 1024
+READ_SIZE = 256 * 1024
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return n, pos
+        shift += 7
+
+
+def make_delta(base, target):
+    """
+    Ops rebuilding `target` from `base` (greedy block matching), or None
+    when the two look unrelated.
+    """
+    index = {}
+    for off in range(0, len(base) - BLOCK + 1, BLOCK):
+        index.setdefault(base[off:off + BLOCK], off)
+
+    out = bytearray()
+    n = len(target)
+    literal = 0     # start of the bytes not yet covered by an op
+    i = 0
+
+    def insert(start, end):
+        if end > start:
+            out.append(OP_INSERT)
+            out.extend(_varint(end - start))
+            out.extend(target[start:end])
+
+    while i + BLOCK <= n:
+        off = index.get(target[i:i + BLOCK])
+        if off is None:
+            i += 1
+            if i - literal > MAX_UNMATCHED:
+                return None
+            continue
+
+        # Grow the match backwards into pending literal bytes ...
+        start, base_start = i, off
+        while start > literal and base_start > 0 and target[start - 1] == base[base_start - 1]:
+            start -= 1
+            base_start -= 1
+        # ... and forwards, a chunk at a time where possible
+        end, base_end = i + BLOCK, off + BLOCK
+        while (end + COMPARE_CHUNK <= n and base_end + COMPARE_CHUNK <= len(base)
+               and target[end:end + COMPARE_CHUNK] == base[base_end:base_end + COMPARE_CHUNK]):
+            end += COMPARE_CHUNK
+            base_end += COMPARE_CHUNK
+        while end < n and base_end < len(base) and target[end] == base[base_end]:
+            end += 1
+            base_end += 1
+
+        insert(literal, start)
+        out.append(OP_COPY)
+        out += _varint(base_start)
+        out += _varint(end - start)
+        i = literal = end
+
+    insert(literal, n)
+    return bytes(out)
+
+
+def apply_delta(base, delta):
+    out = bytearray()
+    pos = 0
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op == OP_COPY:
+            offset, pos = _read_varint(delta, pos)
+            length, pos = _read_varint(delta, pos)
+            out += base[offset:offset + length]
+        elif op == OP_INSERT:
+            length, pos = _read_varint(delta, pos)
+            out += delta[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"Corrupt delta op {op}")
+    return bytes(out)
+
+
+def _open_file(path):
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    return f, st.st_size, st
+
+
+def _version_number(name):
+    stem, ext = os.path.splitext(name)
+    return int(stem) if ext == '.v' and stem.isdigit() else None
+
+
+class VersionStore:
+    """
+    Version histories of a student's files.
+
+    Callers hold `locked()` for a file while adding a version and
+    replacing the file, so every delta is taken against the content that
+    actually becomes current. A version is added before the replace and
+    discard()ed if the replace fails; prune() runs once it succeeded.
+    """
+
+    def __init__(self, name_index, max_versions=20, delta_max_bytes=4 * 1024 * 1024,
+                 open_file=None):
+        self.name_index = name_index
+        self.max_versions = max_versions
+        self.delta_max_bytes = delta_max_bytes
+        # path -> (file object, size, stat result) giving the file's
+        # content as uploaded (see compressed_store.open_stored)
+        self.open_file = open_file or _open_file
+
+    def history_dir(self, student_dir, filename):
+        return os.path.join(student_dir, DIRNAME, filename)
+
+    @contextlib.contextmanager
+    def locked(self, student_dir, filename):
+        history = self.history_dir(student_dir, filename)
+        os.makedirs(history, exist_ok=True)
+        with open(os.path.join(history, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def has_history(self, student_dir, filename):
+        return os.path.isdir(self.history_dir(student_dir, filename))
+
+    def add(self, netid, student_dir, filename, new_path):
+        """
+        Save the current `filename` as a version before `new_path`
+        replaces it. Returns (version file, bytes stored).
+        """
+        current = os.path.join(student_dir, filename)
+        history = self.history_dir(student_dir, filename)
+        number = self.name_index.next_number(
+            netid, 'version', filename, lambda: max(self._numbers(history), default=0)
+        )
+
+        old_file, old_size, st = self.open_file(current)
+        path = os.path.join(history, f"{number}.v")
+        tmp = path + '.tmp'
+        try:
+            with old_file, open(tmp, 'wb') as out:
+                if old_size <= self.delta_max_bytes and os.path.getsize(new_path) <= self.delta_max_bytes:
+                    old = old_file.read()
+                    with self.open_file(new_path)[0] as f:
+                        new = f.read()
+                    delta = make_delta(new, old)
+                    full = zlib.compress(old, 9)
+                    if delta is not None:
+                        delta = zlib.compress(delta, 9)
+                    if delta is not None and len(delta) < len(full):
+                        kind, body = KIND_DELTA, delta
+                    else:
+                        kind, body = KIND_FULL, full
+                    out.write(HEADER.pack(MAGIC, kind, old_size, st.st_mtime_ns))
+                    out.write(body)
+                else:
+                    # Too big to diff in memory: compress it whole, streaming
+                    out.write(HEADER.pack(MAGIC, KIND_FULL, old_size, st.st_mtime_ns))
+                    compressor = zlib.compressobj(6)
+                    for chunk in iter(lambda: old_file.read(READ_SIZE), b''):
+                        out.write(compressor.compress(chunk))
+                    out.write(compressor.flush())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        return path, os.path.getsize(path)
+
+    def discard(self, path):
+        """Remove a version add()ed for a replace that then failed"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def prune(self, student_dir, filename):
+        """Drop the oldest versions beyond max_versions; returns bytes freed"""
+        return self._prune(self.history_dir(student_dir, filename))
+
+    def _numbers(self, history):
+        try:
+            names = os.listdir(history)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in map(_version_number, names) if n is not None)
+
+    def _prune(self, history):
+        numbers = self._numbers(history)
+        freed = 0
+        # Oldest first: the remaining chain never references a pruned file
+        for number in numbers[:max(len(numbers) - self.max_versions, 0)]:
+            path = os.path.join(history, f"{number}.v")
+            freed += os.path.getsize(path)
+            os.remove(path)
+        return freed
+
+    def _header(self, path):
+        with open(path, 'rb') as f:
+            magic, kind, size, mtime_ns = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a version file: {path}")
+        return kind, size, mtime_ns
+
+    def versions(self, student_dir, filename):
+        """[(version, size, mtime_ns, stored bytes)] newest first"""
+        history = self.history_dir(student_dir, filename)
+        result = []
+        for number in reversed(self._numbers(history)):
+            path = os.path.join(history, f"{number}.v")
+            _, size, mtime_ns = self._header(path)
+            result.append((number, size, mtime_ns, os.path.getsize(path)))
+        return result
+
+    def read(self, student_dir, filename, number):
+        """Content of version `number`, or None if it is not kept"""
+        history = self.history_dir(student_dir, filename)
+        if not os.path.isdir(history):
+            return None     # don't create a history just to lock it
+        with self.locked(student_dir, filename):
+            numbers = [n for n in self._numbers(history) if n >= number]
+            if not numbers or numbers[0] != number:
+                return None
+
+            # Walk forward to the first self-contained version (or the
+            # current file), then apply the deltas back down to `number`
+            chain = []
+            base = None
+            for n in numbers:
+                with open(os.path.join(history, f"{n}.v"), 'rb') as f:
+                    kind = HEADER.unpack(f.read(HEADER.size))[1]
+                    data = zlib.decompress(f.read())
+                if kind == KIND_FULL:
+                    base = data
+                    break
+                chain.append(data)
+            if base is None:
+                with self.open_file(os.path.join(student_dir, filename))[0] as f:
+                    base = f.read()
+
+        for delta in reversed(chain):
+            base = apply_delta(base, delta)
+        return base
+
+    def remove(self, student_dir, filename):
+        """Delete the whole history of `filename`; returns bytes freed"""
+        history = self.history_dir(student_dir, filename)
+        freed = 0
+        for root, _, files in os.walk(history):
+            for name in files:
+                freed += os.path.getsize(os.path.join(root, name))
+        shutil.rmtree(history, ignore_errors=True)
+        try:
+            # .versions itself, once no file has a history
+            os.rmdir(os.path.dirname(history))
+        except OSError:
+            pass
+        return freed
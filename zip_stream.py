@@ -0,0 +1,95 @@
+"""
+Streaming ZIP archives
+Builds a ZIP of files on disk chunk by chunk while the response is being
+sent: nothing is spooled to a temp file and memory stays at about one
+read buffer regardless of the archive size. Entries use data descriptors
+(the output is never seeked) and ZIP64 records whenever sizes or offsets
+need them.
+"""
+
+import io
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 256 * 1024
+
+COMPRESSION = {
+    'store': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+}
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable output collecting what zipfile writes"""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _date_time(mtime):
+    # ZIP timestamps are local time and start in 1980
+    return max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _open_file(path):
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    return f, st.st_size, st
+
+
+def stream_zip(files, compression='deflate', chunk_size=CHUNK_SIZE, open_file=_open_file):
+    """
+    Yield the bytes of a ZIP holding `files`, an iterable of
+    (name in archive, path on disk). Files that disappear before they are
+    reached are left out. `open_file(path)` returns (file object, size,
+    stat result) and can hand back decoded content.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=COMPRESSION[compression], allowZip64=True) as zf:
+        for arcname, path in files:
+            try:
+                f, size, st = open_file(path)
+            except FileNotFoundError:
+                continue
+            with f:
+                zinfo = zipfile.ZipInfo(arcname, date_time=_date_time(st.st_mtime))
+                zinfo.compress_type = COMPRESSION[compression]
+                zinfo.external_attr = 0o644 << 16
+                # Lets zipfile pick a ZIP64 local header for large files
+                zinfo.file_size = size
+
+                with zf.open(zinfo, 'w') as dest:
+                    while True:
+                        chunk = f.read(chunk_size)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Central directory
+    data = sink.drain()
+    if data:
+        yield data